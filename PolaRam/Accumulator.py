@@ -0,0 +1,226 @@
+#
+#   EXTERNAL LIBARIES
+#
+
+# Purpose: Math
+import numpy as np
+
+# Purpose: checkpoint files
+import pathlib
+
+# Purpose: logging
+import logging
+
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this library does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+#
+#   CLASS for collecting the results of the monte-carlo-simulation
+#
+class Accumulator:
+    """
+    This class keeps the running mean and the running variance of every element of the mueller matrices and raman tensors computed
+    by the monte-carlo-simulation of 'polaram convert'. No single iteration needs to be stored. The subprocesses fill one accumulator
+    per batch and the main process merges them. Mean and variance are updated with the numerically stable formulas of Welford and
+    Chan et al. ("Algorithms for computing the sample variance", 1979):
+        n    = n_a + n_b
+        mean = mean_a + (mean_b - mean_a) * n_b / n
+        M2   = M2_a + M2_b + (mean_b - mean_a)^2 * n_a * n_b / n
+    M2 is the sum of the squared deviations from the mean. The standard error of the mean is sqrt( M2 / (n-1) / n ).
+    Optionally the accumulator collects control variates: quantities with known expectation that are computed from the same rotations.
+    Their mean, their co-moments and their co-moments with every element of the mueller matrices and raman tensors are updated with the
+    same formulas ( C = C_a + C_b + (meanX_b - meanX_a) * (meanY_b - meanY_a) * n_a * n_b / n ). See applyControlVariates().
+    """
+
+    def __init__(self, modeCount, controlCount = 0):
+        """
+        Creates an empty accumulator.
+        Attributes:
+            modeCount    - number of raman tensors (vibrational modes) that are simulated
+            controlCount - number of control variates per mode. Default 0.
+        """
+        if type(modeCount) != int or modeCount < 0:
+            raise TypeError("The number of modes must be a positive integer!")
+        if type(controlCount) != int or controlCount < 0:
+            raise TypeError("The number of control variates must be a positive integer!")
+
+        # Number of iterations collected so far
+        self.count = 0
+        # Running means and sums of squared deviations
+        self.muellerMean = np.zeros((modeCount, 4, 4))
+        self.muellerM2   = np.zeros((modeCount, 4, 4))
+        self.ramanMean   = np.zeros((modeCount, 3, 3))
+        self.ramanM2     = np.zeros((modeCount, 3, 3))
+        # Running means of the control variates, their co-moments and their co-moments with the mueller matrices and raman tensors
+        self.controlMean      = np.zeros((modeCount, controlCount))
+        self.controlM2        = np.zeros((modeCount, controlCount, controlCount))
+        self.muellerControlM2 = np.zeros((modeCount, 4, 4, controlCount))
+        self.ramanControlM2   = np.zeros((modeCount, 3, 3, controlCount))
+
+    def add(self, mueller, raman, controls = None):
+        """
+        Adds a batch of iterations to the accumulator.
+        Attributes:
+            mueller  - stack of mueller matrices of all modes, numpy.ndarray of shape (iterations, modes, 4, 4)
+            raman    - stack of rotated raman tensors of all modes, numpy.ndarray of shape (iterations, modes, 3, 3)
+            controls - stack of control variates of all modes, numpy.ndarray of shape (iterations, modes, controlCount).
+                       Only needed if the accumulator collects control variates. Default None.
+        """
+        controlCount = self.controlMean.shape[-1]
+        if controls is None:
+            controls = np.zeros((len(mueller), len(self.muellerMean), 0))
+        if mueller.shape[1:] != self.muellerMean.shape or raman.shape[1:] != self.ramanMean.shape or controls.shape[1:] != self.controlMean.shape \
+           or len(mueller) != len(raman) or len(mueller) != len(controls):
+            raise ValueError("The shape of the batch does not match the shape of the accumulator!")
+
+        # Summarise the batch and merge the summary
+        batch = Accumulator(len(self.muellerMean), controlCount)
+        batch.count       = len(mueller)
+        batch.muellerMean = mueller.mean(axis = 0)
+        muellerDeviation  = mueller - batch.muellerMean
+        batch.muellerM2   = np.sum( muellerDeviation**2, axis = 0 )
+        batch.ramanMean   = raman.mean(axis = 0)
+        ramanDeviation    = raman - batch.ramanMean
+        batch.ramanM2     = np.sum( ramanDeviation**2, axis = 0 )
+        if controlCount > 0:
+            batch.controlMean      = controls.mean(axis = 0)
+            controlDeviation       = controls - batch.controlMean
+            batch.controlM2        = np.einsum("nmc,nmd->mcd", controlDeviation, controlDeviation)
+            batch.muellerControlM2 = np.einsum("nmij,nmc->mijc", muellerDeviation, controlDeviation)
+            batch.ramanControlM2   = np.einsum("nmij,nmc->mijc", ramanDeviation, controlDeviation)
+        self.merge(batch)
+
+    def merge(self, other):
+        """
+        Merges another accumulator into this one. Afterwards this accumulator describes the iterations of both accumulators.
+        Attributes:
+            other - Accumulator with the same number of modes
+        """
+        if not isinstance(other, Accumulator):
+            raise TypeError("Only accumulators can be merged!")
+        if other.muellerMean.shape != self.muellerMean.shape or other.controlMean.shape != self.controlMean.shape:
+            raise ValueError("Accumulators with different numbers of modes or control variates can't be merged!")
+
+        # Nothing to do for empty accumulators
+        if other.count == 0:
+            return
+        count = self.count + other.count
+
+        # Chan's formula for the combination of two sets of samples
+        weight = self.count * other.count / count
+        muellerDelta = other.muellerMean - self.muellerMean
+        ramanDelta   = other.ramanMean   - self.ramanMean
+        controlDelta = other.controlMean - self.controlMean
+
+        self.muellerM2        += other.muellerM2        + muellerDelta**2 * weight
+        self.ramanM2          += other.ramanM2          + ramanDelta**2 * weight
+        self.controlM2        += other.controlM2        + np.einsum("mc,md->mcd", controlDelta, controlDelta) * weight
+        self.muellerControlM2 += other.muellerControlM2 + np.einsum("mij,mc->mijc", muellerDelta, controlDelta) * weight
+        self.ramanControlM2   += other.ramanControlM2   + np.einsum("mij,mc->mijc", ramanDelta, controlDelta) * weight
+
+        self.muellerMean = self.muellerMean + muellerDelta * other.count / count
+        self.ramanMean   = self.ramanMean   + ramanDelta   * other.count / count
+        self.controlMean = self.controlMean + controlDelta * other.count / count
+
+        self.count = count
+
+    def muellerStandardError(self):
+        """
+        Returns the standard error of the mean of every element of the mueller matrices (numpy.ndarray of shape (modes, 4, 4)).
+        The standard error is infinite if less than two iterations were collected.
+        """
+        if self.count < 2:
+            return np.full(self.muellerMean.shape, np.inf)
+        return np.sqrt( self.muellerM2 / (self.count - 1) / self.count )
+
+    def ramanStandardError(self):
+        """
+        Returns the standard error of the mean of every element of the raman tensors (numpy.ndarray of shape (modes, 3, 3)).
+        The standard error is infinite if less than two iterations were collected.
+        """
+        if self.count < 2:
+            return np.full(self.ramanMean.shape, np.inf)
+        return np.sqrt( self.ramanM2 / (self.count - 1) / self.count )
+
+    def maxStandardError(self):
+        """
+        Returns the largest standard error of all mueller matrix and raman tensor elements.
+        """
+        return max( self.muellerStandardError().max(initial = 0), self.ramanStandardError().max(initial = 0) )
+
+    def applyControlVariates(self, expectation):
+        """
+        Returns a new accumulator whose means are corrected with the control variates (regression estimator). Only the first k control
+        variates are used, where k is the number of expectations given. Further control variates are only collected. Every element f of the mueller
+        matrices and raman tensors is corrected by its best linear prediction from the deviation of the control variates c from their known
+        expectation E[c]:
+            beta = Cov(c,c)^-1 Cov(c,f)
+            mean = mean(f) - beta * ( mean(c) - E[c] )
+        The sums of squared deviations of the new accumulator are the residual sums M2_f - Cov(f,c) Cov(c,c)^-1 Cov(c,f), so the standard
+        errors of the new accumulator are the standard errors of the corrected means. The ratio of the old and the new M2 is the variance
+        reduction factor. The new accumulator contains no control variates.
+        Attributes:
+            expectation - exact expectation of the first k control variates, numpy.ndarray of shape (modes, k)
+        Returns Accumulator
+        """
+        count = expectation.shape[-1]
+        if expectation.ndim != 2 or len(expectation) != len(self.controlMean) or count > self.controlMean.shape[-1]:
+            raise ValueError("The shape of the expectation does not match the control variates of the accumulator!")
+
+        result = Accumulator(len(self.muellerMean))
+        result.count = self.count
+        # Pseudo inverse, because the control variates may be constant (e.g. for isotropic raman tensors)
+        inverse = np.linalg.pinv(self.controlM2[:,:count,:count], hermitian = True)
+        controlDeviation = self.controlMean[:,:count] - expectation
+        for meanName, m2Name, crossName in [("muellerMean", "muellerM2", "muellerControlM2"), ("ramanMean", "ramanM2", "ramanControlM2")]:
+            cross = getattr(self, crossName)[...,:count]
+            beta = np.einsum("mcd,mijd->mijc", inverse, cross)
+            setattr(result, meanName, getattr(self, meanName) - np.einsum("mijc,mc->mij", beta, controlDeviation))
+            # Rounding errors may lead to tiny negative residuals
+            setattr(result, m2Name, np.maximum( getattr(self, m2Name) - np.einsum("mijc,mijc->mij", beta, cross), 0 ))
+
+        return result
+
+    def save(self, path, **metadata):
+        """
+        Writes the accumulator into a numpy .npz file. The file is written under a temporary name first and renamed afterwards,
+        so an existing file is never left half written if the program is killed.
+        Attributes:
+            path     - path of the file
+            metadata - additional values stored in the file, e.g. the seed of the simulation (strings, numbers or arrays of them)
+        """
+        path = pathlib.Path(path)
+        temporaryPath = path.with_name(path.name + ".tmp")
+        with temporaryPath.open("wb") as file:
+            np.savez(file, count = self.count,
+                           muellerMean = self.muellerMean, muellerM2 = self.muellerM2,
+                           ramanMean   = self.ramanMean  , ramanM2   = self.ramanM2,
+                           controlMean = self.controlMean, controlM2 = self.controlM2,
+                           muellerControlM2 = self.muellerControlM2, ramanControlM2 = self.ramanControlM2,
+                           **{ "metadata." + key: np.asarray(value) for key, value in metadata.items() })
+        temporaryPath.replace(path)
+
+    @staticmethod
+    def load(path):
+        """
+        Reads an accumulator written by Accumulator.save().
+        Attributes:
+            path - path of the file
+        Returns tuple (accumulator, metadata) with the Accumulator and a dictionary of the additional values as numpy.ndarrays
+        """
+        with np.load(path, allow_pickle = False) as data:
+            accumulator = Accumulator(len(data["muellerMean"]), data["controlMean"].shape[-1])
+            accumulator.count       = int(data["count"])
+            accumulator.muellerMean = data["muellerMean"]
+            accumulator.muellerM2   = data["muellerM2"]
+            accumulator.ramanMean   = data["ramanMean"]
+            accumulator.ramanM2     = data["ramanM2"]
+            accumulator.controlMean      = data["controlMean"]
+            accumulator.controlM2        = data["controlM2"]
+            accumulator.muellerControlM2 = data["muellerControlM2"]
+            accumulator.ramanControlM2   = data["ramanControlM2"]
+            metadata = { key[len("metadata."):]: data[key] for key in data.files if key.startswith("metadata.") }
+
+        return accumulator, metadata
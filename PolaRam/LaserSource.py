@@ -0,0 +1,192 @@
+#
+#   EXTERNAL LIBARIES
+#
+
+# Purpose: Math
+import numpy as np
+
+# Purpose: laser files
+import pathlib
+import itertools
+
+# Purpose: logging
+import logging
+
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this library does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+#
+#   INTERNAL MODULES
+#
+from SetupDecoder import SetupDecoder
+
+#
+#   MAKROS
+#
+
+# Generators of initial stokes vectors understood by LaserSource.addGrid()
+GRIDS = ["linear", "poincare"]
+
+#
+#   CLASS for the initial stokes vectors of polaram simulate
+#
+class LaserSource:
+    """
+    This class collects the initial stokes vectors of 'polaram simulate' from lists, laser files and grids and hands them out in chunks
+    of fixed size. Laser files and grids are read chunk by chunk, so the number of initial stokes vectors is not limited by the memory
+    or the length of the command line. The stokes vectors are handed out in the order the sources were added.
+    Sources:    list - stokes vectors given with -lsr. See addVectors().
+                file - text file with four stokes parameters per line or numpy .npy file of shape (lasers, 4). See addFile().
+                grid - generated stokes vectors, e.g. all linear polarisations from 0° to 180° in steps of 1°. See addGrid().
+    Example:
+        source = LaserSource()
+        source.addGrid("linear:0:180:0.5")
+        for start, lasers in source.chunks(1000):
+            states = simulation.run(lasers)
+    """
+
+    def __init__(self):
+        """
+        Creates an empty source of stokes vectors.
+        """
+        # Every part is a tuple (description, number of stokes vectors, function returning a generator of chunks for a chunk size)
+        self.parts = []
+
+    def __len__(self):
+        """
+        Returns the number of stokes vectors of all sources.
+        """
+        return sum( count for _, count, _ in self.parts )
+
+    def addVectors(self, vectors):
+        """
+        Adds a list of stokes vectors.
+        Attributes:
+            vectors - array-like of shape (4,) or (lasers, 4)
+        """
+        vectors = self.__check(np.array(vectors, dtype = float).reshape(-1, 4), "list of stokes vectors")
+        self.parts.append(( "list", len(vectors), lambda size : ( vectors[start:start+size] for start in range(0, len(vectors), size) ) ))
+
+    def addFile(self, path):
+        """
+        Adds the stokes vectors of a laser file. Numpy files (.npy) must contain an array of shape (lasers, 4) and are memory mapped.
+        Text files contain one stokes vector per line: four numbers separated by spaces or commas. Empty lines and comments ('#') are ignored.
+        Attributes:
+            path - path of the laser file
+        """
+        path = pathlib.Path(path)
+        description = "laser file '" + str(path) + "'"
+
+        if path.suffix == ".npy":
+            vectors = np.load(path, mmap_mode = "r", allow_pickle = False)
+            if vectors.ndim != 2 or vectors.shape[1] != 4:
+                raise ValueError("The " + description + " must contain an array of shape (lasers, 4)!")
+            chunks = lambda size : ( self.__check(np.array(vectors[start:start+size], dtype = float), description, start)
+                                     for start in range(0, len(vectors), size) )
+            count = len(vectors)
+
+        else:
+            # Count the stokes vectors without reading the whole file into memory
+            with path.open() as file:
+                count = sum( 1 for line in file if line.split("#")[0].strip() != "" )
+
+            def chunks(size):
+                with path.open() as file:
+                    start = 0
+                    while True:
+                        # Read the next lines and convert them at once
+                        lines = list(itertools.islice(file, size))
+                        if len(lines) == 0:
+                            return
+                        # Remove comments and empty lines
+                        lines = [ line.split("#")[0].replace(",", " ") for line in lines ]
+                        lines = [ line for line in lines if line.strip() != "" ]
+                        if len(lines) == 0:
+                            continue
+                        vectors = np.loadtxt(lines, ndmin = 2)
+                        if vectors.shape[1] != 4:
+                            raise ValueError("Every line of the " + description + " must contain four stokes parameters!")
+                        yield self.__check(vectors, description, start)
+                        start += len(vectors)
+
+        log.info("Read " + str(count) + " stokes vectors from " + description + ".")
+        self.parts.append(( description, count, chunks ))
+
+    def addGrid(self, spec):
+        """
+        Adds generated stokes vectors. The stokes vectors are computed chunk by chunk.
+        Grids:  linear:START:STOP:STEP  - fully linear polarised light with the polarisation angles START, START+STEP, ..., STOP in degrees
+                                          (same syntax as the parameter sweeps of the instruction file): [1, cos(2a), sin(2a), 0]
+                poincare:COUNT          - COUNT fully polarised stokes vectors evenly distributed on the poincaré sphere (fibonacci grid).
+                                          The grid contains circular and elliptical polarised light.
+        Attributes:
+            spec - string describing the grid
+        """
+        if type(spec) != str:
+            raise TypeError("The grid must be given as string!")
+        grid, _, arguments = spec.partition(":")
+
+        if grid == "linear":
+            sweep = SetupDecoder().sweepRange(arguments)
+            if sweep == None:
+                raise ValueError("The linear grid must have the form 'linear:START:STOP:STEP'!")
+            start, step, count = sweep
+            def vectors(indices):
+                angle = np.deg2rad(start + step * indices)
+                return np.stack([ np.ones(len(indices)), np.cos(2*angle), np.sin(2*angle), np.zeros(len(indices)) ], axis = -1)
+
+        elif grid == "poincare":
+            try:
+                count = int(arguments)
+            except ValueError:
+                raise ValueError("The poincaré grid must have the form 'poincare:COUNT'!")
+            if count < 1:
+                raise ValueError("The poincaré grid needs at least one stokes vector!")
+            def vectors(indices):
+                # Fibonacci grid: equal areas in S3, golden angle steps around the S3 axis
+                s3 = 1 - (2 * indices + 1) / count
+                azimuth = np.pi * (3 - np.sqrt(5)) * indices
+                return np.stack([ np.ones(len(indices)), np.sqrt(1 - s3**2) * np.cos(azimuth), np.sqrt(1 - s3**2) * np.sin(azimuth), s3 ], axis = -1)
+
+        else:
+            raise ValueError("Unknown grid '" + grid + "'! Choose from " + ", ".join(GRIDS) + ".")
+
+        log.info("Generate " + str(count) + " stokes vectors with the grid '" + spec + "'.")
+        self.parts.append(( "grid '" + spec + "'", count, lambda size : ( vectors(np.arange(start, min(start + size, count))) for start in range(0, count, size) ) ))
+
+    def chunks(self, size):
+        """
+        Hands out the stokes vectors of all sources in chunks. The chunks don't span two sources, so some chunks may be smaller.
+        Attributes:
+            size - largest number of stokes vectors per chunk
+        Return:
+            generator of tuples (start, vectors) with the index of the first stokes vector of the chunk and a numpy.ndarray of shape (lasers, 4)
+        """
+        if type(size) != int or size < 1:
+            raise ValueError("The chunk size must be a positive integer!")
+        start = 0
+        for _, _, chunks in self.parts:
+            for vectors in chunks(size):
+                yield start, vectors
+                start += len(vectors)
+
+    def __check(self, vectors, description, offset = 0):
+        """
+        Makes sure all stokes vectors are physical possible: the intensity S0 can't be negative and the polarisation grade can't be
+        greater than one.
+        Attributes:
+            vectors     - numpy.ndarray of shape (lasers, 4)
+            description - name of the source for the error message
+            offset      - index of the first stokes vector in the source. Default 0.
+        Return:
+            the stokes vectors
+        Raises ValueError for the first invalid stokes vector
+        """
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            invalid = (vectors[:,0] < 0) | (np.round( np.sum(vectors[:,1:]**2, axis = 1) / vectors[:,0]**2 , 6) > 1)
+        if np.any(invalid):
+            index = np.argmax(invalid)
+            raise ValueError("The stokes vector " + str(vectors[index]) + " (number " + str(offset + index + 1) + " of the " + description + ") is not physical possible!")
+        return vectors
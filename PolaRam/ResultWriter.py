@@ -0,0 +1,304 @@
+#
+#   EXTERNAL LIBARIES
+#
+
+# Purpose: Math and binary output files
+import numpy as np
+
+# Purpose: csv output files
+import csv
+
+# Purpose: output files
+import pathlib
+import os
+import zipfile
+import tempfile
+
+# Purpose: print results on screen
+import sys
+
+# Purpose: logging
+import logging
+
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this library does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+#
+#   MAKROS
+#
+
+# Output formats understood by the ResultWriter
+FORMATS = ["text", "csv", "npy", "npz"]
+
+#
+#   CLASS for writing the results of polaram simulate and polaram convert
+#
+class ResultWriter:
+    """
+    This class writes the output files of 'polaram simulate' and 'polaram convert' piece by piece instead of building the whole output
+    as one string. Every piece is written and flushed immediately, so large simulations never hold their formated output in memory.
+    Formats:    text - the commented text format of polaram. The pieces are written with text().
+                csv  - comma separated table with a header row. The header of the output file is written as comment lines starting with
+                       '#' (R: read.csv(file, comment.char = "#")). The rows are written with rows().
+                npy  - the main numpy array of the result (np.load in python, RcppCNPy::npyLoad in R). Written with array() on close().
+                npz  - all numpy arrays of the result and the header of the output file (key 'comment'). Written on close().
+    Large arrays of the binary formats are created on the disk with allocate() and filled piece by piece with fill(), so the result
+    doesn't need to fit into the memory. The binary formats can't be appended to existing files. Use the writer as context manager:
+        with ResultWriter(path, "csv") as writer:
+            writer.comment("# polaram simulate ...")
+            writer.rows(["Head", "Value"], [["v_1", 1.0]])
+    """
+
+    def __init__(self, path, format = "text", writeMode = "w", echo = False):
+        """
+        Opens the output file.
+        Attributes:
+            path      - path of the output file
+            format    - output format: text, csv, npy or npz. Default text.
+            writeMode - 'w' to overwrite the file or 'a' to append the results to the file (only text and csv). Default 'w'.
+            echo      - print the text pieces and the header on the screen. Default False.
+        """
+        if format not in FORMATS:
+            raise ValueError("Unknown output format '" + str(format) + "'! Choose from " + ", ".join(FORMATS) + ".")
+        if writeMode not in ["w", "a"]:
+            raise ValueError("The write mode must be 'w' or 'a'!")
+        if writeMode == "a" and format in ["npy", "npz"]:
+            raise ValueError("Binary output files (" + format + ") can't be appended!")
+
+        self.path   = pathlib.Path(path)
+        self.format = format
+        self.echo   = echo
+        # Header lines and arrays of the binary formats are collected and written on close()
+        self.comments = []
+        self.arrays   = {}
+        # Arrays created by allocate(): name -> path of the file on the disk
+        self.allocated = {}
+        # The header row of the csv format is only written once
+        self.columns  = None
+
+        log.info("Write " + format + " output to '" + str(self.path.resolve()) + "'.")
+        if format in ["text", "csv"]:
+            self.file = self.path.open(writeMode, newline = "" if format == "csv" else None)
+            self.csv  = csv.writer(self.file) if format == "csv" else None
+        else:
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        # Incomplete binary files are not written, if an exception occured
+        self.close(writeArrays = type == None)
+
+    def __echo(self, text):
+        """
+        Prints text on the screen, if the writer echos its output.
+        """
+        if self.echo == True:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def comment(self, text):
+        """
+        Writes the header of the output file: command line, execution time, user comments, ... The text must be formated as comment
+        lines starting with '#'. The text format writes it like text(). The csv format writes it before the table. The npz format stores
+        it as string 'comment'. The npy format can't store it.
+        Attributes:
+            text - string
+        """
+        if self.format == "text":
+            self.text(text)
+        elif self.format == "csv":
+            self.file.write(text if text.endswith("\n") else text + "\n")
+            self.file.flush()
+            self.__echo(text if text.endswith("\n") else text + "\n")
+        else:
+            self.comments.append(text)
+            self.__echo(text + "\n")
+
+    def text(self, text):
+        """
+        Writes a piece of the text format and flushes the file. Ignored by the other formats.
+        Attributes:
+            text - string
+        """
+        if self.format == "text":
+            self.file.write(text)
+            self.file.flush()
+            self.__echo(text)
+
+    def rows(self, columns, rows):
+        """
+        Writes rows of the csv format and flushes the file. The header row is written with the first rows. Ignored by the other formats.
+        Attributes:
+            columns - list of the names of the columns
+            rows    - iterable of rows. Every row is a list of strings and numbers with one entry per column.
+        """
+        if self.format == "csv":
+            if self.columns == None:
+                self.columns = list(columns)
+                self.csv.writerow(self.columns)
+            elif list(columns) != self.columns:
+                raise ValueError("The columns of the rows don't match the header of the csv file!")
+            # Numbers are written with all digits
+            self.csv.writerows( [ repr(float(value)) if isinstance(value, (float, np.floating)) else value for value in row ] for row in rows )
+            self.file.flush()
+
+    def array(self, name, array, main = False):
+        """
+        Stores a numpy array of the result. The npz format writes all arrays, the npy format only the main array. Ignored by the text
+        and csv format.
+        Attributes:
+            name  - name of the array in the npz file
+            array - array-like (numbers or strings)
+            main  - True, if this is the array written by the npy format. Default False.
+        """
+        if self.format == "npz" or (self.format == "npy" and main == True):
+            self.arrays[name] = np.asarray(array)
+
+    def allocate(self, name, shape, main = False):
+        """
+        Creates an array of floats of the result on the disk, which is filled piece by piece with fill(). The npy format creates the output
+        file itself, the npz format a temporary file next to the output file, which is packed into the npz file on close(). The text and csv
+        format don't store arrays.
+        Attributes:
+            name  - name of the array in the npz file
+            shape - shape of the array
+            main  - True, if this is the array written by the npy format. Default False.
+        Return:
+            True, if the format stores the array
+        """
+        if self.format == "npz" or (self.format == "npy" and main == True):
+            if self.format == "npy":
+                path = self.path
+            else:
+                file, path = tempfile.mkstemp(suffix = ".npy", prefix = "." + self.path.name + ".", dir = self.path.resolve().parent)
+                # The file is opened again by numpy
+                os.close(file)
+                path = pathlib.Path(path)
+            self.allocated[name] = path
+            # Write the header and reserve the space of the array without holding it in memory
+            array = np.lib.format.open_memmap(path, mode = "w+", dtype = float, shape = tuple(shape))
+            del array
+            self.arrays[name] = path
+            return True
+        return False
+
+    def fill(self, name, index, values):
+        """
+        Writes a piece of an array created by allocate(). The file is only mapped into memory while writing the piece, so the written
+        pieces don't stay in the memory of the program. Ignored, if the format doesn't store the array.
+        Attributes:
+            name   - name of the array
+            index  - numpy index of the piece, e.g. numpy.s_[start:stop]
+            values - array-like
+        """
+        if name in self.allocated:
+            array = np.lib.format.open_memmap(self.allocated[name], mode = "r+")
+            array[index] = values
+            array.flush()
+            del array
+
+    def close(self, writeArrays = True):
+        """
+        Closes the output file. The binary formats are written now.
+        Attributes:
+            writeArrays - write the binary formats. Default True.
+        """
+        if self.file != None:
+            if self.echo == True:
+                sys.stdout.write("\n")
+            self.file.close()
+            self.file = None
+
+        try:
+            if self.format in ["npy", "npz"] and writeArrays == True and self.arrays != None:
+                if self.format == "npy" and len(self.arrays) != 1:
+                    raise ValueError("The npy format needs exactly one main array!")
+                if self.format == "npy" and len(self.allocated) == 1:
+                    # The output file was written by fill()
+                    self.allocated = {}
+                elif self.format == "npy":
+                    with self.path.open("wb") as file:
+                        np.save(file, next(iter(self.arrays.values())), allow_pickle = False)
+                else:
+                    self.__writeNpz()
+        finally:
+            # The binary formats are only written once. The files of allocate() are removed.
+            self.arrays = None
+            for path in self.allocated.values():
+                path.unlink(missing_ok = True)
+            self.allocated = {}
+
+    def __writeNpz(self):
+        """
+        Writes the npz format without loading the arrays of allocate() into memory. The layout is the one of numpy.savez: an uncompressed
+        zip archive with one npy file per array.
+        """
+        arrays = { "comment": np.array("\n".join(self.comments)), **self.arrays }
+        with zipfile.ZipFile(self.path, mode = "w", compression = zipfile.ZIP_STORED, allowZip64 = True) as archive:
+            for name, array in arrays.items():
+                if name in self.allocated:
+                    archive.write(self.allocated[name], arcname = name + ".npy")
+                else:
+                    with archive.open(name + ".npy", mode = "w", force_zip64 = True) as file:
+                        np.lib.format.write_array(file, np.asarray(array), allow_pickle = False)
+
+#
+#   CLASS for writing the states of every step of polaram simulate
+#
+class StateTrace:
+    """
+    This class records the states of the simulation after every step (see Simulation.run) as numbers instead of formated text in the
+    log file. The trace is an uncompressed npz file, which is written array by array, so only the current states are held in memory.
+    Arrays:     steps                  - the instructions of every compiled step of the simulation (step 0 are the initial states)
+                step<N>.lasers<START>  - states after step N of the initial stokes vectors START, START+1, ... of shape (points, lasers, modes, 4)
+    Example:
+        with StateTrace(path, simulation.program) as trace:
+            simulation.run(lasers, trace = trace.record)
+        with numpy.load(path) as trace:
+            states = trace["step1.lasers0"]
+    """
+
+    def __init__(self, path, program):
+        """
+        Opens the trace file.
+        Attributes:
+            path    - path of the trace file
+            program - compiled program of the simulation (see SetupDecoder.compile)
+        """
+        self.path = pathlib.Path(path)
+        log.info("Write trace of the simulation to '" + str(self.path.resolve()) + "'.")
+        self.archive = zipfile.ZipFile(self.path, mode = "w", compression = zipfile.ZIP_STORED, allowZip64 = True)
+        self.__write("steps", np.array(["initial states"] + [ ", ".join(step["instructions"]) for step in program ]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __write(self, name, array):
+        """
+        Writes one array into the trace file.
+        """
+        with self.archive.open(name + ".npy", mode = "w", force_zip64 = True) as file:
+            np.lib.format.write_array(file, np.asarray(array), allow_pickle = False)
+
+    def record(self, step, states, start = 0):
+        """
+        Writes the states of the simulation after a step.
+        Attributes:
+            step   - number of the step (0 for the initial states)
+            states - numpy.ndarray of shape (points, lasers, modes, 4)
+            start  - index of the first initial stokes vector of the states, if the simulation is run in chunks. Default 0.
+        """
+        self.__write("step" + str(step) + ".lasers" + str(start), states)
+
+    def close(self):
+        """
+        Closes the trace file.
+        """
+        self.archive.close()
@@ -26,9 +26,38 @@ class SetupDecoder:
     def __init__(self):
         pass
 
+    #
+    #   Conversion of the arguments
+    #
+    def __toArray(self, value, name, allowStrings = True):
+        """
+        Converts the argument of an optical element into a float or an array of floats. Every optical element accepts numbers and
+        numpy arrays of numbers. The elements accept strings as well, because the decode function passes the arguments as strings.
+        No user command
+        Attributes:
+            value        - number, string or numpy.ndarray of numbers
+            name         - name of the optical element for the error messages
+            allowStrings - convert strings to floats. If False strings cause a TypeError. Default True.
+        Return:
+            numpy.ndarray of floats (0-dimensional for single numbers)
+        """
+        if type(value) == bool or (isinstance(value, np.ndarray) and value.dtype == bool):
+            raise TypeError("Arguments for the " + name + " can't be bool!")
+        if isinstance(value, np.ndarray):
+            if not np.issubdtype(value.dtype, np.integer) and not np.issubdtype(value.dtype, np.floating):
+                raise TypeError("Arguments for the " + name + " must be real numbers!")
+            return value.astype(float)
+        if type(value) == str and allowStrings == False:
+            raise TypeError("Arguments for the " + name + " can't be strings!")
+        # Raises TypeError for lists and complex numbers and ValueError for strings that are no numbers
+        return np.asarray(float(value))
+
     #
     #   Mueller Matrices for optical elements
     #
+    #   All optical elements accept single numbers and numpy arrays as arguments. Arrays are broadcast against each other and
+    #   the element returns a stack of mueller matrices of shape (..., 4, 4) with one matrix per element of the arrays.
+    #
     def generalLinearRetarder(self, theta, delta):
         """
         Mueller Matrix for linear retarders in its general form. Used for calculation of wave plates. The arguments will be converted to floats and radians.
@@ -39,21 +68,26 @@ class SetupDecoder:
         Return:
             special form of a mueller matrix
         """
-        if type(theta) == bool or type(delta) == bool:
-            raise TypeError("Arguments for the general linear retarder can't be bool!")
         # Convert input
-        theta = math.radians(float(theta))
-        delta = math.radians(float(delta))
+        theta = np.radians(self.__toArray(theta, "general linear retarder"))
+        delta = np.radians(self.__toArray(delta, "general linear retarder"))
 
         # Calculate
         cosTwoTheta = np.cos(2*theta)
         sinTwoTheta = np.sin(2*theta)
         cosDelta = np.cos(delta)
         sinDelta = np.sin(delta)
-        muellerMatrix = np.array([  [1, 0, 0, 0],
-                                    [0, cosTwoTheta**2 + sinTwoTheta**2 * cosDelta  , cosTwoTheta*sinTwoTheta*(1-cosDelta)      , sinTwoTheta*sinDelta],
-                                    [0, cosTwoTheta*sinTwoTheta*(1-cosDelta)        , cosTwoTheta**2 * cosDelta + sinTwoTheta**2, -cosTwoTheta*sinDelta],
-                                    [0, -sinTwoTheta*sinDelta                       , cosTwoTheta*sinDelta                      , cosDelta]  ])
+        muellerMatrix = np.zeros(np.broadcast(theta, delta).shape + (4,4))
+        muellerMatrix[...,0,0] = 1
+        muellerMatrix[...,1,1] = cosTwoTheta**2 + sinTwoTheta**2 * cosDelta
+        muellerMatrix[...,1,2] = cosTwoTheta*sinTwoTheta*(1-cosDelta)
+        muellerMatrix[...,1,3] = sinTwoTheta*sinDelta
+        muellerMatrix[...,2,1] = cosTwoTheta*sinTwoTheta*(1-cosDelta)
+        muellerMatrix[...,2,2] = cosTwoTheta**2 * cosDelta + sinTwoTheta**2
+        muellerMatrix[...,2,3] = -cosTwoTheta*sinDelta
+        muellerMatrix[...,3,1] = -sinTwoTheta*sinDelta
+        muellerMatrix[...,3,2] = cosTwoTheta*sinDelta
+        muellerMatrix[...,3,3] = cosDelta
         return muellerMatrix
 
     def linearHorizontalPolariser(self, angle = 0):
@@ -66,11 +100,8 @@ class SetupDecoder:
             mueller matrix
         """
 
-        if type(angle) == bool:
-            raise TypeError("Arguments for the linear horizontal retarder can't be bool!")
-
         # Convert the angle to float
-        angle = float(angle)
+        angle = self.__toArray(angle, "linear horizontal polariser")
 
         # Declare the matrix for a horizontal linear polariser
         matrix = 0.5 * np.array([ [1, 1, 0, 0],
@@ -79,7 +110,7 @@ class SetupDecoder:
                                   [0, 0, 0, 0] ])
 
         # Rotate thepolariser if needed
-        if angle != 0:
+        if angle.ndim > 0 or angle != 0:
             matrix = self.rotateMatrix(angle, matrix)
 
         return  matrix
@@ -94,11 +125,8 @@ class SetupDecoder:
             mueller matrix
         """
 
-        if type(angle) == bool:
-            raise TypeError("Arguments for the linear vertical retarder can't be bool!")
-
         # Convert the angle to float
-        angle = float(angle)
+        angle = self.__toArray(angle, "linear vertical polariser")
 
         # Declare the matrix for a horizontal linear polariser
         matrix = 0.5 * np.array([ [ 1, -1, 0, 0],
@@ -107,7 +135,7 @@ class SetupDecoder:
                                   [ 0,  0, 0, 0] ])
 
         # Rotate thepolariser if needed
-        if angle != 0:
+        if angle.ndim > 0 or angle != 0:
             matrix = self.rotateMatrix(angle, matrix)
 
         return  matrix
@@ -129,18 +157,17 @@ class SetupDecoder:
             mueller matrix of the filter
         """
 
-        if type(transmission) == bool:
-            raise TypeError("Arguments for the attenuating filter can't be bool!")
-
         # Convert input to float
-        transmission = float(transmission)
+        transmission = self.__toArray(transmission, "attenuating filter")
 
         # Check if input valid
-        if transmission > 1 or transmission < 0:
+        if np.any(transmission > 1) or np.any(transmission < 0):
             raise ValueError("FATAL ERROR: Transmission must be a value between 0 and 1.")
 
         # Return filter matrix
-        return transmission * self.unitMatrix()
+        if transmission.ndim == 0:
+            return float(transmission) * self.unitMatrix()
+        return transmission[...,np.newaxis,np.newaxis] * self.unitMatrix()
 
     def halfWavePlate(self, theta):
         """
@@ -192,17 +219,19 @@ class SetupDecoder:
         """
         try:
             # Convert attribute to float
-            polarisedPart = float(polarisedPart)
+            polarisedPart = self.__toArray(polarisedPart, "depolariser")
         except:
             # Hanlde wrong input argument
             # Raise Value Error to make sure that the decode function prints the right error message
             raise ValueError("Argument can't be converted to float. Wrong argument was passed to depolariser().")
 
-        if polarisedPart < 0 or polarisedPart > 1:
+        if np.any(polarisedPart < 0) or np.any(polarisedPart > 1):
             raise ValueError("Argument for depolariser function may not be smaller than zero or greater than one!")
 
         # Return mueller matrix
-        matrix = np.diag([1, polarisedPart, polarisedPart, polarisedPart])
+        matrix = np.zeros(polarisedPart.shape + (4,4))
+        matrix[...,0,0] = 1
+        matrix[...,1,1] = matrix[...,2,2] = matrix[...,3,3] = polarisedPart
         return matrix
 
     def opticalMultiModeFiber(self):
@@ -221,9 +250,10 @@ class SetupDecoder:
                           [-0.04387837, -0.004022648,  0.60062411,    0],
                           [ 0         ,  0          ,  0         ,    0] ])
 
-    def rotateMatrix(self, angle: float, matrix: np.ndarray):
+    def rotateMatrix(self, angle, matrix: np.ndarray):
         """
         Returns the rotated matrix of any given mueller matrix. The rotation works like the rotation of hypersphears in 4d space and quaternions.
+        The angle may be a numpy array and the matrix a stack of matrices. They are broadcast against each other.
         No user command
         Attributes:
             angle - the magnitute of the angle of rotation in degrees
@@ -232,23 +262,25 @@ class SetupDecoder:
             rotated matrix
         """
 
-        if type(angle) == bool:
-            raise TypeError("Arguments for the matrix rotation can't be bool!")
+        # Convert angle to radians
+        angle = np.radians(self.__toArray(angle, "matrix rotation", allowStrings = False))
 
         if type(matrix) != np.ndarray:
             raise TypeError("Matrices for the matrix rotation needs to be type numpy.ndarray!")
-
-        # Convert angle to radians
-        angle = math.radians(angle)
+        if matrix.shape[-2:] != (4,4):
+            raise ValueError("Matrices for the matrix rotation need to be 4x4 matrices!")
 
         # Declare rotation matrix
-        rotationMatrix = lambda angle : np.array([  [1, 0               , 0              , 0],
-                                                    [0, np.cos(2*angle) ,-np.sin(2*angle), 0],
-                                                    [0, np.sin(2*angle) , np.cos(2*angle), 0],
-                                                    [0, 0               , 0              , 1]   ])
+        cosTwoAngle = np.cos(2*angle)
+        sinTwoAngle = np.sin(2*angle)
+        rotationMatrix = np.zeros(angle.shape + (4,4))
+        rotationMatrix[...,0,0] = rotationMatrix[...,3,3] = 1
+        rotationMatrix[...,1,1] = rotationMatrix[...,2,2] = cosTwoAngle
+        rotationMatrix[...,1,2] = -sinTwoAngle
+        rotationMatrix[...,2,1] =  sinTwoAngle
 
-        # Compute the rotation
-        rotatedMatrix = rotationMatrix(angle) @ matrix @ rotationMatrix(-angle)
+        # Compute the rotation. The rotation by -angle is the transposed rotation.
+        rotatedMatrix = rotationMatrix @ matrix @ np.swapaxes(rotationMatrix, -1, -2)
 
         return rotatedMatrix
 
@@ -269,9 +301,53 @@ class SetupDecoder:
         "OF3": [opticalMultiModeFiber       , "real optical multi-mode fiber F3 (computed from experimental data)"]
     }
 
+    def sweepRange(self, argument: str):
+        """
+        Decodes the range syntax of parameter sweeps without creating the values (see sweepValues). The value with the index i is
+        start + i * step.
+        Attributes:
+            argument - String of the form 'start:stop:step' or 'start:stop'
+        Return:
+            tuple (start, step, count) or None, if the argument is no sweep
+        """
+        if type(argument) != str:
+            raise TypeError("SetupDecoder can only decode strings!")
+        if not ":" in argument:
+            return None
+
+        limits = argument.split(":")
+        if len(limits) not in [2, 3]:
+            raise ValueError("Parameter sweeps must have the form 'start:stop:step'!")
+        start, stop, step = [ float(limit) for limit in limits ] + ([] if len(limits) == 3 else [1.])
+
+        if step == 0 or (stop - start) / step < 0:
+            raise ValueError("The step of the parameter sweep '" + argument + "' can't reach the end of the sweep!")
+
+        # Tolerance for floating point errors, e.g. 0:1:0.1 must contain 1
+        count = math.floor( (stop - start) / step + 1e-9 ) + 1
+        return start, step, count
+
+    def sweepValues(self, argument: str):
+        """
+        Decodes the range syntax of parameter sweeps. An argument of the form 'start:stop:step' or 'start:stop' (step 1) stands for all
+        values from start to stop (including stop, if it lies on the grid) in steps of step.
+        Attributes:
+            argument - String with one argument of a user command
+        Return:
+            numpy.ndarray with the values of the sweep or None, if the argument is no sweep
+        """
+        sweep = self.sweepRange(argument)
+        if sweep == None:
+            return None
+        start, step, count = sweep
+        return start + step * np.arange(count)
+
     def decode(self, commandString: str):
         """
         Decodes user commands. Takes in one line of the input file as a string and calls appropriate function with the help of commandDictionary.
+        Numeric arguments can be replaced by parameter sweeps of the form 'start:stop:step' (see sweepValues), e.g. 'HWP 0:180:0.5' or
+        'GLR 0:90:1 45'. The function is called for every combination of the swept values and the results are stacked with one axis per
+        swept argument, e.g. 'GLR 0:90:1 0:90:45' returns a numpy.ndarray of shape (91, 3, 4, 4).
         Attributes:
             commandString - String with the command for a specific function and its arguments
         Return:
@@ -289,8 +365,15 @@ class SetupDecoder:
         args = commandString.split()[1:]
         # Call function
         try:
-            # Execute instruction
-            result = self.commandDictionary[command][0](self, *args)
+            sweeps = [ self.sweepValues(arg) for arg in args ]
+            if any( values is not None for values in sweeps ):
+                # Execute the instruction once for all combinations of the swept values
+                # Every swept argument is replaced by its values on the grid of all swept arguments
+                grids = iter( np.meshgrid(*[ values for values in sweeps if values is not None ], indexing = "ij") )
+                result = self.commandDictionary[command][0](self, *[ arg if values is None else next(grids) for arg, values in zip(args, sweeps) ])
+            else:
+                # Execute instruction
+                result = self.commandDictionary[command][0](self, *args)
 
         except TypeError as e:
             # Handle wrong argument list
@@ -312,3 +395,83 @@ class SetupDecoder:
 
         # Return result of function call
         return result
+
+    def compile(self, instructions):
+        """
+        Decodes a whole program of instructions once and folds every run of consecutive optical elements into a single mueller matrix.
+        The result of a run of matrices M_1, M_2, ..., M_n is M_n @ ... @ M_2 @ M_1. The SMP instructions separate the runs, so
+        the compiled program of a typical setup is 'pre-matrix -> SMP -> post-matrix'. All instructions are decoded before the
+        simulation starts, so invalid instructions are detected up front. The compiled program does not depend on the raman
+        mueller matrices of the sample and can be reused for any matrix file.
+        Every swept argument (see decode) adds one axis to the grid of the parameter sweep. The program is evaluated for every point
+        of the Cartesian product of all sweeps. The points of the grid are numbered in C-order: the last sweep changes fastest.
+        Mueller matrices that depend on a sweep are returned as stack of shape (points, 4, 4), all other matrices have shape (4, 4).
+        Attributes:
+            instructions - list of strings with one instruction each (without comments and empty lines)
+        Return:
+            tuple (program, parameters)
+            program    - list of dictionaries with the list of folded instructions ("instructions") and the mueller matrix of the run or
+                         the string 'SMP' ("matrix")
+            parameters - list of dictionaries with the name of every swept argument ("name", format Sweep.INSTRUCTIONNUMBER.COMMAND.ARGUMENTNUMBER)
+                         and its value for every point of the grid ("values", numpy.ndarray of shape (points,))
+        """
+
+        if type(instructions) != list or any( type(instruction) != str for instruction in instructions ):
+            raise TypeError("SetupDecoder can only compile lists of strings!")
+
+        # Decode all instructions and find the swept arguments
+        decodedInstructions = []
+        parameters = []
+        for number, instruction in enumerate(instructions, 1):
+            decodedInstruction = self.decode(instruction)
+
+            if isinstance(decodedInstruction, np.ndarray) and decodedInstruction.shape[-2:] == (4,4):
+                # Keep the position of the axes of the sweep of this instruction in the grid
+                axis = len(parameters)
+                for argumentNumber, argument in enumerate(instruction.split()[1:], 1):
+                    values = self.sweepValues(argument)
+                    if values is not None:
+                        parameters.append({ "name": "Sweep." + str(number) + "." + instruction.split()[0] + "." + str(argumentNumber), "values": values })
+                decodedInstructions.append( (instruction, decodedInstruction, axis) )
+
+            elif isinstance(decodedInstruction, str) and decodedInstruction == "SMP":
+                decodedInstructions.append( (instruction, decodedInstruction, None) )
+
+            else:
+                # Handle unexpected instructions
+                log.critical("FATAL ERROR: Unable to compile '" + instruction + "'. The instruction is no mueller matrix! Exiting execution.")
+                raise ValueError("SetupDecoder can't compile '" + instruction + "'. The instruction is no mueller matrix!")
+
+        # Shape of the grid of the parameter sweep
+        gridShape = tuple( len(parameter["values"]) for parameter in parameters )
+
+        program = []
+        for instruction, decodedInstruction, axis in decodedInstructions:
+            if axis is None:
+                # Raman scattering of the sample can't be folded
+                program.append({ "instructions": [instruction], "matrix": "SMP" })
+                continue
+
+            # Put the axes of the sweep of this instruction at their position in the grid, so the matrices broadcast over the whole grid
+            sweepShape = decodedInstruction.shape[:-2]
+            decodedInstruction = np.asarray(decodedInstruction, dtype = float).reshape( (1,)*axis + sweepShape + (1,)*(len(gridShape) - axis - len(sweepShape)) + (4,4) )
+
+            if len(program) > 0 and isinstance(program[-1]["matrix"], np.ndarray):
+                # Fold the optical element into the run of optical elements before it
+                program[-1]["instructions"].append(instruction)
+                program[-1]["matrix"] = decodedInstruction @ program[-1]["matrix"]
+            else:
+                # Start a new run of optical elements
+                program.append({ "instructions": [instruction], "matrix": decodedInstruction })
+
+        # Flatten the grid of the parameter sweep
+        for step in program:
+            if isinstance(step["matrix"], np.ndarray):
+                if step["matrix"].size == 16:
+                    step["matrix"] = step["matrix"].reshape(4,4)
+                else:
+                    step["matrix"] = np.broadcast_to(step["matrix"], gridShape + (4,4)).reshape(-1,4,4)
+        for index, parameter in enumerate(parameters):
+            parameter["values"] = np.broadcast_to( parameter["values"].reshape( (1,)*index + (-1,) + (1,)*(len(gridShape) - index - 1) ), gridShape ).reshape(-1)
+
+        return program, parameters
@@ -0,0 +1,278 @@
+#
+#   EXTERNAL LIBARIES
+#
+
+# Purpose: Math
+import numpy as np
+
+# Purpose: instruction files
+import pathlib
+
+# Purpose: progress bar
+from tqdm import tqdm
+
+# Purpose: logging
+import logging
+
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this library does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+#
+#   INTERNAL MODULES
+#
+from SetupDecoder import SetupDecoder
+
+#
+#   MAKROS
+#
+
+# The states of the simulation are written into the log file after every step only if there are not more states than this limit.
+# Writing hundreds of thousands of lines per step would take much longer than the simulation itself.
+LOG_STATE_LIMIT = 1000
+
+# When the states of the simulation are checked (see Simulation.run):
+#   every-step - the states in front of every SMP instruction and the states after every compiled step
+#   final      - the states in front of every SMP instruction and the final states
+#   smp-only   - only the states in front of every SMP instruction
+#   off        - no checks. Invalid initial states or mueller matrices give meaningless results without warning.
+CHECKS = ["every-step", "final", "smp-only", "off"]
+
+# Default tolerance of the checks for floating point errors. Same as rounding the polarisation grade and S3 to 7 digits.
+TOLERANCE = 5e-8
+
+#
+#   CLASS for simulating the influence of an optical setup and a raman active sample on the polarisation of light
+#
+class Simulation:
+    """
+    This class runs the mueller simulation of 'polaram simulate' without the command line interface. The instructions describing the
+    optical setup are compiled once when the simulation is created (see SetupDecoder.compile). The simulation can be run for any number
+    of initial stokes vectors. The states of all points of the parameter sweep, all initial stokes vectors and all vibrational modes are
+    kept in one array of shape (points, lasers, modes, 4), so every step of the compiled program is a single matrix multiplication.
+    Example:
+        simulation = Simulation("HWP 0:180:1\nSMP\nLVP", muellerMatrices)
+        states = simulation.run([[1, 1, 0, 0], [1, -1, 0, 0]])
+    """
+
+    def __init__(self, setup, matrices, heads = None, allowUnpolarised = False, check = "every-step", tolerance = TOLERANCE):
+        """
+        Compiles the instructions and stores the raman mueller matrices of the sample.
+        Attributes:
+            setup            - instructions describing the optical setup: the text of an instruction file (string), the path of an
+                               instruction file (pathlib.Path) or a list of instructions. Comments start with '#'.
+            matrices         - raman mueller matrices of the sample, numpy.ndarray of shape (modes, 4, 4), e.g. the result of api.convertTensors()
+            heads            - list of the names of the modes. Default 'mode 1', 'mode 2', ...
+            allowUnpolarised - if True unpolarised light won't cause an exception when simulating the raman scattering. See the README for details. Default False.
+            check            - when the states are checked: every-step, final, smp-only or off (see CHECKS). Default every-step.
+            tolerance        - largest deviation of the polarisation grade, S3 and S0 from the allowed values, that is accepted as floating point error. Default 5e-8.
+        """
+        if isinstance(setup, pathlib.Path):
+            setup = setup.read_text()
+        if isinstance(setup, str):
+            setup = setup.splitlines()
+        if type(setup) != list:
+            raise TypeError("The setup must be a string, a pathlib.Path or a list of instructions!")
+
+        # Remove coments from the instruction list (comments start with '#')
+        instructions = [ instruction.split("#")[0].strip() for instruction in setup ]
+        # Remove empty lines from the instruction list
+        self.instructions = [ instruction for instruction in instructions if instruction != "" ]
+
+        # Compile the instructions into a list of mueller matrices and SMP instructions
+        # Every run of optical elements is folded into a single mueller matrix
+        log.info("Compile instructions.")
+        self.program, self.parameters = SetupDecoder().compile(self.instructions)
+        log.info("Compiled " + str(len(self.instructions)) + " instructions into " + str(len(self.program)) + " steps.")
+        for parameter in self.parameters:
+            log.info("Parameter Sweep " + parameter["name"] + ": " + str(len(np.unique(parameter["values"]))) + " values")
+
+        # Memory mapped matrix stores are not copied
+        self.matrices = np.asarray(matrices, dtype = float)
+        if self.matrices.ndim != 3 or self.matrices.shape[1:] != (4,4):
+            raise ValueError("The raman mueller matrices must be a numpy.ndarray of shape (modes, 4, 4)!")
+        self.heads = list(heads) if heads is not None else [ "mode " + str(index) for index in range(1, len(self.matrices) + 1) ]
+        if len(self.heads) != len(self.matrices):
+            raise ValueError("The number of headers does not match the number of raman mueller matrices!")
+        self.allowUnpolarised = allowUnpolarised
+
+        if check not in CHECKS:
+            raise ValueError("Unknown check '" + str(check) + "'! Choose from " + ", ".join(CHECKS) + ".")
+        if not tolerance >= 0:
+            raise ValueError("The tolerance of the checks can't be negative!")
+        self.check     = check
+        self.tolerance = tolerance
+
+    def pointCount(self):
+        """
+        Returns the number of points of the parameter sweep (1 without parameter sweep).
+        """
+        return len(self.parameters[0]["values"]) if len(self.parameters) > 0 else 1
+
+    def run(self, lasers, progressBar = False, trace = None):
+        """
+        Runs the simulation for all initial stokes vectors at once.
+        Attributes:
+            lasers      - initial stokes vectors, array-like of shape (4,) or (lasers, 4)
+            progressBar - show a progress bar. Default False.
+            trace       - function called with the number of the step and the states of shape (points, lasers, modes, 4) before the
+                          first step (step 0) and after every step, e.g. StateTrace.record. The states are not written into the log
+                          file, if a trace is given. Default None.
+        Return:
+            final states of the simulation, numpy.ndarray of shape (lasers, modes, 4) or (points, lasers, modes, 4), if the setup
+            contains parameter sweeps. The values of the swept arguments for every point are stored in the attribute parameters.
+        Raises ValueError, if a state of the simulation is not physical possible or the raman scattering can't be simulated. Which states
+        are checked depends on the attribute check.
+        """
+        lasers = np.array(lasers, dtype = float).reshape(-1, 4)
+
+        # INITIALISE SIMULATION
+        log.info("Initialise Simulation for " + str(self.pointCount()) + " sweep points, " + str(len(lasers)) + " initial states and " + str(len(self.heads)) + " modes.")
+        # Declare one stokes vector for every point of the sweep, every initial stokes vector and every raman mueller matrix
+        currentState = np.array(np.broadcast_to(lasers[np.newaxis,:,np.newaxis,:], (self.pointCount(), len(lasers), len(self.heads), 4)))
+        if trace is not None:
+            trace(0, currentState)
+
+        # RUN SIMULATION
+
+        # Calculate the simulation
+        # Start enumeration at index (= step) 1 not zero
+        for step, compiledInstruction in enumerate(tqdm(self.program) if progressBar else self.program, 1):
+
+            # Log info about progress
+            log.info("Simulation Step: " + str(step) + "    Instructions: " + ", ".join(compiledInstruction["instructions"]))
+
+            if isinstance(compiledInstruction["matrix"], np.ndarray):
+                # Mueller matrix of optical elements detected
+                # Alter all stokes vectors with the mueller matrix: state @ matrix.T = matrix @ state
+                if compiledInstruction["matrix"].ndim == 2:
+                    currentState = currentState @ compiledInstruction["matrix"].T
+                else:
+                    # Every point of the parameter sweep has its own mueller matrix
+                    currentState = np.einsum("sij,spmj->spmi", compiledInstruction["matrix"], currentState)
+
+            else:
+                # SMP command detected
+                # Use the raman mueller matrices of the sample
+                # Make sure the conversion formula for the raman tensor into the mueller matrix does apply
+                if self.check != "off":
+                    self.__checkSampleStates(currentState, lasers)
+
+                log.info("Apply raman mueller matrices to state vectors.")
+                # Apply the mueller matrix of every mode to the states of the mode
+                currentState = np.einsum("mij,spmj->spmi", self.matrices, currentState)
+
+            # Log current state of simulation
+            # The states are only formated, if the log file records them. A trace records the states as numbers instead.
+            if trace is not None:
+                trace(step, currentState)
+            elif currentState.size / 4 <= LOG_STATE_LIMIT and log.isEnabledFor(logging.INFO):
+                log.info("State of Simulation")
+                for point, pointStates in enumerate(currentState):
+                    for laser, states in zip(lasers, pointStates):
+                        sweep = "".join( " " + parameter["name"] + " = " + str(parameter["values"][point]) for parameter in self.parameters )
+                        log.info("Initial State " + str(laser) + sweep + "\n" + "\n".join(self.formatStates(states)))
+            else:
+                log.info("State of Simulation not logged. More than " + str(LOG_STATE_LIMIT) + " states.")
+
+            # Make sure the computed stokes vectors are physical possible
+            if self.check == "every-step" or (self.check == "final" and step == len(self.program)):
+                self.__checkStates(currentState, lasers)
+
+        # Without parameter sweep there is only one point
+        return currentState if len(self.parameters) > 0 else currentState[0]
+
+    def formatStates(self, states):
+        """
+        Formats the states of one initial stokes vector as lines of the form '[ S0 S1 S2 S3 ] HEADER'.
+        Attributes:
+            states - states of the simulation for one initial stokes vector, numpy.ndarray of shape (modes, 4)
+        Return:
+            list of strings
+        """
+        # Put all vectors in a list of nicely formated strings
+        table = str(states).replace("[[", "").replace(" [", "").replace("]", "").splitlines()
+        return [ "[" + vector + " ] " + str(head) for vector, head in zip(table, self.heads) ]
+
+    #
+    #   Checks of the states of the simulation
+    #
+    def __polarisationGrade(self, states):
+        """
+        Computes the polarisation grade Π = sqrt( S_1^2 + S_2^2 + S_3^2 ) / S_0 of every stokes vector.
+        Attributes:
+            states - stack of stokes vectors, numpy.ndarray of shape (...,4)
+        Return:
+            numpy.ndarray of shape (...)
+        """
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.sqrt( np.sum(states[...,1:]**2, axis = -1) ) / states[...,0]
+
+    def __describeState(self, index, lasers):
+        """
+        Describes the state of the simulation with the given index for error messages: the initial stokes vector, the point of the
+        parameter sweep and the header of the mode.
+        Attributes:
+            index  - tuple (point, laser, mode) with the index of the state
+            lasers - initial stokes vectors of the simulation, numpy.ndarray of shape (lasers, 4)
+        Return:
+            string
+        """
+        point, laser, mode = index
+        sweep = "".join( " and " + parameter["name"] + " = " + str(parameter["values"][point]) for parameter in self.parameters )
+        return "Error for initial state " + str(lasers[laser]) + sweep + ". Error in state vector '" + self.heads[mode] + "'."
+
+    def __checkSampleStates(self, states, lasers):
+        """
+        Makes sure the conversion formula of the raman tensors into the mueller matrices applies to all states before the SMP instruction.
+        The math is explained in a seperate pdf-file (PolaRam/ramanMuellerMatrix.pdf). The light must be fully polarised and there may be no
+        circular polarisation. The check of the polarisation grade can be skipped by the user. In two specific cases does the mueller matrix
+        generated by polaram convert apply to all linear polarised stokes vectors. See the README for details.
+        Attributes:
+            states - states of the simulation, numpy.ndarray of shape (points, lasers, modes, 4)
+            lasers - initial stokes vectors of the simulation, numpy.ndarray of shape (lasers, 4)
+        Raises ValueError for the first invalid state
+        """
+        log.info("Check state vectors.")
+        # Make sure the polarisation grade Π is 1. Undefined polarisation grades (S0 = 0) are not accepted.
+        polarisation = self.__polarisationGrade(states)
+        unpolarised  = ~(np.abs(polarisation - 1) <= self.tolerance) & (not self.allowUnpolarised)
+        # Make sure there is no circular polarisation
+        circular     = np.abs(states[...,3]) > self.tolerance
+
+        invalid = unpolarised | circular
+        if np.any(invalid):
+            # Report the first invalid state in the order of the sweep points, lasers and modes
+            index = tuple(np.argwhere(invalid)[0])
+            if unpolarised[index]:
+                log.error("SIMULATION ERROR: " + self.__describeState(index, lasers) + " Polarisation grade is " + str(np.round(polarisation[index], 7)) + ". Must be equal to one for SMP instruction! See the README for details.")
+                raise ValueError("SIMULATION ERROR: " + self.__describeState(index, lasers) + " Polarisation grade is " + str(np.round(polarisation[index], 7)) + ". Must be equal to one for SMP instruction! See the README for details.")
+            else:
+                log.error("SIMULATION ERROR: " + self.__describeState(index, lasers) + " The SMP instruction can't handle circular polarisation!")
+                raise ValueError("SIMULATION ERROR: " + self.__describeState(index, lasers) + " The SMP instruction can't handle circular polarisation!")
+
+    def __checkStates(self, states, lasers):
+        """
+        Makes sure the computed stokes vectors are physical possible: the polarisation grade Π can't be greater than one and the total
+        light intensity can't be negative.
+        Attributes:
+            states - states of the simulation, numpy.ndarray of shape (points, lasers, modes, 4)
+            lasers - initial stokes vectors of the simulation, numpy.ndarray of shape (lasers, 4)
+        Raises ValueError for the first invalid state
+        """
+        log.info("Check validity of simulation step.")
+        polarisation = self.__polarisationGrade(states)
+        overpolarised = polarisation > 1 + self.tolerance
+        negative      = states[...,0] < -self.tolerance
+
+        invalid = overpolarised | negative
+        if np.any(invalid):
+            # Report the first invalid state in the order of the sweep points, lasers and modes
+            index = tuple(np.argwhere(invalid)[0])
+            if overpolarised[index]:
+                log.error("SIMULATION ERROR: " + self.__describeState(index, lasers) + " Polarisation grade is " + str(np.round(polarisation[index], 7)) + ". Can't be greater than one!")
+                raise ValueError("SIMULATION ERROR: " + self.__describeState(index, lasers) + " Polarisation grade greater than one is not possible!")
+            else:
+                log.error("SIMULATION ERROR: " + self.__describeState(index, lasers) + " The total light intensity can't be negative!")
+                raise ValueError("SIMULATION ERROR: " + self.__describeState(index, lasers) + " The total light intensity can't be negative!")
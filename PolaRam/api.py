@@ -0,0 +1,96 @@
+#
+#   PYTHON INTERFACE OF POLARAM
+#
+# The functions of this module run 'polaram extract', 'polaram convert' and 'polaram simulate' inside a python program. They take and
+# return numpy arrays instead of files and never ask the user for input. The command line interface (see main.py) writes log files
+# and output files around the same functions.
+# Example:
+#   import api
+#   tensors, frequencies = api.extractTensors("gaussian/WATER.LOG")
+#   mueller, raman, muellerError, ramanError = api.convertTensors(tensors, exact = True)
+#   states = api.Simulation("HWP 0:90:1\nSMP\nLVP 0", mueller).run([1, 1, 0, 0])
+#
+
+#
+#   EXTERNAL LIBARIES
+#
+# Purpose loggging
+import logging
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this file does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+# Math stuff and arrays
+import numpy as np
+
+# Hanlde file paths
+import pathlib
+
+#
+#   INTERNAL MODULES
+#
+import convert
+import extract
+from Simulation import Simulation
+
+#
+#   FUNCTIONS
+#
+def extractTensors(path, index = False):
+    """
+    Reads the raman tensors and the harmonic frequencies from a gaussian log file of a frequency calculation (see 'polaram extract').
+    Attributes:
+    path  - path of the gaussian log file
+    index - if True only the sections listed in the sidecar index file are read. See extract.loadIndex(). Default False.
+    Returns tuple (tensors, frequencies) with
+        tensors     - numpy.ndarray of shape (modes,3,3) with the raman tensors in the molecular coordinate system
+        frequencies - numpy.ndarray of shape (modes,) with the harmonic frequencies in 1/cm. Imaginary frequencies are negative.
+                      The frequency is NaN, if it can't be read from the file.
+    Raises ValueError, if the file contains no raman tensors
+    """
+    path = pathlib.Path(path)
+    log.info("Read gaussian log file " + str(path.resolve()))
+    logfile = extract.readLogfile(path, index)
+
+    tensors = np.array([ tensor["matrix"] for tensor in logfile["tensors"] ], dtype = float).reshape(-1, 3, 3)
+
+    # The frequencies are listed in the order of the mode numbers
+    frequencies = np.full(len(tensors), np.nan)
+    for index, tensor in enumerate(logfile["tensors"]):
+        try:
+            frequencies[index] = float(logfile["frequencies"][tensor["mode"] - 1])
+        except (TypeError, IndexError, ValueError):
+            log.warning("Frequency of mode " + str(tensor["mode"]) + " not found.")
+
+    return tensors, frequencies
+
+def convertTensors(tensors, iterations = 1000000, exact = False, sampler = "random", seed = None, processCount = 2, chunksize = 20000,
+                   batchsize = 500, controlVariates = False, tolerance = None, maxIterations = None):
+    """
+    Converts raman tensors into the mueller matrices of the raman scattering by averaging over all orientations of the molecule
+    (see 'polaram convert'). The result is not validated.
+    Attributes:
+    tensors         - array-like of shape (modes,3,3) or (3,3) with the raman tensors in the molecular coordinate system
+    iterations      - number of iterations of the monte-carlo-simulation. Default 1000000.
+    exact           - compute the exact orientational average from the second moments instead of the monte-carlo-simulation. Default False.
+    The other attributes are the settings of the monte-carlo-simulation. See monteCarloAverage() in convert.py.
+    Returns tuple (muellerMatrices, ramanTensors, muellerErrors, ramanErrors) with
+        muellerMatrices - numpy.ndarray of shape (modes,4,4) with the mean mueller matrices
+        ramanTensors    - numpy.ndarray of shape (modes,3,3) with the means of the rotated raman tensors
+        muellerErrors   - numpy.ndarray of shape (modes,4,4) with the standard errors of the mueller matrices (zero for the exact average)
+        ramanErrors     - numpy.ndarray of shape (modes,3,3) with the standard errors of the raman tensors (zero for the exact average)
+    """
+    tensors = np.array(tensors, dtype = float)
+    if tensors.shape == (3,3):
+        tensors = tensors[np.newaxis]
+    if tensors.ndim != 3 or tensors.shape[1:] != (3,3):
+        raise ValueError("The raman tensors must be an array of shape (modes, 3, 3)!")
+
+    if exact == True:
+        muellerMatrices, ramanTensors = convert.exactAverage(tensors)
+        return muellerMatrices, ramanTensors, np.zeros(muellerMatrices.shape), np.zeros(ramanTensors.shape)
+
+    result = convert.monteCarloAverage(tensors, iterations, sampler, seed, processCount, chunksize, batchsize, controlVariates, tolerance,
+                                       maxIterations)
+    return result.muellerMean, result.ramanMean, result.muellerStandardError(), result.ramanStandardError()
@@ -11,21 +11,27 @@ log.addHandler(logging.NullHandler())
 # Terminate program on exception
 import sys
 
+# Silence warnings of scipy in the subprocesses
+import warnings
+
 # Matrix multiplication and trigonometric functions
 import numpy as np
 
-# sqrt, ceiling and floor
-import math
-
-# Pseudo-random number generator
-import random as rand
-
 # Get time and date for output file
 from datetime import datetime
 
 # Run multiple processes in parallel
 import multiprocessing
 
+# Ignore interrupts in the subprocesses
+import signal
+
+# Time between two checkpoints
+import time
+
+# Settings of the monte-carlo-simulation without command line
+import argparse
+
 # Process bar
 from tqdm import tqdm
 
@@ -34,65 +40,674 @@ from tqdm import tqdm
 #   INTERNAL MODULES
 #
 import utilities as util
+from Accumulator import Accumulator
+from ResultWriter import ResultWriter
 
 #
-#   FUNCTION TO BE CALLED BY PARALLEL SUBPROCESSES
+#   MAKROS
 #
-def __monteCarlo(tensorlist):
+
+# Minimal time in seconds between two checkpoints written during a run of the monte-carlo-simulation
+CHECKPOINT_INTERVAL = 60
+
+# Number of variables per mode collected by __controlVariates(): two control variates and two scattered light intensities
+CONTROL_COUNT = 4
+
+# Names of the samplers generating the rotations. See __samplePoints().
+SAMPLERS = ["random", "halton", "sobol"]
+
+# Largest number of blocks computed to reach a tolerance, if no iteration cap is given. A tolerance that can't be reached doesn't
+# keep the simulation running forever.
+MAX_TOLERANCE_BLOCKS = 100
+
+#
+#   FUNCTIONS TO BE CALLED BY PARALLEL SUBPROCESSES
+#
+
+# Data every subprocess needs for all its tasks: the raman tensors, the seed of the sampler, the batch size and the control variates flag
+# The dictionary is filled once per subprocess by __initWorker(), so the tasks don't need to carry the tensors
+__workerData = {}
+
+def __initWorker(tensors, seed, batchsize, controlVariates = False):
+    """
+    Initialises a subprocess of the pool. The raman tensors and the settings are sent to every subprocess only once when the pool starts.
+    Should not be called outside of convert.py!
+    Attributes:
+    tensors   - numpy.ndarray of shape (modes,3,3) with the raman tensors in the molecular coordinate system
+    seed      - seed of the sampler. See __samplePoints().
+    batchsize - number of iterations computed at once
+    controlVariates - if True the control variates are collected. See __controlVariates(). Default False.
     """
-    RUN ONE ITERATION OF THE MONTE-CARLO SIMULATION
+    # Only the main process handles interrupts by the user (Ctrl-C). It stops the subprocesses and saves the partial result.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    __workerData["tensors"]   = tensors
+    __workerData["seed"]      = seed
+    __workerData["batchsize"] = batchsize
+    __workerData["controlVariates"] = controlVariates
+
+def __samplePoints(sampler, offset, count, seed):
+    """
+    Draw points uniformly distributed in the unit cube [0,1)^3. The points are the parameters of the random rotations.
+    Should not be called outside of convert.py! No parameter testing or unittests in place!
+    Samplers:   random - pseudo-random numbers. The error of the mean decreases with 1/sqrt(N).
+                halton - scrambled Halton sequence in the bases 2, 3 and 5 (random digit permutations). The error of the mean decreases almost with 1/N.
+                sobol  - scrambled Sobol sequence (scipy.stats.qmc.Sobol). The error of the mean decreases almost with 1/N.
+    The low-discrepancy sequences are deterministic for a given seed. The points offset ... offset+count-1 of the sequence are returned,
+    so the subprocesses compute disjoint parts of the same sequence. The random sampler spawns an independent stream of pseudo-random
+    numbers for every batch from the seed and the index of the first point, so the points are deterministic as well.
+    Attributes:
+    sampler - name of the sampler: "random", "halton" or "sobol"
+    offset  - index of the first point
+    count   - number of points
+    seed    - seed of the sampler
+    Returns numpy.ndarray of shape (count, 3)
+    """
+    if sampler == "halton":
+        # The scrambling must be identical in every subprocess, so the digit permutations are drawn from the seed
+        rng = np.random.default_rng(seed)
+        index = np.arange(offset, offset + count)
+        points = np.zeros((count, 3))
+        for dimension, base in enumerate([2, 3, 5]):
+            # Use as many digits as needed to reach double precision
+            digitCount = int(np.ceil(53 / np.log2(base)))
+            permutations = np.array([ rng.permutation(base) for digit in range(digitCount) ])
+            # Compute the scrambled radical inverse of the indices digit by digit
+            remainder = index.copy()
+            scale = 1.
+            for digit in range(digitCount):
+                scale /= base
+                points[:,dimension] += permutations[digit][remainder % base] * scale
+                remainder //= base
+        return points
+
+    elif sampler == "sobol":
+        # scipy is only needed for this sampler
+        from scipy.stats import qmc
+        engine = qmc.Sobol(d = 3, scramble = True, seed = seed)
+        if offset > 0:
+            engine.fast_forward(offset)
+        # Every batch is only a part of the sequence, so scipy's warning about the balance of the batch does not apply
+        # The main function warns if the total number of iterations is no power of two
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            return engine.random(count)
+
+    else:
+        # Get an independent random number generator for every batch
+        # The stream is spawned from the seed with the index of the first point as key (like numpy.random.SeedSequence.spawn),
+        # so no two batches draw the same numbers and the result does not depend on which subprocess computes the batch
+        return np.random.default_rng( np.random.SeedSequence(seed, spawn_key = (offset,)) ).random((count, 3))
+
+def __arvoRotations(points):
+    """
+    Convert points of the unit cube into uniformly distributed rotation matrices with James Arvo's Algorithm "Fast Random Rotation Matrices".
+    See pdf file jamesArvoAlgorithm.pdf for the math. All rotations are computed at once with numpy array operations.
+    Should not be called outside of convert.py! No parameter testing or unittests in place!
+    Attributes:
+    points - numpy.ndarray of shape (count, 3) with values in [0,1)
+    Returns numpy.ndarray of shape (count, 3, 3)
+    """
+    # Get the rotation parameters
+    phi         = 2*np.pi * points[:,0]
+    theta       = 2*np.pi * points[:,1]
+    x           = points[:,2]
+
+    # Random rotation around the z-axis
+    Rz = np.zeros((len(points), 3, 3))
+    Rz[:,0,0] =  np.cos(phi)
+    Rz[:,0,1] =  np.sin(phi)
+    Rz[:,1,0] = -np.sin(phi)
+    Rz[:,1,1] =  np.cos(phi)
+    Rz[:,2,2] =  1
+    # Get a random reflection plane, by defining its normal vector
+    # The rotation will be performed by doing one rotation and two reflections; this guarantees uniformly distributed random rotation matrices
+    mirrorNormal = np.stack([ np.cos(theta)*np.sqrt(x),
+                              np.sin(theta)*np.sqrt(x),
+                              np.sqrt(1-x)               ], axis = -1)
+    # Get the householder matrices describing the reflections
+    householder = np.eye(3) - 2 * np.einsum("ni,nj->nij", mirrorNormal, mirrorNormal)
+    # Contruct the final random rotation matrices
+    # by combining the reflection operators -1 and the householder matrices with the rotations around the z axis.
+    return (-1 * householder) @ Rz
+
+def __controlVariates(raman):
+    """
+    Computes the control variates of the monte-carlo-simulation from the rotated raman tensors B:
+        ( B_xx^2 + B_yy^2 ) / 2     and     ( B_xy^2 + B_yx^2 ) / 2
+    They are the mean parallel and perpendicular part of the light scattered by the rotated tensor for light polarised along x and y,
+    so they are correlated with the elements of the mueller matrices that determine the depolarisation ratio. Their exact expectation is
+    known. See controlExpectation(). The scattered intensities B_xx^2 and B_yx^2 for light polarised along x are collected as well. They
+    are not used as control variates, because the depolarisation ratio would be exact and the validation meaningless. They are used to
+    compute the variance reduction factor. See varianceReduction().
+    Should not be called outside of convert.py! No parameter testing or unittests in place!
+    Attributes:
+    raman - stack of rotated raman tensors, numpy.ndarray of shape (...,3,3)
+    Returns numpy.ndarray of shape (...,CONTROL_COUNT)
+    """
+    return np.stack([ (raman[...,0,0]**2 + raman[...,1,1]**2)/2,
+                      (raman[...,0,1]**2 + raman[...,1,0]**2)/2,
+                       raman[...,0,0]**2,
+                       raman[...,1,0]**2 ], axis = -1)
+
+def __monteCarlo(task):
+    """
+    RUN ONE CHUNK OF ITERATIONS OF THE MONTE-CARLO-SIMULATION
     !!!!! LOGGING IS OMITTED DURING THE SIMULATION DUE TO SEVERE PERFORMANCE ISSUES !!!!!!
     Should not be called outside of convert.py! No parameter testing or unittests in place!
     Calculation:  1. Rotate all raman tensors randomly via matrix multiplication
                      Uniformly distributed random rotations are generated with James Arvo's Algorithm "Fast Random Rotation Matrices". See pdf file jamesArvoAlgorithm.pdf for the math.
                   2. Compute the mueller matrix of the rotated raman tensor. For the math, see pdf file ramanMuellerMatrix.pdf.
-                  3. Compute the mean of all rotated mueller matrices and raman tensors. The mean will be computed by the main function.
+                  3. Collect mean and variance of the rotated mueller matrices and raman tensors. The results of all chunks will be merged by the main function.
+    The chunk is computed in batches of batchsize iterations. Every step is done for the whole batch at once: the rotations are a (N,3,3) stack,
+    the rotated tensors a (N,modes,3,3) stack and the mueller matrices a (N,modes,4,4) stack. The batches are reduced inside the subprocess,
+    so only one small Accumulator per chunk is sent back to the main process.
+    The raman tensors, the seed, the batch size and the control variates flag are read from the data stored by __initWorker().
 
     Attributes:
-    tensorlist - correctly formatted list of raman tensors in the molecular coordinate system
-    Returns rotated version of tensorlist as raman tensor and mueller matrix of the raman tensor
+    task - tuple (sampler, offset, count): the name of the sampler, the index of the first iteration and the number of iterations to compute.
+           See __samplePoints().
+    Returns Accumulator with the mean and variance of the mueller matrices of the rotated raman tensors and of the rotated raman tensors
     """
-    # Choose random rotation parameters
-    phi         = rand.uniform(0, 2*np.pi)
-    theta       = rand.uniform(0, 2*np.pi)
-    x           = rand.uniform(0, 1)
-
-    # Calculate the rotation matrix with Arvo's Alorithm "Fast Random Rotation Matrices"
-    # Random rotation around the z-axis
-    Rz = np.array([ [ np.cos(phi), np.sin(phi), 0],
-                    [-np.sin(phi), np.cos(phi), 0],
-                    [ 0          , 0          , 1]   ])
-    # Get a random reflection plane, by defining its normal vector
-    # The rotation will be performed by doing one rotation and two reflections; this guarantees uniformly distributed random rotation matrices
-    mirrorNormal = np.array([ [ np.cos(theta)*math.sqrt(x) ],
-                              [ np.sin(theta)*math.sqrt(x) ],
-                              [ math.sqrt(1-x)             ]    ])
-    # Get the householder matrix describing the reflection
-    householder = np.diag([1,1,1]) - 2 * ( mirrorNormal @ mirrorNormal.T )
-    # Contruct the final random rotation matrix
-    # by combining the reflection operators -1 and the householder matrix with the rotation around the z axis.
-    rotation = (-1 * householder) @ Rz
+    sampler, offset, count = task
+    tensors   = __workerData["tensors"]
+    seed      = __workerData["seed"]
+    batchsize = __workerData["batchsize"]
+    controlVariates = __workerData["controlVariates"]
 
-    # Create empty list to store results in
-    result = []
+    # Collects the results of all batches of the chunk
+    result = Accumulator(len(tensors), CONTROL_COUNT if controlVariates else 0)
 
-    # Rotate every raman tensor and convert it into mueller formalism
-    for index, tensor in enumerate(tensorlist):
+    for start in range(0, count, batchsize):
+        # Calculate the rotation matrices with Arvo's Alorithm "Fast Random Rotation Matrices"
+        rotation = __arvoRotations( __samplePoints(sampler, offset + start, min(batchsize, count - start), seed) )
 
-        # Rotate tensor
-        raman = rotation.T @ tensor["matrix"] @ rotation
+        # Rotate every raman tensor with every rotation matrix: rotation.T @ tensor @ rotation
+        raman = np.einsum("nji,mjk,nkl->nmil", rotation, tensors, rotation, optimize = True)
 
-        # Convert tensor into mueller formalism
+        # Convert tensors into mueller formalism
         mueller = util.buildRamanMuellerMatrix(raman)
 
-        # Store result
-        result.append( {"head"          : tensor["head"],
-                        "muellerMatrix" : mueller,
-                        "ramanTensor"   : raman             })
+        # Add the batch to the summary of the chunk
+        result.add(mueller, raman, __controlVariates(raman) if controlVariates else None)
 
-    # Return rotated tensors
     return result
 
+#
+#   EXACT ORIENTATIONAL AVERAGE
+#
+def exactAverage(tensors: np.ndarray):
+    """
+    Computes the mean mueller matrix and the mean raman tensor of all possible rotations of raman tensors in closed form.
+    The mueller matrix of a raman tensor is quadratic in the tensor components (see utilities.buildRamanMuellerMatrix). Its
+    isotropic average therefore only depends on the second moments <B_ij B_kl> of the rotated tensor B = R.T @ A @ R, which
+    follow from the isotropic average of four rotation matrices (Andrews, Thirunamachandran: J. Chem. Phys. 67, 5026 (1977)):
+        <B_ij B_kl> = ( c1 δ_ij δ_kl + c2 δ_ik δ_jl + c3 δ_il δ_jk ) / 30
+        c1 = 4 I1 -   I2 -   I3
+        c2 = - I1 + 4 I2 -   I3
+        c3 = - I1 -   I2 + 4 I3
+    with the rotational invariants I1 = (tr A)^2, I2 = sum_ab A_ab A_ab and I3 = sum_ab A_ab A_ba. The mean raman tensor
+    is (tr A / 3) times the unit matrix. The result is the limit the monte-carlo-simulation converges to.
+    Attributes:
+    tensors - stack of raman tensors in the molecular coordinate system (numpy.ndarray of shape (modes,3,3))
+    Returns tuple (muellerMatrices, ramanTensors) with the mean mueller matrices (modes,4,4) and the mean raman tensors (modes,3,3)
+    """
+    # Check type of input
+    if not isinstance(tensors, np.ndarray):
+        raise TypeError("convert.exactAverage expects a numpy.ndarray as input!")
+    if tensors.ndim != 3 or tensors.shape[1:] != (3,3):
+        raise TypeError("convert.exactAverage expects a stack of 3x3 matrices (numpy.ndarray of shape (modes,3,3)) as input!")
+
+    # Second moments of the rotated tensor components: moments[mode,i,j,k,l] = <B_ij B_kl>
+    moments = __secondMoments(tensors)
+
+    # Build the mean mueller matrix exactly like utilities.buildRamanMuellerMatrix, but with the mean of every product
+    xx_xx = moments[:,0,0,0,0]
+    xy_xy = moments[:,0,1,0,1]
+    yx_yx = moments[:,1,0,1,0]
+    yy_yy = moments[:,1,1,1,1]
+    muellerMatrices = np.zeros((len(tensors), 4, 4))
+    muellerMatrices[:,0,0] = (xx_xx + yx_yx + xy_xy + yy_yy)/2
+    muellerMatrices[:,0,1] = (xx_xx + yx_yx - xy_xy - yy_yy)/2
+    muellerMatrices[:,0,2] =  moments[:,0,1,0,0] + moments[:,1,0,1,1]
+    muellerMatrices[:,1,0] = (xx_xx - yx_yx + xy_xy - yy_yy)/2
+    muellerMatrices[:,1,1] = (xx_xx - yx_yx - xy_xy + yy_yy)/2
+    muellerMatrices[:,1,2] =  moments[:,0,1,0,0] - moments[:,1,0,1,1]
+    muellerMatrices[:,2,0] =  moments[:,0,0,1,0] + moments[:,0,1,1,1]
+    muellerMatrices[:,2,1] =  moments[:,0,0,1,0] - moments[:,0,1,1,1]
+    muellerMatrices[:,2,2] =  moments[:,0,0,1,1] + moments[:,0,1,1,0]
+
+    # The mean raman tensor is isotropic
+    ramanTensors = np.einsum("m,ij->mij", np.trace(tensors, axis1 = 1, axis2 = 2)/3, np.eye(3))
+
+    return muellerMatrices, ramanTensors
+
+def __secondMoments(tensors):
+    """
+    Computes the second moments <B_ij B_kl> of the components of the rotated tensors B = R.T @ A @ R averaged over all rotations R.
+    See exactAverage() for the math.
+    Should not be called outside of convert.py! No parameter testing or unittests in place!
+    Attributes:
+    tensors - stack of raman tensors in the molecular coordinate system (numpy.ndarray of shape (modes,3,3))
+    Returns numpy.ndarray of shape (modes,3,3,3,3) with moments[mode,i,j,k,l] = <B_ij B_kl>
+    """
+    # Rotational invariants of every tensor
+    I1 = np.trace(tensors, axis1 = 1, axis2 = 2)**2
+    I2 = np.sum(tensors * tensors, axis = (1,2))
+    I3 = np.sum(tensors * tensors.transpose(0,2,1), axis = (1,2))
+
+    delta = np.eye(3)
+    return (   np.einsum("m,ij,kl->mijkl", 4*I1 -   I2 -   I3, delta, delta)
+             + np.einsum("m,ik,jl->mijkl",  -I1 + 4*I2 -   I3, delta, delta)
+             + np.einsum("m,il,jk->mijkl",  -I1 -   I2 + 4*I3, delta, delta) ) / 30
+
+def controlExpectation(tensors: np.ndarray):
+    """
+    Computes the exact expectation of the control variates ( B_xx^2 + B_yy^2 ) / 2 and ( B_xy^2 + B_yx^2 ) / 2 of the rotated tensors.
+    They follow from the rotational invariants of the molecular tensors like the exact average (see exactAverage()):
+        < B_xx^2 > = < B_yy^2 > = ( c1 + c2 + c3 ) / 30
+        < B_xy^2 > = < B_yx^2 > = c2 / 30
+    Used by convert.py and merge.py.
+    Attributes:
+    tensors - stack of raman tensors in the molecular coordinate system (numpy.ndarray of shape (modes,3,3))
+    Returns numpy.ndarray of shape (modes,2)
+    """
+    # Check type of input
+    if not isinstance(tensors, np.ndarray):
+        raise TypeError("convert.controlExpectation expects a numpy.ndarray as input!")
+    if tensors.ndim != 3 or tensors.shape[1:] != (3,3):
+        raise TypeError("convert.controlExpectation expects a stack of 3x3 matrices (numpy.ndarray of shape (modes,3,3)) as input!")
+
+    moments = __secondMoments(tensors)
+    return np.stack([ (moments[:,0,0,0,0] + moments[:,1,1,1,1])/2,
+                      (moments[:,0,1,0,1] + moments[:,1,0,1,0])/2 ], axis = -1)
+
+def varianceReduction(accumulator):
+    """
+    Computes the variance reduction factor achieved by the control variates for the depolarisation ratio used by the validation: the ratio
+    of the variances of the depolarisation ratio computed with the plain and with the corrected means. The simulation needs this factor
+    less iterations to reach the same accuracy of the depolarisation ratio. The depolarisation ratio of light polarised along x is
+    r = <y> / <x> with the intensities x = B_xx^2 and y = B_yx^2. Its variance follows from their co-moments S (delta method):
+        Var(r) ~ ( S_yy - 2 r S_xy + r^2 S_xx ) / <x>^2
+    The co-moments of the corrected means are the residual co-moments S - S_tc S_cc^-1 S_ct after the regression on the control variates.
+    The smallest factor of all modes is returned. Modes without depolarised scattering are ignored. The factor of modes whose intensities
+    are linear in the control variates is limited to 1e12, because their corrected variance is zero or a rounding error.
+    Used by convert.py and merge.py.
+    Attributes:
+    accumulator - Accumulator with the variables collected by __controlVariates()
+    Returns float
+    """
+    controls    = accumulator.controlM2[:,:2,:2]
+    intensities = accumulator.controlM2[:,2:,2:]
+    cross       = accumulator.controlM2[:,:2,2:]
+    residual    = intensities - np.einsum("mct,mcd,mdu->mtu", cross, np.linalg.pinv(controls, hermitian = True), cross)
+
+    # Depolarisation ratio of every mode
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        ratio = accumulator.controlMean[:,3] / accumulator.controlMean[:,2]
+    variance  = lambda S : S[:,1,1] - 2*ratio*S[:,0,1] + ratio**2 * S[:,0,0]
+    plain     = variance(intensities)
+    # The corrected variance can't be smaller than a rounding error of the plain variance
+    corrected = np.maximum(variance(residual), 1e-12 * plain)
+
+    # Ignore modes without variance of the depolarisation ratio, e.g. of isotropic tensors
+    # numpy.nanmax accepts 'initial' only from numpy 1.22 on
+    relevant = np.isfinite(plain) & (plain > 1e-12 * np.max(plain[~np.isnan(plain)], initial = 0))
+    if not np.any(relevant):
+        return 1.
+    return float( np.min( plain[relevant] / corrected[relevant] ) )
+
+#
+#   VALIDATION
+#
+def validate(tensorlist, convertedTensorlist, threshold):
+    """
+    VALIDATE THE SIMULATION
+    by comparing the depolarisation ratio of the molecular tensor and the labratory matrix
+    Source: Richard N. Zare: Angular Momentum, p.129
+    Used by convert.py and merge.py.
+    Attributes:
+    tensorlist          - list of dictionaries with the raman tensors in the molecular coordinate system
+    convertedTensorlist - list of dictionaries with the mean mueller matrices in the labratory coordinate system
+    threshold           - number of digits the depolarisation ratios must match
+    Returns tuple (success, head, initialDepolarisationRatio, finalDepolarisationRatio). If the validation failed, the
+    last three values belong to the first matrix that failed.
+    """
+    log.info("Validating monte-carlo-simulation via the depolarisation ratio.")
+
+    # Check every matrix
+    # The debug messages are only formated, if the log file records them
+    for initial, final in zip(tensorlist, convertedTensorlist):
+
+        log.debug("Check matrix '%s'.", initial["head"])
+
+        # Check if loop is comparing the right matrices
+        if initial["head"] != final["head"]:
+            log.critical("INTERNAL ERROR: The header of input and output matrices don't match! Error in input tensor '" + initial["head"] + "' and output matrix '" + final["head"] + "'." )
+            log.critical("TERMINATE EXECUTION.")
+            sys.exit(-1)
+
+        # Compute eigenvalues of molecular tensor
+        try:
+            eigenvalues = np.linalg.eigvals(initial["matrix"])
+
+        except np.linalg.LinAlgError as e:
+            # Eigenvalues do not converge. Log this issue and exit execution.
+            log.critical("The eigenvalue computation of the input raman tensor '" + initial["head"] + "' does not converge. Unable to validate monte-carlo-simulation!")
+            log.critical("TERMINATE EXECUTION.")
+            sys.exit(-1)
+
+        # Compute depolarisation ratio of the inital tensor via the eigenvalues. See Richard N. Zare: "Angluar Momentum", p.129.
+        isotropicPolarisability = sum(eigenvalues)/3
+        anisotropicPolarisability_squared = ( (eigenvalues[0]-eigenvalues[1])**2 + (eigenvalues[1]-eigenvalues[2])**2 + (eigenvalues[2]-eigenvalues[0])**2 )/2
+        initialDepolarisationRatio = 3*anisotropicPolarisability_squared / ( 45*isotropicPolarisability**2 + 4*anisotropicPolarisability_squared )
+
+        log.debug("Initial Depolarisation Ratio: %s", initialDepolarisationRatio)
+
+        # Compute the depolarisation ratio of the final mueller matrix via raman scattering in Mueller-Formalism. See Richard N. Zare: "Angluar Momentum", p.129.
+        # Compute light intensities along x- and y-axis via stokes parameter:
+        # I_x = S_0 + S_1
+        # I_y = S_0 - S_1
+        # depolarisationRatio = I_y / I_x ; if the incoming light is polarised along the x-axis.
+        incomingLight  = np.array([1,1,0,0])
+        scatteredLight = final["muellerMatrix"] @ incomingLight
+        finalDepolarisationRatio = (scatteredLight[0]-scatteredLight[1])/(scatteredLight[0]+scatteredLight[1])
+
+        log.debug("Final Depolarisation Ratio: %s", finalDepolarisationRatio)
+
+        # Stop at the first matrix that fails the validation
+        if round(initialDepolarisationRatio, threshold) != round(finalDepolarisationRatio, threshold):
+            return False, initial["head"], initialDepolarisationRatio, finalDepolarisationRatio
+
+    log.info("Validation done.")
+    return True, initial["head"], initialDepolarisationRatio, finalDepolarisationRatio
+
+#
+#   MONTE-CARLO SIMULATION
+#
+def __startPool(tensorArray, seed, cliArgs):
+    """
+    Starts the pool of subprocesses computing the monte-carlo-simulation. The raman tensors and the settings are sent to every
+    subprocess once. The same pool is used for all runs of the simulation.
+    Should not be called outside of convert.py!
+    Attributes:
+    tensorArray - numpy.ndarray of shape (modes,3,3) with the raman tensors in the molecular coordinate system
+    seed        - seed of the sampler
+    cliArgs     - object containing the command line arguments parsed in main.py (processCount, batchsize and controlVariates are used)
+    Returns multiprocessing.Pool
+    """
+    log.info("Start " + str(cliArgs.processCount) + " subprocesses.")
+    return multiprocessing.Pool(processes = cliArgs.processCount, initializer = __initWorker, initargs = (tensorArray, seed, cliArgs.batchsize, cliArgs.controlVariates))
+
+def __runMonteCarlo(pool, accumulator, sampler, offset, iterations, cliArgs, checkpoint = None):
+    """
+    Runs a block of iterations of the monte-carlo-simulation on a pool of subprocesses and merges the results into the accumulator.
+    If the computation is interrupted, the accumulator contains all chunks finished so far.
+    Should not be called outside of convert.py!
+    Attributes:
+    pool        - multiprocessing.Pool started by __startPool()
+    accumulator - Accumulator collecting the results of all blocks
+    sampler     - name of the sampler generating the rotations. See __samplePoints().
+    offset      - index of the first iteration of the block. Low-discrepancy sequences continue at this index.
+    iterations  - number of iterations to compute
+    cliArgs     - object containing the command line arguments parsed in main.py (processCount and chunksize are used)
+    checkpoint  - function without arguments that saves the accumulator. It is called every CHECKPOINT_INTERVAL seconds. Default None.
+    """
+    lastCheckpoint = time.monotonic()
+
+    # Build a generator that splits the iterations into chunks of size chunksize. Every chunk will be computed and reduced by one subprocess.
+    # The tasks only describe which iterations to compute. The subprocesses got the raman tensors when the pool was started.
+    processArgs = ( (sampler, offset + start, min(cliArgs.chunksize, iterations - start)) for start in range(0, iterations, cliArgs.chunksize) )
+
+    # Start the computation of the chunks on the subprocesses which run __monteCarlo()
+    # Each subprocess will be given a chunk of iterations. The subprocess computes the chunk in vectorised batches and returns only the reduced result.
+    # The computation will be slow if the chunksize is to small (too much interprocess communication) or to big (bad load balancing)
+    # The results are merged in the order of the chunks, so the mean is bit-identical for every number of processes
+    process = pool.imap(__monteCarlo, processArgs)
+
+    # Loop over all ready results, while the processes are still running
+    # process contains the mean and variance of all rotated matrices of one chunk
+    # tqdm prints a lovely progress bar, it is updated once per chunk
+    with tqdm( total = iterations, desc = "Processes " + str(cliArgs.processCount) ) as progressBar:
+        for chunk in process:
+            # Merge the results of all processes
+            accumulator.merge(chunk)
+            progressBar.update(chunk.count)
+
+            # Save the results from time to time
+            if checkpoint != None and time.monotonic() - lastCheckpoint > CHECKPOINT_INTERVAL:
+                checkpoint()
+                lastCheckpoint = time.monotonic()
+
+def monteCarloAverage(tensors: np.ndarray, iterations = 1000000, sampler = "random", seed = None, processCount = 2, chunksize = 20000,
+                      batchsize = 500, controlVariates = False, tolerance = None, maxIterations = None):
+    """
+    Computes the orientational average of the raman tensors with the monte-carlo-simulation of 'polaram convert' without command line,
+    checkpoints or validation. Used by api.py.
+    Attributes:
+    tensors         - numpy.ndarray of shape (modes,3,3) with the raman tensors in the molecular coordinate system
+    iterations      - number of iterations. If a tolerance is given, blocks of this size are computed until the tolerance is reached. Default 1000000.
+    sampler         - name of the sampler generating the rotations: random, sobol or halton. Default random.
+    seed            - seed of the sampler. Default None (random seed).
+    processCount    - number of subprocesses. Default 2.
+    chunksize       - number of iterations per task of a subprocess. Default 20000.
+    batchsize       - number of iterations computed at once by a subprocess. Default 500.
+    controlVariates - correct the means with control variates. See applyControlVariates() in Accumulator.py. Default False.
+    tolerance       - largest standard error of all elements of the result. Default None (compute the given number of iterations once).
+    maxIterations   - largest number of iterations computed to reach the tolerance. If the tolerance is not reached, a warning with the
+                      largest standard error is logged and the partial result is returned. Default None (MAX_TOLERANCE_BLOCKS blocks).
+    Returns Accumulator with the means and standard errors of the mueller matrices and rotated raman tensors
+    """
+    tensors = np.asarray(tensors, dtype = float)
+    if tensors.ndim != 3 or tensors.shape[1:] != (3,3):
+        raise ValueError("The raman tensors must be a numpy.ndarray of shape (modes, 3, 3)!")
+    if sampler not in SAMPLERS:
+        raise ValueError("Unknown sampler '" + str(sampler) + "'! Choose from " + ", ".join(SAMPLERS) + ".")
+    if maxIterations == None:
+        maxIterations = MAX_TOLERANCE_BLOCKS * iterations
+    elif type(maxIterations) != int or maxIterations < 1:
+        raise ValueError("The largest number of iterations must be a positive integer!")
+
+    # Settings used by __startPool() and __runMonteCarlo()
+    settings = argparse.Namespace(processCount = processCount, chunksize = chunksize, batchsize = batchsize, controlVariates = controlVariates)
+    accumulator = Accumulator(len(tensors), CONTROL_COUNT if controlVariates else 0)
+    samplerSeed = np.random.SeedSequence(seed).entropy
+
+    with __startPool(tensors, samplerSeed, settings) as pool:
+        while True:
+            # The low-discrepancy sequences continue where the last block stopped. The last block stops at the iteration cap.
+            blocksize = iterations if tolerance == None else min(iterations, maxIterations - accumulator.count)
+            __runMonteCarlo(pool, accumulator, sampler, accumulator.count, blocksize, settings)
+            result = accumulator.applyControlVariates(controlExpectation(tensors)) if controlVariates else accumulator
+            if tolerance == None or result.maxStandardError() < tolerance:
+                return result
+            if accumulator.count >= maxIterations:
+                log.warning("Tolerance " + str(tolerance) + " not reached after " + str(accumulator.count) + " iterations. Largest standard error: "
+                            + str(result.maxStandardError()) + ". Return the partial result.")
+                return result
+            log.info("Tolerance " + str(tolerance) + " not reached. Run Monte-Carlo-Simulation again.")
+
+def __compareSamplers(pool, tensorArray, cliArgs):
+    """
+    Runs the monte-carlo-simulation with every sampler and the same number of iterations and compares the results with the exact average.
+    Should not be called outside of convert.py!
+    Attributes:
+    pool        - multiprocessing.Pool started by __startPool()
+    tensorArray - numpy.ndarray of shape (modes,3,3) with the raman tensors in the molecular coordinate system
+    cliArgs     - object containing the command line arguments parsed in main.py
+    Returns the comparison as a formatted table (string)
+    """
+    # The exact average is the reference for all samplers
+    exactMueller, exactRaman = exactAverage(tensorArray)
+    # Depolarisation ratio of the exact average for light polarised along the x-axis: I_y / I_x = (S_0 - S_1) / (S_0 + S_1)
+    depolarisationRatio = lambda mueller : (mueller[:,0,0] + mueller[:,0,1] - mueller[:,1,0] - mueller[:,1,1]) / (mueller[:,0,0] + mueller[:,0,1] + mueller[:,1,0] + mueller[:,1,1])
+
+    table = "# Sampler  Iterations  Max.Error.MuellerMatrix  Max.Error.RamanTensor  Max.Error.DepolarisationRatio"
+    for sampler in SAMPLERS:
+        log.info("Run monte-carlo-simulation with sampler '" + sampler + "'.")
+        result = Accumulator(len(tensorArray), CONTROL_COUNT if cliArgs.controlVariates else 0)
+        __runMonteCarlo(pool, result, sampler, 0, cliArgs.iterationLimit, cliArgs)
+        if cliArgs.controlVariates == True:
+            result = result.applyControlVariates(controlExpectation(tensorArray))
+        muellerMean = result.muellerMean
+        ramanMean   = result.ramanMean
+        table += "\n  {:8s}  {:10d}  {:23.3e}  {:21.3e}  {:29.3e}".format(sampler, cliArgs.iterationLimit,
+                                                                           np.abs(muellerMean - exactMueller).max(),
+                                                                           np.abs(ramanMean - exactRaman).max(),
+                                                                           np.abs(depolarisationRatio(muellerMean) - depolarisationRatio(exactMueller)).max())
+    return table
+
+#
+#   CHECKPOINTS
+#
+def __saveCheckpoint(path, accumulator, seed, sampler, tensorlist, **metadata):
+    """
+    Saves the state of the monte-carlo-simulation: the accumulator, the seed and the sampler. The random numbers of every batch are
+    derived from the seed and the index of the first iteration, so the simulation can continue from this state. See __samplePoints().
+    Should not be called outside of convert.py!
+    Attributes:
+    path        - path of the checkpoint file (numpy .npz file)
+    accumulator - Accumulator with the results so far
+    seed        - seed of the sampler
+    sampler     - name of the sampler
+    tensorlist  - list of dictionaries with the raman tensors. Their headers are saved to recognise the tensor file.
+    metadata    - additional values stored in the file. See Accumulator.save().
+    """
+    log.info("Save checkpoint after " + str(accumulator.count) + " iterations to " + str(path.resolve()))
+    # The seed may be larger than 64 bit. It is stored as string.
+    accumulator.save(path, seed = str(seed), sampler = sampler, heads = [ tensor["head"] for tensor in tensorlist ], **metadata)
+
+def __loadCheckpoint(path, tensorlist, cliArgs):
+    """
+    Loads a checkpoint written by __saveCheckpoint() and makes sure it belongs to the same simulation.
+    Should not be called outside of convert.py!
+    Attributes:
+    path       - path of the checkpoint file (numpy .npz file)
+    tensorlist - list of dictionaries with the raman tensors
+    cliArgs    - object containing the command line arguments parsed in main.py (sampler and seed are used)
+    Returns tuple (accumulator, seed)
+    """
+    log.info("Resume from checkpoint " + str(path.resolve()))
+    try:
+        accumulator, metadata = Accumulator.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        log.critical("FATAL ERROR: Unable to read checkpoint '" + str(path.resolve()) + "'. Exiting execution.")
+        log.exception(e, exc_info = True)
+        sys.exit(-1)
+
+    seed = int(metadata["seed"])
+    if list(metadata["heads"]) != [ tensor["head"] for tensor in tensorlist ]:
+        log.critical("FATAL ERROR: The checkpoint belongs to a different tensor file. Exiting execution.")
+        sys.exit(-1)
+    if (accumulator.controlMean.shape[-1] > 0) != cliArgs.controlVariates:
+        log.critical("FATAL ERROR: The checkpoint was computed " + ("with" if cliArgs.controlVariates == False else "without") + " --control-variates. Exiting execution.")
+        sys.exit(-1)
+    if str(metadata["sampler"]) != cliArgs.sampler:
+        log.critical("FATAL ERROR: The checkpoint was computed with the sampler '" + str(metadata["sampler"]) + "'. Exiting execution.")
+        sys.exit(-1)
+    if cliArgs.seed != None and cliArgs.seed != seed:
+        log.critical("FATAL ERROR: The checkpoint was computed with the seed " + str(seed) + ". Exiting execution.")
+        sys.exit(-1)
+
+    log.info("Checkpoint contains " + str(accumulator.count) + " iterations.")
+    return accumulator, seed
+
+#
+#   SHARDS
+#
+def __runShard(tensorlist, tensorArray, seed, cliArgs):
+    """
+    Runs one shard of a monte-carlo-simulation that is split across several machines. Shard K of N computes the iterations
+    (K-1)*ITERATIONLIMIT ... K*ITERATIONLIMIT-1, so all shards with the same seed compute disjoint parts of one simulation.
+    The result is written in the checkpoint format together with the raman tensors. 'polaram merge' combines the shards.
+    Should not be called outside of convert.py!
+    Attributes:
+    tensorlist  - list of dictionaries with the raman tensors in the molecular coordinate system
+    tensorArray - numpy.ndarray of shape (modes,3,3) with the raman tensors
+    seed        - seed of the sampler
+    cliArgs     - object containing the command line arguments parsed in main.py
+    """
+    shardIndex, shardCount = cliArgs.shard
+    offset = (shardIndex - 1) * cliArgs.iterationLimit
+    log.info("Run shard " + str(shardIndex) + "/" + str(shardCount) + ": iterations " + str(offset) + " to " + str(offset + cliArgs.iterationLimit - 1))
+
+    accumulator = Accumulator(len(tensorlist), CONTROL_COUNT if cliArgs.controlVariates else 0)
+    with __startPool(tensorArray, seed, cliArgs) as pool:
+        __runMonteCarlo(pool, accumulator, cliArgs.sampler, offset, cliArgs.iterationLimit, cliArgs)
+
+    __saveCheckpoint(cliArgs.outputfile, accumulator, seed, cliArgs.sampler, tensorlist,
+                     tensors = tensorArray, shard = shardIndex, shardCount = shardCount, offset = offset)
+
+#
+#   RESULTS
+#
+def summarise(tensorlist, accumulator):
+    """
+    Builds the list of converted tensors from the results of the monte-carlo-simulation.
+    Used by convert.py and merge.py.
+    Attributes:
+    tensorlist  - list of dictionaries with the raman tensors in the molecular coordinate system
+    accumulator - Accumulator with the results of the simulation
+    Returns list of dictionaries with the keys head, muellerMatrix, ramanTensor, muellerMatrixError and ramanTensorError
+    """
+    muellerError = accumulator.muellerStandardError()
+    ramanError   = accumulator.ramanStandardError()
+    return [ {"head"              : tensor["head"],
+              "muellerMatrix"     : accumulator.muellerMean[index],
+              "ramanTensor"       : accumulator.ramanMean[index],
+              "muellerMatrixError": muellerError[index],
+              "ramanTensorError"  : ramanError[index]
+             } for (index, tensor) in enumerate(tensorlist) ]
+
+def formatResult(convertedTensorlist):
+    """
+    Formats the converted tensors like the tensor input file. The mean mueller matrices can be read by 'polaram simulate'.
+    The mean raman tensors and the standard errors are added as comments.
+    Used by convert.py and merge.py.
+    Attributes:
+    convertedTensorlist - list of dictionaries returned by summarise() or with the keys head, muellerMatrix and ramanTensor
+    Returns string
+    """
+    text = ""
+    for dict in convertedTensorlist:
+        # Print mean of mueller matrices
+        text += "\n\n! " + dict["head"] + "\n" + np.array2string(dict["muellerMatrix"], sign = None).replace("[[", "").replace(" [", "").replace("]", "")
+        # Print mean of raman tensors as comments
+        text += "\n\n#! " + dict["head"] + " (Mean Of Rotated Raman Tensors)\n" + np.array2string(dict["ramanTensor"], sign = None).replace("[[", "#").replace(" [", "#").replace("]", "")
+        # Print standard errors of the means as comments
+        if "muellerMatrixError" in dict:
+            text += "\n\n#! " + dict["head"] + " (Standard Error Of Mueller Matrix)\n" + np.array2string(dict["muellerMatrixError"], sign = None).replace("[[", "#").replace(" [", "#").replace("]", "")
+            text += "\n\n#! " + dict["head"] + " (Standard Error Of Mean Of Rotated Raman Tensors)\n" + np.array2string(dict["ramanTensorError"], sign = None).replace("[[", "#").replace(" [", "#").replace("]", "")
+    return text
+
+def writeResult(writer, header, convertedTensorlist):
+    """
+    Writes the converted tensors with a ResultWriter. The text format is the format of formatResult(). The csv format contains one row
+    per element of every matrix: Head, Quantity (MuellerMatrix, RamanTensor, MuellerMatrixError or RamanTensorError), Row, Column, Value.
+    The npz format contains the arrays heads, muellerMatrices, ramanTensors and the standard errors muellerMatrixErrors and ramanTensorErrors
+    (only for the monte-carlo-simulation). The npy format contains the mueller matrices.
+    Used by convert.py and merge.py.
+    Attributes:
+    writer              - ResultWriter.ResultWriter
+    header              - comment lines written before the matrices (command line, execution time, warnings, ...)
+    convertedTensorlist - list of dictionaries returned by summarise() or with the keys head, muellerMatrix and ramanTensor
+    """
+    writer.comment(header)
+
+    # Names of the quantities in the csv format and of the arrays in the npz format
+    quantities = [ ("muellerMatrix", "MuellerMatrix", "muellerMatrices"), ("ramanTensor", "RamanTensor", "ramanTensors") ]
+    if len(convertedTensorlist) > 0 and "muellerMatrixError" in convertedTensorlist[0]:
+        quantities += [ ("muellerMatrixError", "MuellerMatrixError", "muellerMatrixErrors"), ("ramanTensorError", "RamanTensorError", "ramanTensorErrors") ]
+
+    for dict in convertedTensorlist:
+        writer.text(formatResult([dict]))
+        writer.rows(["Head", "Quantity", "Row", "Column", "Value"],
+                    ( [dict["head"], name, row + 1, column + 1, value] for key, name, _ in quantities for (row, column), value in np.ndenumerate(dict[key]) ))
+
+    writer.array("heads", [ dict["head"] for dict in convertedTensorlist ])
+    for key, _, arrayName in quantities:
+        writer.array(arrayName, np.array([ dict[key] for dict in convertedTensorlist ]), main = key == "muellerMatrix")
+
 #
 #   MAIN PROGRAM
 #
@@ -106,25 +721,104 @@ def main(cliArgs):
 
     log.info("START RAMAN TENSOR CONVERSION")
 
-    # Read tensor file as matrices
-    tensorlist = util.readFileAsMatrices(cliArgs.tensorfile, (3,3))
+    # Read tensor file as one array of matrices. The subprocesses rotate all tensors at once.
+    heads, tensorArray = util.readFileAsArray(cliArgs.tensorfile, (3,3))
+    tensorlist = [ { "head": head, "matrix": tensor } for head, tensor in zip(heads, tensorArray) ]
 
 # PREPARE SIMULATION
 
     log.info("Prepare simulation")
 
-    # Copy the structure of tensorlist with empty arrays. This copy will be filled with the result of the simulation
-    convertedTensorlist = [{"head": tensor["head"],
-                            "muellerMatrix": np.diag([0, 0, 0, 0]).astype(np.float),
-                            "ramanTensor": np.diag([0, 0, 0]).astype(np.float)
-                           } for tensor in tensorlist]
+    # A shard is only a part of a simulation. The options that need the whole simulation can't be used.
+    if cliArgs.shard != None:
+        if cliArgs.seed == None:
+            log.critical("FATAL ERROR: All shards of a simulation need the same seed. Set the seed with --seed. Exiting execution.")
+            sys.exit(-1)
+        if cliArgs.exact or cliArgs.compareSamplers or cliArgs.resume or cliArgs.checkpoint != None or cliArgs.tolerance != None:
+            log.critical("FATAL ERROR: --shard can't be combined with --exact, --compare-samplers, --checkpoint, --resume or --tolerance. Exiting execution.")
+            sys.exit(-1)
+
+    # Collects mean and variance of all rotated mueller matrices and raman tensors
+    # accumulator.count is the total number of iterations. This number will increase if the simulation is run again.
+    accumulator = Accumulator(len(tensorlist), CONTROL_COUNT if cliArgs.controlVariates else 0)
+
+    # Seed of the sampler. The same seed must be used by all subprocesses.
+    # A random seed is drawn from the operating system, if the user did not give one. The seed is written into the output file.
+    samplerSeed = np.random.SeedSequence(cliArgs.seed).entropy
+
+    # Continue a previous run from its checkpoint. The seed of the checkpoint is used.
+    if cliArgs.resume == True:
+        if cliArgs.checkpoint == None or not cliArgs.checkpoint.exists():
+            log.critical("FATAL ERROR: No checkpoint to resume from. Use --checkpoint to give the path of an existing checkpoint. Exiting execution.")
+            sys.exit(-1)
+        accumulator, samplerSeed = __loadCheckpoint(cliArgs.checkpoint, tensorlist, cliArgs)
+
+    log.info("Sampler: " + cliArgs.sampler + "    Seed: " + str(samplerSeed))
+    if cliArgs.sampler == "sobol" and cliArgs.iterationLimit & (cliArgs.iterationLimit - 1) != 0:
+        log.warning("The sobol sampler works best if the number of iterations is a power of two.")
+
+# COMPARE THE SAMPLERS
+# Run the simulation with every sampler and compare the errors with the exact average. No result file is written.
+    if cliArgs.compareSamplers == True:
+        log.info("Compare samplers.")
+        with __startPool(tensorArray, samplerSeed, cliArgs) as pool:
+            table = __compareSamplers(pool, tensorArray, cliArgs)
+        log.info("Comparison of the samplers:\n" + table)
+        print(table)
+        log.info("STOPPED RAMAN TENSOR CONVERSION SUCCESSFULLY")
+        return
+
+# RUN ONE SHARD
+# The simulation is split across several machines. This machine computes one part and writes the accumulator to the output file.
+# The shards are combined and validated by 'polaram merge'.
+    if cliArgs.shard != None:
+        __runShard(tensorlist, tensorArray, samplerSeed, cliArgs)
+        log.info("STOPPED RAMAN TENSOR CONVERSION SUCCESSFULLY")
+        return
+
+# COMPUTE THE EXACT AVERAGE
+# The mean over all rotations is computed in closed form from the rotational invariants of the tensors. No sampling needed.
+    if cliArgs.exact == True:
+        log.info("Compute exact orientational average.")
+        muellerMean, ramanMean = exactAverage(tensorArray)
+        convertedTensorlist = [ {"head"         : tensor["head"],
+                                 "muellerMatrix": muellerMean[index],
+                                 "ramanTensor"  : ramanMean[index]
+                                } for (index, tensor) in enumerate(tensorlist) ]
+
+        # The exact average must pass the validation. A failure can only be caused by a bug or a broken input file.
+        success, head, initialDepolarisationRatio, finalDepolarisationRatio = validate(tensorlist, convertedTensorlist, cliArgs.threshold)
+        if success == False:
+            log.critical("Validation failed for matrix '" + head + "'!")
+            log.critical("Input: " + str(round(initialDepolarisationRatio, cliArgs.threshold)) + "      Exact average: " + str(round(finalDepolarisationRatio, cliArgs.threshold)))
+            log.critical("TERMINATE EXECUTION.")
+            sys.exit(-1)
 
     # Set a flag to signal the while loop below wether or not to rerun the simulation if validation fails
-    runMonteCarlo = True
+    # The monte-carlo-simulation is skipped if the exact average was computed
+    runMonteCarlo = not cliArgs.exact
+
+    # Saves the state of the simulation, if the user wants checkpoints
+    def checkpoint():
+        if cliArgs.checkpoint != None:
+            __saveCheckpoint(cliArgs.checkpoint, accumulator, samplerSeed, cliArgs.sampler, tensorlist)
 
-    # Total number of iterations
-    # This number will increase if the simulation is not validated and run again
-    totalIterations = cliArgs.iterationLimit
+    # Returns the mean and standard error of the simulation. The means are corrected with the control variates, if the user wants them.
+    def estimate():
+        if cliArgs.controlVariates == True:
+            log.info("Variance reduction factor of the control variates: " + str(varianceReduction(accumulator)))
+            return accumulator.applyControlVariates(controlExpectation(tensorArray))
+        return accumulator
+
+    # Warning added to the output file, if the result is only a partial result
+    partialResultWarning = ""
+
+    # Largest number of iterations computed to reach the tolerance
+    maxIterations = cliArgs.maxIterations if cliArgs.maxIterations != None else MAX_TOLERANCE_BLOCKS * cliArgs.iterationLimit
+
+    # Start the subprocesses once. The pool is kept, if the simulation runs again.
+    if runMonteCarlo == True:
+        pool = __startPool(tensorArray, samplerSeed, cliArgs)
 
 # RUN MONTE-CARLO SIMULATION
 # The steps 1. and 2. will be performed by the function __monteCarlo(). Step 3. will be performed by this function.
@@ -132,95 +826,63 @@ def main(cliArgs):
 #                  Uniformly distributed random rotations are generated with James Arvo's Algorithm "Fast Random Rotation Matrices". See pdf file jamesArvoAlgorithm.pdf for the math.
 #               2. Compute the mueller matrix of the rotated raman tensor. For the math, see pdf file ramanMuellerMatrix.pdf.
 #               3. Compute the mean of all rotated mueller matrices and raman tensors. The mean will be computed by the main function.
-# The while loop gives the opportunity to run the simulatio again, if the validation of the simulation fails.
+# The while loop gives the opportunity to run the simulatio again, if the validation of the simulation fails or the tolerance is not reached.
     while( runMonteCarlo == True ):
         log.info("START MONTE CARLO SIMULATION")
 
         # !!!!! LOGGING IS OMITTED DURING THE SIMULATION DUE TO SEVERE PERFORMANCE ISSUES !!!!!!
 
-        # Build a generator that returns the tensorlist that will be passed to every iteration of the monte-carlo-simulation
-        processArgs = ( tensorlist for i in range(cliArgs.iterationLimit) )
-
-        # Create a pool of workers sharing the computation task
-        with multiprocessing.Pool(processes = cliArgs.processCount) as pool:
-
-            # Start child processes which run __monteCarlo()
-            # Each subprocess will be given a list of size chunksize. Each element of the list contains the list of all raman tensor.
-            # Each subprocess will therefore run the function __monteCarlo() cunksize times and passes the tensorlist to every function call.
-            # The computation will be slow if the chunksize is to big or to small
-            process = pool.imap_unordered(__monteCarlo, processArgs, chunksize = cliArgs.chunksize)
-
-            # Loop over all ready results, while the processes are still running
-            # process contains all rotated matrices
-            # tqdm prints a lovely progress bar
-            for result in tqdm( process, total = cliArgs.iterationLimit,
-                                         desc = "Processes " + str(cliArgs.processCount) ):
-                # Tally the results of all processes up and divide by the iteration limit to get the mean of all computations
-                convertedTensorlist = [ {"head"         : tensor["head"],
-                                         "muellerMatrix": np.add(convertedTensorlist[index]["muellerMatrix"], tensor["muellerMatrix"]/totalIterations),
-                                         "ramanTensor"  : np.add(convertedTensorlist[index]["ramanTensor"]  , tensor["ramanTensor"]  /totalIterations)
-                                        } for (index, tensor) in enumerate(result) ]
-
-        log.info("STOPPED MONTE CARLO SIMULATION SUCCESSFULLY")
-
-    #
-    #   VALIDATE THE SIMULATION
-    #   by comparing the depolarisation ratio of the molecular tensor and the labratory matrix
-    #   Source: Richard N. Zare: Angular Momentum, p.129
-    #
-
-        log.info("Validating monte-carlo-simulation via the depolarisation ratio.")
-
-        # Check every matrix
-        for initial, final in zip(tensorlist, convertedTensorlist):
+        # Run the next block of iterations
+        # The low-discrepancy sequences continue where the last block stopped. With a tolerance the last block stops at the iteration cap.
+        blocksize = cliArgs.iterationLimit
+        if cliArgs.tolerance != None:
+            blocksize = max(0, min(cliArgs.iterationLimit, maxIterations - accumulator.count))
+        try:
+            __runMonteCarlo(pool, accumulator, cliArgs.sampler, accumulator.count, blocksize, cliArgs, checkpoint)
+
+        except KeyboardInterrupt:
+            # Keep the iterations computed so far. The accumulator contains every finished chunk.
+            log.critical("The simulation was interrupted by the user after " + str(accumulator.count) + " iterations.")
+            pool.terminate()
+            if accumulator.count < 2:
+                log.critical("Nothing to save. TERMINATE EXECUTION.")
+                sys.exit(-1)
+            checkpoint()
+            partialResultWarning = "Interrupted by the user. The result did not pass the validation."
+            convertedTensorlist = summarise(tensorlist, estimate())
+            break
 
-            log.debug("Check matrix '" + initial["head"] + "'.")
+        # Save the state at the end of every block
+        checkpoint()
 
-            # Check if loop is comparing the right matrices
-            if initial["head"] != final["head"]:
-                log.critical("INTERNAL ERROR: The header of input and output matrices don't match! Error in input tensor '" + initial["head"] + "' and output matrix '" + final["head"] + "'." )
-                log.critical("TERMINATE EXECUTION.")
-                sys.exit(-1)
+        # Get the mean of all computations and its standard error
+        result = estimate()
+        convertedTensorlist = summarise(tensorlist, result)
 
-            # Compute eigenvalues of molecular tensor
-            try:
-                eigenvalues = np.linalg.eigvals(initial["matrix"])
+        log.info("STOPPED MONTE CARLO SIMULATION SUCCESSFULLY")
 
-            except LinAlgError as e:
-                # Eigenvalues do not converge. Log this issue and exit execution.
-                log.critical("The eigenvalue computation of the input raman tensor '" + initial["head"] + "' does not converge. Unable to validate monte-carlo-simulation!")
-                log.critical("TERMINATE EXECUTION.")
-                sys.exit(-1)
+        #
+        #   CHECK THE TOLERANCE
+        #   Keep computing without asking the user until every standard error is below the tolerance
+        #
+        if cliArgs.tolerance != None:
+            log.info("Largest standard error after " + str(accumulator.count) + " iterations: " + str(result.maxStandardError()))
+            if result.maxStandardError() >= cliArgs.tolerance:
+                if accumulator.count >= maxIterations:
+                    # Don't run forever, if the tolerance can't be reached
+                    log.critical("Tolerance " + str(cliArgs.tolerance) + " not reached after " + str(accumulator.count) + " iterations. Largest standard error: " + str(result.maxStandardError()))
+                    log.critical("The largest number of iterations is reached. The result will be written anyway.")
+                    partialResultWarning = "The tolerance " + str(cliArgs.tolerance) + " was not reached. Largest standard error: " + str(result.maxStandardError()) + "."
+                    break
+                log.info("Tolerance " + str(cliArgs.tolerance) + " not reached. Run Monte-Carlo-Simulation again.")
+                continue
 
-            # Compute depolarisation ratio of the inital tensor via the eigenvalues. See Richard N. Zare: "Angluar Momentum", p.129.
-            isotropicPolarisability = sum(eigenvalues)/3
-            anisotropicPolarisability_squared = ( (eigenvalues[0]-eigenvalues[1])**2 + (eigenvalues[1]-eigenvalues[2])**2 + (eigenvalues[2]-eigenvalues[0])**2 )/2
-            initialDepolarisationRatio = 3*anisotropicPolarisability_squared / ( 45*isotropicPolarisability**2 + 4*anisotropicPolarisability_squared )
-
-            log.debug("Initial Depolarisation Ratio: " + str(initialDepolarisationRatio))
-
-            # Compute the depolarisation ratio of the final mueller matrix via raman scattering in Mueller-Formalism. See Richard N. Zare: "Angluar Momentum", p.129.
-            # Compute light intensities along x- and y-axis via stokes parameter:
-            # I_x = S_0 + S_1
-            # I_y = S_0 - S_1
-            # depolarisationRatio = I_y / I_x ; if the incoming light is polarised along the x-axis.
-            incomingLight  = np.array([1,1,0,0])
-            scatteredLight = final["muellerMatrix"] @ incomingLight
-            finalDepolarisationRatio = (scatteredLight[0]-scatteredLight[1])/(scatteredLight[0]+scatteredLight[1])
-
-            log.debug("Final Depolarisation Ratio: " + str(finalDepolarisationRatio))
-
-            #
-            #   CHECK RESULTS
-            #
-            #   Give the user the opportunity to run the simulation
-            #   again and use the computation time that's been spent so far
-            #
-            if round(initialDepolarisationRatio, cliArgs.threshold) != round(finalDepolarisationRatio, cliArgs.threshold):
-                success = False
-                break
-            else:
-                success = True
+        #
+        #   VALIDATE THE SIMULATION
+        #   Give the user the opportunity to run the simulation
+        #   again and use the computation time that's been spent so far
+        #
+        success, head, initialDepolarisationRatio, finalDepolarisationRatio = validate(tensorlist, convertedTensorlist, cliArgs.threshold)
 
         #
         #   DECIDE TO CONTINUE OR END THE PROGRAM
@@ -228,46 +890,47 @@ def main(cliArgs):
         if success == True:
             # Simulation is valid exit while loop
             runMonteCarlo = False
-            log.info("Validation done.")
+
+        elif cliArgs.tolerance != None:
+            # The tolerance is reached, but the validation failed
+            # Don't block unattended runs. The standard errors in the output file show the accuracy of the result.
+            log.critical("Validation failed for matrix '" + head + "'!")
+            log.critical("Input: " + str(round(initialDepolarisationRatio, cliArgs.threshold)) + "      Simulation: " + str(round(finalDepolarisationRatio, cliArgs.threshold)))
+            log.critical("The tolerance is reached. The result will be written anyway. Check the standard errors in the output file.")
+            runMonteCarlo = False
 
         else:
             # The validation failed
-            log.critical("Validation failed for matrix '" + final["head"] + "'!")
+            log.critical("Validation failed for matrix '" + head + "'!")
             log.critical("Input: " + str(round(initialDepolarisationRatio, cliArgs.threshold)) + "      Simulation: " + str(round(finalDepolarisationRatio, cliArgs.threshold)))
             log.critical("Ask for user input. Should the simulation run again?")
             # Ask user if he/she wants to run more iterations and try the validation again
-            response = input("The simulation did " + str(totalIterations) + " iterations. Do you wish to compute another "
-                                + str(cliArgs.iterationLimit) + " iterations and try the validation again? [Y/n] ").lower()
+            # Ctrl-C or the end of the input stream count as no
+            try:
+                response = input("The simulation did " + str(accumulator.count) + " iterations. Do you wish to compute another "
+                                    + str(cliArgs.iterationLimit) + " iterations and try the validation again? [Y/n] ").lower()
+            except (KeyboardInterrupt, EOFError):
+                response = "n"
             log.critical("Users response: " + response)
             if response == "n":
                 # User wants to exit
-                log.critical("The user does not want to continue the computation.")
-                log.critical("TERMINATE EXECUTION.")
-                sys.exit(-1)
+                # Write the partial result anyway. The standard errors in the output file show the accuracy of the result.
+                log.critical("The user does not want to continue the computation. The result will be written anyway.")
+                partialResultWarning = "The result did not pass the validation for matrix '" + head + "'."
+                runMonteCarlo = False
             else:
                 # User wants to continue
+                # The accumulator is kept, so the mean will include the iterations done so far
                 runMonteCarlo = True
                 log.info("Run Monte-Carlo-Simulation again.")
-                # Save the number of computed iterations done so far
-                iterationsSoFar = totalIterations
-                # Compute new number of total iterations
-                totalIterations = iterationsSoFar + cliArgs.iterationLimit
-                # Rescale the calculated matrices.
-                # There is following problem:   The programm does not save a list of all computed matrices.
-                #                               It only saves the mean value. In order to use the current mean
-                #                               value of the matrices to compute the mean you get when doing more
-                #                               iterations, you have to multiply the matrices by the number of
-                #                               iterations done so far and divide it by the total number of
-                #                               iterations that will be done after rerunning the simulation.
-                log.info("Prepare rerun of simulation by rescaling the mueller matrices mean.")
-                scalingFactor = iterationsSoFar / totalIterations
-                convertedTensorlist = [ {"head"         : entry["head"],
-                                         "muellerMatrix": entry["muellerMatrix"] * scalingFactor,
-                                         "ramanTensor"  : entry["ramanTensor"]   * scalingFactor
-                                        } for entry in convertedTensorlist ]
 
 ##### END OF MONTE-CARLO-SIMULATIONS WHILE LOOP
 
+    # Stop the subprocesses
+    if cliArgs.exact == False:
+        pool.close()
+        pool.join()
+
 
 # CONVERT RESULTS TO TEXT
 
@@ -275,25 +938,42 @@ def main(cliArgs):
     output_text  = "# polaram convert " + str(cliArgs.tensorfile.resolve())
     output_text += " --output " + str(cliArgs.outputfile.resolve())
     output_text += " --log " + str(cliArgs.logfile.resolve())
-    output_text += " --iterations " + str(totalIterations)
+    if cliArgs.outputFormat != "text":
+        output_text += " --format " + cliArgs.outputFormat
+    if cliArgs.exact == True:
+        output_text += " --exact"
+    else:
+        output_text += " --iterations " + str(accumulator.count)
+        output_text += " --sampler " + cliArgs.sampler
+        output_text += " --seed " + str(samplerSeed)
+        if cliArgs.tolerance != None:
+            output_text += " --tolerance " + str(cliArgs.tolerance)
+            if cliArgs.maxIterations != None:
+                output_text += " --max-iterations " + str(cliArgs.maxIterations)
+        if cliArgs.checkpoint != None:
+            output_text += " --checkpoint " + str(cliArgs.checkpoint.resolve())
+        if cliArgs.controlVariates == True:
+            output_text += " --control-variates"
     output_text += " --threshold " + str(cliArgs.threshold)
     output_text += "\n# Execution time: " + str(datetime.now())
 
+    # Report the gain of the control variates
+    if cliArgs.exact == False and cliArgs.controlVariates == True:
+        output_text += "\n# Variance reduction factor of the control variates (depolarisation ratio): {:.3g}".format(varianceReduction(accumulator))
+
+    # Warn about partial results
+    if partialResultWarning != "":
+        output_text += "\n# WARNING: PARTIAL RESULT AFTER " + str(accumulator.count) + " ITERATIONS. " + partialResultWarning
+
     # Add user comment to string
     # Given via command line interface
     if cliArgs.comment != "":
         output_text += "\n\n# " + str(cliArgs.comment)
 
-    # Add the calculated matrices to the string. The matrices are formated like the tensor input file
-    for dict in convertedTensorlist:
-        # Print mean of mueller matrices
-        output_text += "\n\n! " + dict["head"] + "\n" + np.array2string(dict["muellerMatrix"], sign = None).replace("[[", "").replace(" [", "").replace("]", "")
-        # Print mean of raman tensors as comments
-        output_text += "\n\n#! " + dict["head"] + " (Mean Of Rotated Raman Tensors)\n" + np.array2string(dict["ramanTensor"], sign = None).replace("[[", "#").replace(" [", "#").replace("]", "")
-
-    # Log and write text to file
-    log.debug("Writing results to '" + str(cliArgs.outputfile.resolve()) + "':\n\n" + output_text + "\n")
-    print(output_text)
-    cliArgs.outputfile.write_text(output_text)
+    # Write the header and the results to file
+    # The matrices are formated like the tensor input file, one matrix at a time
+    log.info("Write results to '" + str(cliArgs.outputfile.resolve()) + "'.")
+    with ResultWriter(cliArgs.outputfile, cliArgs.outputFormat, echo = True) as writer:
+        writeResult(writer, output_text, convertedTensorlist)
 
     log.info("STOPPED RAMAN TENSOR CONVERSION SUCCESSFULLY")
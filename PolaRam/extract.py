@@ -3,6 +3,7 @@
 #
 # Purpose loggging
 import logging
+import logging.handlers
 # Enables logging with the logging module
 log = logging.getLogger(__name__)
 # Tells the logging module to ignore all logging message, if a program using this file does not use the logging module.
@@ -14,10 +15,27 @@ import sys
 # Math stuff and arrays
 import numpy as np
 
+# Parse strings line by line like files
+import io
+
+# Handle file paths
+import pathlib
+
+# Sidecar index of the sections of log files
+import json
+import hashlib
+import mmap
+
+# Parse several files in parallel
+import multiprocessing
+
+# Execution time in the manifest
+from datetime import datetime
+
 #
 #   INTERNAL MODULES
 #
-import utilities as util
+from ResultWriter import ResultWriter
 
 #
 #   MARKOS
@@ -31,141 +49,434 @@ TENSOR_KEYWORD = "Polarizability derivatives wrt mode"
 FREQUENCY_KEYWORD = "Frequencies -- "
 # This string marks the beginning of the meta data about the calculation: Gaussian version, date of execution, basis set, ...
 METADATA_KEYWORD = "******************************************\n Gaussian"
+# Number of lines of the raman tensor entries (keyword line, column header and three rows) and the meta data (including the keyword)
+TENSOR_LINES = 5
+METADATA_LINES = 10
+# Policies for log files without LOGFILE_KEYWORD or with imaginary frequencies. 'ask' is only possible for a single file.
+POLICIES = ["ask", "fail", "warn", "skip"]
+# Name of the summary of a batch extraction in the output directory
+MANIFEST_NAME = "manifest.csv"
+# The sidecar index of LOGFILE is written to LOGFILE + INDEX_SUFFIX. Indices of other versions are rebuilt.
+INDEX_SUFFIX  = ".index.json"
+INDEX_VERSION = 1
+# Number of bytes at the beginning and at the end of a log file that are hashed to recognise changed files
+INDEX_HASH_BYTES = 1048576
 
 
 
 #
-#   MAIN PROGRAM
+#   PARSER
 #
-def main(cliArgs):
+def __parseLines(lines):
     """
-    Read gaussian log files of frequency calculations and writes the raman tensors into a text file readable by the other scripts.
-    See the readMe for details.
+    Extracts the harmonic frequencies, the raman tensors and the meta data from the lines of a gaussian log file in a single pass.
+    Every line is read once and forgotten, only the entries that are still incomplete are kept. This way large log files don't need
+    to be loaded into memory and the time grows linearly with the size of the file.
+    States of the parser:   FREQUENCY_KEYWORD - the rest of the line contains three frequencies
+                            TENSOR_KEYWORD    - the rest of the line is the number of the mode, the next TENSOR_LINES-1 lines
+                                                contain a column header and the three rows of the raman tensor
+                            METADATA_KEYWORD  - spans two lines. The first METADATA_LINES lines starting at the keyword are the meta
+                                                data. Only the first occurence is read.
+    Should not be called outside of extract.py!
     Attributes:
-    cliArgs - object containing the command line arguments parsed in main.py
+    lines - iterable of the lines of the log file, e.g. an open file
+    Returns dictionary like parseLogfile() with the additional key
+        gaussianKeyword - True, if the file contains LOGFILE_KEYWORD
+    Raises ValueError, if the last raman tensor is incomplete
     """
+    metadataStart, metadataGaussian = METADATA_KEYWORD.split("\n")
+    frequencies     = []
+    tensorEntries   = []
+    metadata        = None
+    gaussianKeyword = False
+    # Entries of raman tensors which need more lines
+    pendingTensors  = []
+    previousLine    = ""
+
+    for line in lines:
+        line = line.rstrip("\n")
+
+        # Complete the entries found in the previous lines
+        if len(pendingTensors) > 0:
+            for entry in pendingTensors:
+                entry.append(line.strip())
+            while len(pendingTensors) > 0 and len(pendingTensors[0]) == TENSOR_LINES:
+                tensorEntries.append(pendingTensors.pop(0))
+        if metadata != None and len(metadata) < METADATA_LINES:
+            metadata.append(line.strip())
+
+        # Start new entries
+        # Every line with the keyword contains three frequencies
+        if FREQUENCY_KEYWORD in line:
+            frequencies += line.split(FREQUENCY_KEYWORD, 1)[1].split()
+        if TENSOR_KEYWORD in line:
+            pendingTensors.append([ line.split(TENSOR_KEYWORD, 1)[1].strip() ])
+        if LOGFILE_KEYWORD in line:
+            gaussianKeyword = True
+        if metadata == None and line.startswith(metadataGaussian) and previousLine.endswith(metadataStart):
+            metadata = [ metadataStart, line.strip() ]
+
+        previousLine = line
+
+    if len(pendingTensors) > 0:
+        log.critical("FATAL ERROR: The raman tensor of mode " + pendingTensors[0][0] + " is incomplete. Is the file corrupted?")
+        raise ValueError("The raman tensor of mode " + pendingTensors[0][0] + " is incomplete!")
+
+    # Convert the entries into matrices
+    # The first line of every entry contains the unique incrementing number of the mode
+    # Convert number formating 10D+1 into 10e+1
+    log.info("Extract tensors from file.")
+    try:
+        tensors = [ { "mode": int(entry[0]),
+                      "matrix": np.array([ row.replace("D", "e").split()[1:] for row in entry[2:] ]).astype(float)
+                    } for entry in tensorEntries ]
+    except:
+        # Log unexpected error
+        log.critical("UNKNWON ERROR: Unable to extract raman tensors from file. Is the file corrupted? Exiting.")
+        log.exception(sys.exc_info()[0])
+        raise
 
-    log.info("START RAMAN TENSOR EXTRACTION")
+    if len(frequencies) == 0:
+        log.warning("No harmonic frequencies found in log file.")
+    if metadata == None:
+        # No meta data is available
+        log.error("No meta information in log file available.")
 
-# READ AND CHECK DATA
+    return { "frequencies": frequencies, "tensors": tensors, "metadata": metadata, "gaussianKeyword": gaussianKeyword }
 
-    # Read gaussian log file
-    log.info("Read gaussian log file " + str(cliArgs.gaussianfile.resolve()))
-    gaussianfile = util.readFileAsText(cliArgs.gaussianfile)
+def __checkTensors(logfile):
+    """
+    Makes sure the parsed log file contains raman tensors.
+    Should not be called outside of extract.py!
+    Raises ValueError, if the file contains no raman tensors
+    """
+    if len(logfile["tensors"]) == 0:
+        raise ValueError("Keyword '" + TENSOR_KEYWORD + "' not found. The file does not contain raman tensors.")
+    return logfile
 
-    # Check if it is a gaussian log file with raman tensors
-    log.info("Check data")
+def parseLogfile(gaussianfile):
+    """
+    Extracts the harmonic frequencies, the raman tensors and the meta data from the text of a gaussian log file.
+    Used by extract.py and api.py.
+    Attributes:
+    gaussianfile - content of the gaussian log file as string
+    Returns dictionary with the keys
+        frequencies     - list of the harmonic frequencies as strings (imaginary frequencies are negative)
+        tensors         - list of dictionaries with the number of the mode ("mode", integer) and the raman tensor ("matrix", numpy.ndarray of shape (3,3))
+        metadata        - list of lines with meta data about the calculation or None, if the file contains no meta data
+        gaussianKeyword - True, if the file contains the keyword of raman calculations LOGFILE_KEYWORD
+    Raises ValueError, if the file contains no raman tensors
+    """
+    return __checkTensors( __parseLines(io.StringIO(gaussianfile)) )
 
-    if not LOGFILE_KEYWORD in gaussianfile:
-        # Key word not found, probably wrong file
-        log.warning("Keyword '" + LOGFILE_KEYWORD + "' not found in input file. May not contain raman tensors. Ask user for program termination.")
+def readLogfile(path, index = False):
+    """
+    Reads a gaussian log file line by line and extracts the harmonic frequencies, the raman tensors and the meta data like
+    parseLogfile() without loading the whole file into memory. Characters that are not valid UTF-8 (e.g. umlauts in paths of
+    windows machines) are replaced.
+    Used by extract.py and api.py.
+    Attributes:
+    path  - pathlib.Path of the gaussian log file
+    index - if True only the sections listed in the sidecar index are read. See loadIndex(). Default False.
+    Returns dictionary like parseLogfile()
+    Raises ValueError, if the file contains no raman tensors
+    """
+    return __checkTensors( __readSections(path, index) )
 
-        # Ask user if he wants to continiue execution
-        if bool(input("WARNING: This file is probably no gaussian log file or may not contain raman tensors. Continue anyway? [y/N] ").lower() != 'y'):
-            # Terminate program
-            print("As you wish, my Lord.")
-            log.info("USER STOPPED EXECUTION")
-            sys.exit(-1)
+def __readSections(path, index = False):
+    """
+    Parses a gaussian log file with __parseLines(). With the sidecar index only the sections with frequencies, raman tensors and meta
+    data are read from the memory mapped file, the rest of the file is skipped.
+    Should not be called outside of extract.py!
+    Attributes:
+    path  - pathlib.Path of the gaussian log file
+    index - use the sidecar index. Default False.
+    Returns dictionary like __parseLines()
+    """
+    if index == False:
+        with path.open(errors = "replace") as file:
+            return __parseLines(file)
+
+    sections = loadIndex(path)
+    # Sections close to each other may overlap: every line is given to the parser only once
+    ranges = []
+    for start, end in sorted( section for name in ["frequencies", "tensors", "metadata"] for section in sections[name] ):
+        if len(ranges) > 0 and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    def lines(data):
+        # Translate the line endings like a file opened in text mode
+        for start, end in ranges:
+            yield from io.StringIO(data[start:end].decode(errors = "replace"), newline = None)
+
+    if len(ranges) == 0:
+        logfile = __parseLines([])
+    else:
+        with path.open("rb") as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            logfile = __parseLines(lines(data))
+
+    # The keyword may be anywhere in the file
+    logfile["gaussianKeyword"] = logfile["gaussianKeyword"] or sections["gaussianKeyword"]
+    return logfile
+
+#
+#   SECTION INDEX
+#
+def __fileKey(path):
+    """
+    Describes the state of a log file, so changed files are recognised: size, modification time and the sha256 hash of the first
+    and last INDEX_HASH_BYTES bytes. Hashing the whole file would take as long as reading it.
+    Should not be called outside of extract.py!
+    Attributes:
+    path - pathlib.Path of the gaussian log file
+    Returns dictionary with the keys size, mtime and hash
+    """
+    stat = path.stat()
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        digest.update(file.read(INDEX_HASH_BYTES))
+        file.seek(max(stat.st_size - INDEX_HASH_BYTES, 0))
+        digest.update(file.read(INDEX_HASH_BYTES))
+    return { "size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest.hexdigest() }
+
+def __scanSections(data):
+    """
+    Finds the byte offsets of the sections read by __parseLines(). Every section is a list [start, end] of the bytes of the lines
+    starting at the line with the keyword: one line for FREQUENCY_KEYWORD, TENSOR_LINES lines for TENSOR_KEYWORD and METADATA_LINES
+    lines for the first METADATA_KEYWORD (starting one line above ' Gaussian'). The keywords are searched in the raw bytes, so the
+    lines between the sections are never split or decoded.
+    Should not be called outside of extract.py!
+    Attributes:
+    data - content of the gaussian log file as bytes or memory map
+    Returns dictionary with the keys frequencies, tensors, metadata (lists of sections) and gaussianKeyword
+    """
+    metadataStart, metadataGaussian = ( keyword.encode() for keyword in METADATA_KEYWORD.split("\n") )
+
+    def lineStart(position):
+        return data.rfind(b"\n", 0, position) + 1
+
+    def lineEnd(position, lines):
+        # End of the lines-th line starting with the line containing position
+        for _ in range(lines):
+            position = data.find(b"\n", position)
+            if position == -1:
+                return len(data)
+            position += 1
+        return position
+
+    def find(keyword):
+        # Position of the first occurence of the keyword in every line
+        position = data.find(keyword)
+        while position != -1:
+            yield position
+            position = data.find(keyword, lineEnd(position, 1))
+
+    sections = { "frequencies": [ [lineStart(position), lineEnd(position, 1)] for position in find(FREQUENCY_KEYWORD.encode()) ],
+                 "tensors":     [ [lineStart(position), lineEnd(position, TENSOR_LINES)] for position in find(TENSOR_KEYWORD.encode()) ],
+                 "metadata":    [],
+                 "gaussianKeyword": data.find(LOGFILE_KEYWORD.encode()) != -1 }
+
+    # The position is the end of the line above ' Gaussian'
+    for position in find(b"\n" + metadataGaussian):
+        if data[lineStart(position):position].rstrip(b"\r").endswith(metadataStart):
+            sections["metadata"].append([ lineStart(position), lineEnd(position + 1, METADATA_LINES - 1) ])
+            break
+
+    return sections
+
+def loadIndex(path):
+    """
+    Returns the byte offsets of the sections of a gaussian log file containing frequencies, raman tensors and meta data. The offsets
+    are stored in the sidecar file LOGFILE + INDEX_SUFFIX next to the log file. The sidecar file is created on the first call and
+    rebuilt, if the log file changed. Later calls only read the small sidecar file instead of scanning the whole log file.
+    If the sidecar file can't be written (e.g. read-only archives), the index is used without saving it.
+    Used by extract.py.
+    Attributes:
+    path - pathlib.Path of the gaussian log file
+    Returns dictionary with the keys
+        frequencies     - list of sections [start, end] (byte offsets) of the lines with FREQUENCY_KEYWORD
+        tensors         - list of sections of the raman tensors (TENSOR_LINES lines starting at TENSOR_KEYWORD)
+        metadata        - list with the section of the meta data (METADATA_LINES lines) or empty list
+        gaussianKeyword - True, if the file contains the keyword of raman calculations LOGFILE_KEYWORD
+    """
+    path = pathlib.Path(path)
+    indexfile = path.with_name(path.name + INDEX_SUFFIX)
+    key = __fileKey(path)
+
+    try:
+        index = json.loads(indexfile.read_text())
+        if index.get("version") == INDEX_VERSION and index.get("key") == key:
+            log.info("Read section index " + str(indexfile.resolve()))
+            return index["sections"]
+        log.info("Log file changed. Rebuild section index.")
+    except (FileNotFoundError, ValueError):
+        pass
+
+    log.info("Build section index of " + str(path.resolve()))
+    if key["size"] == 0:
+        sections = __scanSections(b"")
+    else:
+        with path.open("rb") as file, mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            sections = __scanSections(data)
+
+    try:
+        indexfile.write_text(json.dumps({ "version": INDEX_VERSION, "key": key, "sections": sections }))
+    except OSError as e:
+        log.warning("Can't write section index " + str(indexfile.resolve()) + ": " + str(e))
 
-        # Continue program
+    return sections
+
+#
+#   EXTRACTION OF ONE FILE
+#
+def __decide(policy, question):
+    """
+    Applies the policy for a problem of the log file. The policy 'ask' asks the user whether the extraction shall continue.
+    Should not be called outside of extract.py!
+    Attributes:
+    policy   - ask, fail, warn or skip. See POLICIES.
+    question - description of the problem shown to the user
+    Returns the policy. 'ask' is replaced by 'stop' or 'warn' depending on the answer of the user.
+    """
+    if policy != "ask":
+        return policy
+
+    # Ask user if he wants to continiue execution
+    if bool(input("WARNING: " + question + " Continue anyway? [y/N] ").lower() != 'y'):
+        # Terminate program
         print("As you wish, my Lord.")
-        log.info("Continue execution.")
+        log.info("USER STOPPED EXECUTION")
+        return "stop"
 
-    if not TENSOR_KEYWORD in gaussianfile:
-        # File does not contain raman tensors
-        log.warning("Keyword '" + TENSOR_KEYWORD + "' not found in input file. Can't find raman tensors.")
-        log.critical("This file does not contain raman tensors. Exiting program.")
-        log.info("RAMAN TENSOR EXTRACTION FAILED")
-        sys.exit(-1)
+    # Continue program
+    print("As you wish, my Lord.")
+    log.info("Continue execution.")
+    return "warn"
 
-# EXTRACT DATA
+def __isImaginary(frequency):
+    """
+    Gaussian writes imaginary frequencies as negative real numbers. Frequencies that are no numbers are treated as imaginary.
+    Should not be called outside of extract.py!
+    Attributes:
+    frequency - string from the log file
+    Returns True, if the frequency is imaginary
+    """
+    try:
+        return float(frequency) < 0
+    except ValueError:
+        return True
+
+def __extractFile(task):
+    """
+    Extracts the raman tensors of one gaussian log file and writes them into a tensor file. Problems of the log file are handled by the
+    policies instead of terminating the program, so the function can run in a subprocess.
+    Should not be called outside of extract.py!
+    Attributes:
+    task - tuple (gaussianfile, outputfile, comment, onMissingKeyword, onImaginary, index) with
+        gaussianfile     - pathlib.Path of the gaussian log file
+        outputfile       - pathlib.Path of the tensor file
+        comment          - user comment added to the tensor file
+        onMissingKeyword - policy if the file doesn't contain LOGFILE_KEYWORD: ask, fail or warn
+        onImaginary      - policy if the file contains imaginary frequencies: ask, fail, warn or skip (the modes are not written)
+        index            - read the file with the sidecar index. See loadIndex().
+    Returns tuple (summary, output_text) with
+        summary     - dictionary with the keys file, output, status (ok, warning, failed or stopped by the user), modes (number of
+                      written tensors), imaginary (number of modes with imaginary frequencies) and message. A row of the manifest.
+        output_text - content of the tensor file or None, if the extraction failed
+    """
+    gaussianfile, outputfile, comment, onMissingKeyword, onImaginary, index = task
+    summary = { "file": str(gaussianfile.resolve()), "output": "", "status": "ok", "modes": 0, "imaginary": 0, "message": "" }
+
+    def fail(status, message):
+        summary["status"]  = status
+        summary["message"] = message
+        return summary, None
 
-    log.info("Extract harmonic frequencies from file.")
+# READ AND CHECK DATA
+
+    # Read gaussian log file
+    # The file is parsed line by line, so the whole file is never held in memory
+    log.info("Read gaussian log file " + str(gaussianfile.resolve()))
     try:
-        # Read the harmonic frequencies from the log file
-        # Every entry util.findEntries returns contains three frequencies.
-        # Every triplett will be split into its elements and all frequencies are combined in a single flat list.
-        frequencylist = [freq for triplett in util.findEntries(gaussianfile, FREQUENCY_KEYWORD) for freq in triplett[0].split()]
+        logfile = __readSections(gaussianfile, index)
 
-        # Make sure all frequencies are real
-        # Gaussian writes imaginary frequencies as negative real numbers
-        for freq in frequencylist:
-            if float(freq) < 0:
-                raise ValueError
+    except FileNotFoundError:
+        return fail("failed", "File " + str(gaussianfile.resolve()) + " not found!")
+    except ValueError as e:
+        return fail("failed", str(e))
 
-    except ValueError:
-        # Handle imaginary frequencies
-        log.warning("File contains complex frequencies! Raman tensors might be wrong. Ask user for program termination.")
+    # Check if it is a gaussian log file with raman tensors
+    log.info("Check data")
 
-        # Ask user if he wants to continiue execution
-        if bool(input("WARNING: File contains complex frequencies! Raman tensors might be wrong. Continue anyway? [y/N] ").lower() != 'y'):
-            # Terminate program
-            print("As you wish, my Lord.")
-            log.info("USER STOPPED EXECUTION")
-            sys.exit(-1)
+    if logfile["gaussianKeyword"] == False:
+        # Key word not found, probably wrong file
+        log.warning("Keyword '" + LOGFILE_KEYWORD + "' not found in input file. May not contain raman tensors.")
+        decision = __decide(onMissingKeyword, "This file is probably no gaussian log file or may not contain raman tensors.")
+        if decision in ["fail", "stop"]:
+            return fail("failed" if decision == "fail" else "stopped", "Keyword '" + LOGFILE_KEYWORD + "' not found.")
+        summary["status"]  = "warning"
+        summary["message"] = "Keyword '" + LOGFILE_KEYWORD + "' not found."
+
+    if len(logfile["tensors"]) == 0:
+        # File does not contain raman tensors
+        log.warning("Keyword '" + TENSOR_KEYWORD + "' not found in input file. Can't find raman tensors.")
+        return fail("failed", "This file does not contain raman tensors.")
 
-        # Continue program
-        print("As you wish, my Lord.")
-        log.info("Continue execution.")
+# EXTRACT DATA
 
-    except:
-        # Handle unexpected errors
-        log.error("UNKNOWN ERROR: Unable to extract raman frequencies from file. Is the file corrupted? Continuing execution.")
-        log.exception(sys.exc_info()[0])
+    frequencylist = logfile["frequencies"] or []
 
     # Write function that returns elements of frequencylist
-    # If the program can't find the frequencies of the vibrational modes an exception will be raised
-    # Use function, not list frequencylist in case exceptions was raised and the frequencylist was
-    # therefore not defined and this function will return '??' instead
+    # If the program can't find the frequency of a vibrational mode this function will return '??' instead
     def frequency(mode_index):
         try:
             return frequencylist[mode_index]
-        except NameError:
+        except IndexError:
             return "??"
 
-    log.info("Extract tensors from file.")
-    try:
-        # Read tensor entries from string and convert them into matrices
-        # Find all tensors with util.findEntries()
-        # With the result of util.findEntries(): create a list of dictionaries containing a descriptive headder ("head") and the tensor as numpy float array ("matrix")
-        # The header will contain the unique incrementing number of the mode and the harmonix frequency of the mode
-        # Convert number formating 10D+1 into 10e+1
-        tensorlist = [ { "head": "v_" + tensor[0] + " = " + frequency( int(tensor[0])-1 ) + "/cm",
-                         "matrix": np.array([ tensor[2].replace("D", "e").split()[1:],
-                                              tensor[3].replace("D", "e").split()[1:],
-                                              tensor[4].replace("D", "e").split()[1:]  ]).astype(np.float)
-                       } for tensor in util.findEntries(gaussianfile, TENSOR_KEYWORD, lines = 5) ]
+    tensors = logfile["tensors"]
 
-    except:
-        # Log unexpected error
-        log.critical("UNKNWON ERROR: Unable to extract raman tensors from file. Is the file corrupted? Exiting.")
-        log.exception(sys.exc_info()[0])
-        raise
-
-    log.info("Extract meta data about computation.")
-    try:
-        # Read meta data like computation date, gaussian version or computation job
-        # Get only the first element of the generator returned by util.findEntries
-        metadata = next( util.findEntries(gaussianfile, METADATA_KEYWORD, lines = 10, returnKeyword = True) )
-
-    except StopIteration as e:
-        # Catch exception if no meta data is available
-        log.error("No meta information in log file available.")
-        metadata = ["NO META DATA IN GAUSSIAN .LOG-FILE " + str(cliArgs.gaussianfile.resolve())]
+    # Make sure all frequencies are real
+    imaginaryModes = [ tensor["mode"] for tensor in tensors if tensor["mode"] <= len(frequencylist) and __isImaginary(frequency(tensor["mode"]-1)) ]
+    summary["imaginary"] = len(imaginaryModes)
+    if len(imaginaryModes) > 0:
+        # Handle imaginary frequencies
+        log.warning("File contains complex frequencies! Raman tensors might be wrong.")
+        decision = __decide(onImaginary, "File contains complex frequencies! Raman tensors might be wrong.")
+        if decision in ["fail", "stop"]:
+            return fail("failed" if decision == "fail" else "stopped", "Imaginary frequencies of the modes " + ", ".join(map(str, imaginaryModes)) + ".")
+        if decision == "skip":
+            log.warning("Skip the modes " + ", ".join(map(str, imaginaryModes)) + ".")
+            tensors = [ tensor for tensor in tensors if tensor["mode"] not in imaginaryModes ]
+        summary["status"]  = "warning"
+        summary["message"] = " ".join(filter(None, [ summary["message"],
+                                                     ("Skipped" if decision == "skip" else "Imaginary frequencies of") + " the modes " + ", ".join(map(str, imaginaryModes)) + "." ]))
+
+    # Create a list of dictionaries containing a descriptive headder ("head") and the tensor as numpy float array ("matrix")
+    # The header will contain the unique incrementing number of the mode and the harmonix frequency of the mode
+    tensorlist = [ { "head": "v_" + str(tensor["mode"]) + " = " + frequency( tensor["mode"]-1 ) + "/cm",
+                     "matrix": tensor["matrix"]
+                   } for tensor in tensors ]
+
+    metadata = logfile["metadata"]
+    if metadata == None:
+        metadata = ["NO META DATA IN GAUSSIAN .LOG-FILE " + str(gaussianfile.resolve())]
 
 # WRITE RESULTS TO FILE
 
     log.info("Write results to file.")
     # Create string to write to file
-    output_text = "# Raman tensors calculated by Gaussian\n# Gaussian .LOG-file: " + str(cliArgs.gaussianfile.resolve()) + "\n\n# Gaussian calculation settings:"
+    output_text = "# Raman tensors calculated by Gaussian\n# Gaussian .LOG-file: " + str(gaussianfile.resolve()) + "\n\n# Gaussian calculation settings:"
 
     # Add meta data to output
     for line in metadata:
         output_text += "\n# " + line
 
     # Add user comment to string
-    if cliArgs.comment != "":
-        output_text += "\n\n# " + str(cliArgs.comment)
+    if comment != "":
+        output_text += "\n\n# " + str(comment)
 
     # Add tensors to output
     for tensor in tensorlist:
@@ -173,8 +484,144 @@ def main(cliArgs):
             output_text += "\n\n! " + tensor["head"] + "\n" + np.array2string(tensor["matrix"], sign = None).replace("[[", "").replace(" [", "").replace("]", "")
 
     # Log and write text to file
-    log.debug("Writing results to '" + str(cliArgs.outputfile.resolve()) + "':\n\n" + output_text + "\n")
-    print(output_text)
-    cliArgs.outputfile.write_text(output_text)
+    log.debug("Writing results to '%s':\n\n%s\n", outputfile.resolve(), output_text)
+    outputfile.write_text(output_text)
+
+    summary["output"] = str(outputfile.resolve())
+    summary["modes"]  = len(tensorlist)
+    return summary, output_text
+
+#
+#   BATCH EXTRACTION
+#
+# The log messages of a subprocess are collected by this handler and sent to the main process with the result of the file
+__workerLog = logging.handlers.BufferingHandler(capacity = sys.maxsize)
+
+def __initWorker(logLevel):
+    """
+    Initialises a subprocess of the pool. The handlers of the main process can't be used by the subprocess, so the log messages are
+    collected and logged by the main process.
+    Should not be called outside of extract.py!
+    Attributes:
+    logLevel - lowest level of the collected messages
+    """
+    root = logging.getLogger('')
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(__workerLog)
+    root.setLevel(logLevel)
+
+def __extractWorker(task):
+    """
+    Runs __extractFile() in a subprocess of the pool.
+    Should not be called outside of extract.py!
+    Attributes:
+    task - see __extractFile()
+    Returns tuple (summary, messages) with the summary of __extractFile() and the list of log messages (logger name, level, text)
+    """
+    summary, _ = __extractFile(task)
+    messages = [ (record.name, record.levelno, record.getMessage()) for record in __workerLog.buffer ]
+    __workerLog.buffer.clear()
+    return summary, messages
+
+def __extractBatch(tasks, jobs):
+    """
+    Extracts the raman tensors of several log files. With more than one job the files are parsed by a pool of subprocesses.
+    The summaries are returned in the order of the files.
+    Should not be called outside of extract.py!
+    Attributes:
+    tasks - list of tasks of __extractFile()
+    jobs  - number of subprocesses
+    Returns generator of the summaries of __extractFile()
+    """
+    if jobs == 1 or len(tasks) == 1:
+        for task in tasks:
+            yield __extractFile(task)[0]
+        return
+
+    log.info("Start " + str(min(jobs, len(tasks))) + " subprocesses.")
+    with multiprocessing.Pool(processes = min(jobs, len(tasks)), initializer = __initWorker, initargs = (logging.getLogger('').getEffectiveLevel(),)) as pool:
+        for (summary, messages), task in zip(pool.imap(__extractWorker, tasks), tasks):
+            # Log the messages of the subprocess with the name of the file
+            for name, level, message in messages:
+                logging.getLogger(name).log(level, "%s: %s", task[0].name, message)
+            yield summary
+
+#
+#   MAIN PROGRAM
+#
+def main(cliArgs):
+    """
+    Read gaussian log files of frequency calculations and writes the raman tensors into a text file readable by the other scripts.
+    Several log files are extracted into one tensor file per log file and a manifest (MANIFEST_NAME) in the output directory.
+    See the readMe for details.
+    Attributes:
+    cliArgs - object containing the command line arguments parsed in main.py
+    """
+
+    log.info("START RAMAN TENSOR EXTRACTION")
+
+    gaussianfiles = cliArgs.gaussianfiles
+
+    if len(gaussianfiles) == 1:
+        # Extract a single file. The user is asked about problems of the log file, if no policy is given.
+        outputfile = cliArgs.outputfile or pathlib.Path(__file__).parent / "res" / "molecularTensor.txt"
+        summary, output_text = __extractFile(( gaussianfiles[0], outputfile, cliArgs.comment,
+                                               cliArgs.onMissingKeyword or "ask", cliArgs.onImaginary or "ask", cliArgs.index ))
+
+        if summary["status"] == "stopped":
+            sys.exit(-1)
+        if summary["status"] == "failed":
+            log.critical("FATAL ERROR: " + summary["message"] + " Exiting program.")
+            log.info("RAMAN TENSOR EXTRACTION FAILED")
+            sys.exit(-1)
+
+        print(output_text)
+        log.info("STOPPED RAMAN TENSOR EXTRACTION SUCCESSFULLY")
+        return
+
+    # Extract several files. Nobody can answer questions in a batch run, so problems are handled by the policies (default fail).
+    outputdir = cliArgs.outputfile or pathlib.Path(__file__).parent / "res"
+    if outputdir.exists() and not outputdir.is_dir():
+        log.critical("FATAL ERROR: The output path '" + str(outputdir.resolve()) + "' must be a directory, if several files are extracted!")
+        sys.exit(-1)
+    outputdir.mkdir(parents = True, exist_ok = True)
+
+    # Every log file gets a tensor file with the same name
+    names = [ path.stem for path in gaussianfiles ]
+    duplicates = sorted({ name for name in names if names.count(name) > 1 })
+    if len(duplicates) > 0:
+        log.critical("FATAL ERROR: Several log files have the name " + ", ".join(duplicates) + ". The tensor files would overwrite each other!")
+        sys.exit(-1)
+
+    tasks = [ ( path, outputdir / (path.stem + ".txt"), cliArgs.comment,
+                "fail" if cliArgs.onMissingKeyword in [None, "ask"] else cliArgs.onMissingKeyword,
+                "fail" if cliArgs.onImaginary in [None, "ask"] else cliArgs.onImaginary, cliArgs.index ) for path in gaussianfiles ]
+
+    log.info("Extract " + str(len(tasks)) + " files with " + str(cliArgs.jobs) + " jobs.")
+    summaries = []
+    for summary in __extractBatch(tasks, cliArgs.jobs):
+        summaries.append(summary)
+        print(summary["status"].upper().ljust(8) + summary["file"] + ( " (" + summary["message"] + ")" if summary["message"] != "" else "" ))
+        if summary["status"] == "failed":
+            log.error(summary["file"] + ": " + summary["message"])
+
+# WRITE MANIFEST
+
+    manifest = outputdir / MANIFEST_NAME
+    log.info("Write manifest to '" + str(manifest.resolve()) + "'.")
+    header = "# Raman tensors extracted by polaram extract\n# Execution time: " + str(datetime.now())
+    if cliArgs.comment != "":
+        header += "\n\n# " + str(cliArgs.comment)
+    with ResultWriter(manifest, "csv") as writer:
+        writer.comment(header)
+        writer.rows(["File", "Output", "Status", "Modes", "ImaginaryModes", "Message"],
+                    [ [ summary["file"], summary["output"], summary["status"], summary["modes"], summary["imaginary"], summary["message"] ] for summary in summaries ])
+
+    failed = sum( summary["status"] == "failed" for summary in summaries )
+    if failed > 0:
+        log.critical(str(failed) + " of " + str(len(summaries)) + " files failed. See " + str(manifest.resolve()))
+        log.info("RAMAN TENSOR EXTRACTION FAILED")
+        sys.exit(-1)
 
     log.info("STOPPED RAMAN TENSOR EXTRACTION SUCCESSFULLY")
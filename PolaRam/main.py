@@ -3,6 +3,8 @@
 #
 # Purpose loggging
 import logging
+import logging.handlers
+import queue
 
 # Purpose: CLI
 import argparse
@@ -10,19 +12,20 @@ import argparse
 # Handling file paths
 import pathlib
 
-# Math stuff
-import numpy as np
-
-# Get current version from git tags
-from git import Repo
-# Execute "git describe --tags" in the folder of the currently running file
-__version__ =  Repo( str(pathlib.Path(__file__).parents[0]) ).git.execute(["git", "describe", "--tags"])
-
 #
 #   INTERNAL MODULES
 #
-import simulate, list, convert, extract
+# The modules of the subcommands are imported when the subcommand is run. Importing them here would slow down every call of
+# polaram, because they import tqdm, multiprocessing and scipy. The version is read from git only if the user asks for it.
 import utilities as util
+import ResultWriter
+
+#
+#   MAKROS
+#
+
+# Levels of the messages written into the log file
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
 
 #
 #   START OF PROGRAM EXECUTION AS MAIN PROGRAM
@@ -37,7 +40,7 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser(prog = "polaram",
                                  description = "PolaRam simulates the influence of a raman active sample and the optical elements of the measurement setup on the polarisation of the laser. The calculations are performed with the mueller calculus and stokes vectors.",
                                  epilog = "Author: Jonas Eichhorn; License: MIT; Date: Okt.2020")
-    ap.add_argument('--version', "-v", action='version', version="%(prog)s " + __version__)
+    ap.add_argument('--version', "-v", action = util.gitVersion)
     sap = ap.add_subparsers(dest = "command", metavar = "subcommand")
     sap.required = True
 
@@ -58,6 +61,13 @@ if __name__ == "__main__":
                               help = "defines path and name of a custom .log file. Default=PROGRAMPATH/log/muellersimulation.log",
                               dest = "logfile",
                               type = util.filepath)
+    # Add log level
+    sap_simulate.add_argument("-ll", "--log-level",
+                              required = False,
+                              default = "INFO",
+                              choices = LOG_LEVELS,
+                              help = "lowest level of the messages written into the .log file. DEBUG slows down large computations. Default=INFO",
+                              dest = "logLevel")
     # Add input file for labratory setup
     sap_simulate.add_argument("inputfile",
                               help = "text file containing the labratory setup that needs to be simulated. Details are given in the README.",
@@ -67,7 +77,7 @@ if __name__ == "__main__":
                               required = False,
                               default = str(pathlib.Path(__file__).parent) + "/unitmatrix.txt",
                               dest = "matrixfile",
-                              help = "text file containing the raman matrices of the sample in the labratory cordinate system. Details are given in the README.",
+                              help = "text file or matrix store (see polaram pack) containing the raman matrices of the sample in the labratory cordinate system. Details are given in the README.",
                               type = util.filepath)
     # Add path to output file
     sap_simulate.add_argument("-o", "--output",
@@ -102,24 +112,68 @@ if __name__ == "__main__":
                                default = True,
                                required = False,
                                help = "if enabled the final output will be only written to file and not printed on the screen")
+    sap_simulate.add_argument("-f", "--format",
+                              dest = "outputFormat",
+                              required = False,
+                              default = "text",
+                              choices = ResultWriter.FORMATS,
+                              help = "format of the output file. 'text' writes the commented text format (see --raw-output), 'csv' a table with one row per state, 'npy' the array of the final states and 'npz' all arrays of the result. The binary formats can't be appended. Default=text")
     sap_simulate.add_argument("-lsr", "--laser",
                               dest = "laser",
                               action = util.stokesvectorlist,
-                              help = "the initial polarisation state of the simulation, encoded as stokes parameters. It is possible to pass more than one stokes vector by using the flag multiple times. Default=1 1 0 0",
-                              default = [np.array([1., 1., 0., 0.])] )
+                              help = "the initial polarisation state of the simulation, encoded as stokes parameters. It is possible to pass more than one stokes vector by using the flag multiple times. Default=1 1 0 0, if neither --laser, --laser-file nor --laser-grid is given",
+                              default = None )
+    sap_simulate.add_argument("-lf", "--laser-file",
+                              dest = "laserFiles",
+                              metavar = "LASERFILE",
+                              action = "append",
+                              type = util.filepath,
+                              default = [],
+                              help = "file containing initial stokes vectors: a text file with four stokes parameters per line (separated by spaces or commas) or a numpy file (.npy) with an array of shape (lasers, 4). The file is read piece by piece. The flag can be used multiple times.")
+    sap_simulate.add_argument("-lg", "--laser-grid",
+                              dest = "laserGrids",
+                              metavar = "GRID",
+                              action = "append",
+                              default = [],
+                              help = "generates initial stokes vectors: 'linear:START:STOP:STEP' all linear polarisations from START to STOP in degrees, 'poincare:COUNT' COUNT fully polarised states evenly distributed on the poincaré sphere. The flag can be used multiple times.")
+    sap_simulate.add_argument("-cs", "--chunk-size",
+                              dest = "chunksize",
+                              type = util.positiveInt,
+                              default = None,
+                              help = "number of initial stokes vectors simulated at once. Smaller chunks need less memory. Use the npy or npz format to write large simulations without holding the result in memory. Default=as many stokes vectors as fit into one million states")
     sap_simulate.add_argument("-u", "--unpolarised-scattering",
                               dest = "allowUnpolarisedRamanScattering",
                               action = "store_true",
                               default = False,
                               required = False,
                               help = "if enabled unpolarised stokes vectors won't cause an exception when simulating the raman scattering. Use this option with care! Enabling this flag makes only sense in some specific cases. See the README for details.")
+    sap_simulate.add_argument("-t", "--trace",
+                              dest = "tracefile",
+                              type = util.filepath,
+                              required = False,
+                              default = None,
+                              help = "writes the states after every step of the simulation as numpy arrays into this npz file instead of writing them as text into the .log file. See the README for details.")
+    # The choices are Simulation.CHECKS. Importing Simulation would slow down every call of polaram.
+    sap_simulate.add_argument("--check",
+                              dest = "checkPolicy",
+                              required = False,
+                              default = "every-step",
+                              choices = ["every-step", "final", "smp-only", "off"],
+                              help = "when the states of the simulation are checked. 'every-step' checks the states in front of every SMP instruction and the states after every compiled step, 'final' the states in front of every SMP instruction and the final states, 'smp-only' only the states in front of every SMP instruction and 'off' nothing. Use 'off' only for setups that are known to be valid! Default=every-step")
+    sap_simulate.add_argument("--tolerance",
+                              dest = "checkTolerance",
+                              metavar = "TOLERANCE",
+                              type = float,
+                              required = False,
+                              default = 5e-8,
+                              help = "largest deviation of the polarisation grade, S3 and S0 from the allowed values, that is accepted as floating point error by the checks. Default=5e-8")
 
 	# Create list command
     sap_list = sap.add_parser("list",
                                   help = "Lists all instruction polaram simulate can decode",
                                   description = "This program lists all instructions that can be used to describe a simulation. For details see the documentation on the simulate subprogramm.")
     # The subcommand list does not need any arguments, but the logging setup expects default values
-    # for the logfile path and the verbose flag.
+    # for the logfile path, the log level and the verbose flag.
     # Add logfile (copied from sap_simulate)
     sap_list.add_argument("-l", "--log",
                               required = False,
@@ -128,6 +182,13 @@ if __name__ == "__main__":
                               help = argparse.SUPPRESS,
                               dest = "logfile",
                               type = util.filepath)
+    # Add log level (copied from sap_simulate)
+    sap_list.add_argument("-ll", "--log-level",
+                              required = False,
+                              default = "INFO",
+                              # argparse.SUPPRESS hides this argument in the help text
+                              help = argparse.SUPPRESS,
+                              dest = "logLevel")
     # Add verbose (copied from sap_simulate)
     sap_list.add_argument("-v", "--verbose",
                               required = False,
@@ -154,9 +215,16 @@ if __name__ == "__main__":
                              help = "defines path and name of a custom .log file. Default=PROGRAMPATH/log/convertRamanTensor.log",
                              dest = "logfile",
                              type = util.filepath)
+    # Add log level (copied from sap_simulate)
+    sap_convert.add_argument("-ll", "--log-level",
+                             required = False,
+                             default = "INFO",
+                             choices = LOG_LEVELS,
+                             help = "lowest level of the messages written into the .log file. DEBUG slows down large computations. Default=INFO",
+                             dest = "logLevel")
     # Add input file for labratory setup
     sap_convert.add_argument("tensorfile",
-                             help = "text file containing the raman tensors that will be converted. Details are given in the README.",
+                             help = "text file or matrix store (see polaram pack) containing the raman tensors that will be converted. Details are given in the README.",
                              type = util.filepath)
     # Add iteration limit for monte carlo simulation
     sap_convert.add_argument("-i", "--iterations",
@@ -190,15 +258,145 @@ if __name__ == "__main__":
     sap_convert.add_argument("-s", "--cunksize",
                              dest = "chunksize",
                              required = False,
+                             default = 20000,
+                             type = util.positiveInt,
+                             help = "number of iterations each subprocess computes and reduces before it sends the result to the main process. Default=20000")
+    sap_convert.add_argument("-b", "--batchsize",
+                             dest = "batchsize",
+                             required = False,
                              default = 500,
                              type = util.positiveInt,
-                             help = "length of array each subprocess is given to calculate. Default=500")
+                             help = "number of iterations each subprocess computes at once as one vectorised batch. Default=500")
     sap_convert.add_argument("-t", "--threshold",
                              dest = "threshold",
                              required = False,
                              default = 2,
                              type = util.positiveInt,
                              help = "number of digits the depolarisation ratio before and after the monte-carlo-simulation must match for the result to pass validation. Default=2")
+    sap_convert.add_argument("--tolerance",
+                             dest = "tolerance",
+                             required = False,
+                             default = None,
+                             type = util.positiveFloat,
+                             help = "if given the simulation runs blocks of ITERATIONLIMIT iterations until the standard error of every element of the mean mueller matrices and raman tensors is smaller than the tolerance. The user won't be asked to rerun the simulation. Default=None")
+    sap_convert.add_argument("--max-iterations",
+                             dest = "maxIterations",
+                             required = False,
+                             default = None,
+                             type = util.positiveInt,
+                             help = "largest number of iterations computed to reach the tolerance. If the tolerance is not reached, the result is written with a warning and the largest standard error. Only used with --tolerance. Default=100*ITERATIONLIMIT")
+    sap_convert.add_argument("--sampler",
+                             dest = "sampler",
+                             required = False,
+                             default = "random",
+                             # The names of the samplers are listed in convert.SAMPLERS
+                             choices = ["random", "halton", "sobol"],
+                             help = "generator of the random rotations. 'random' uses pseudo-random numbers, 'halton' and 'sobol' use scrambled low-discrepancy sequences (quasi-monte-carlo) which converge faster. 'sobol' needs scipy. Default=random")
+    sap_convert.add_argument("--seed",
+                             dest = "seed",
+                             required = False,
+                             default = None,
+                             type = util.positiveInt,
+                             help = "seed of the sampler. The same seed, iteration count, chunk size and batch size give identical results for any number of processes. Default=random seed")
+    sap_convert.add_argument("--checkpoint",
+                             dest = "checkpoint",
+                             required = False,
+                             default = None,
+                             type = util.filepath,
+                             help = "path of a checkpoint file (.npz). The state of the simulation is saved to this file every minute, after every run of ITERATIONLIMIT iterations and on interrupts. Default=None")
+    sap_convert.add_argument("--resume",
+                             dest = "resume",
+                             action = "store_true",
+                             default = False,
+                             required = False,
+                             help = "if enabled the simulation continues from the checkpoint given with --checkpoint and computes another ITERATIONLIMIT iterations.")
+    sap_convert.add_argument("--shard",
+                             dest = "shard",
+                             required = False,
+                             default = None,
+                             type = util.shard,
+                             help = "run only the part K of a simulation split into N parts (format K/N) and write the partial result to OUTPUTFILE (.npz). The shard computes the iterations (K-1)*ITERATIONLIMIT to K*ITERATIONLIMIT-1. All shards need the same seed. Combine the shards with 'polaram merge'. Default=None")
+    sap_convert.add_argument("--control-variates",
+                             dest = "controlVariates",
+                             action = "store_true",
+                             default = False,
+                             required = False,
+                             help = "if enabled the mean of the simulation is corrected with control variates whose exact mean is known. This reduces the variance of the elements determining the depolarisation ratio. The variance reduction factor is written into the output file. See the README for details.")
+    sap_convert.add_argument("--compare-samplers",
+                             dest = "compareSamplers",
+                             action = "store_true",
+                             default = False,
+                             required = False,
+                             help = "if enabled the simulation runs once with every sampler and the same number of iterations and prints the errors compared to the exact average. No output file is written.")
+    sap_convert.add_argument("-f", "--format",
+                             dest = "outputFormat",
+                             required = False,
+                             default = "text",
+                             choices = ResultWriter.FORMATS,
+                             help = "format of the output file. 'text' writes the matrix format read by 'polaram simulate', 'csv' a table with one row per matrix element, 'npy' the array of the mueller matrices and 'npz' all arrays of the result. Default=text")
+    sap_convert.add_argument("-e", "--exact",
+                             dest = "exact",
+                             action = "store_true",
+                             default = False,
+                             required = False,
+                             help = "if enabled the mean over all rotations is computed in closed form from the rotational invariants of the raman tensors instead of running the monte-carlo-simulation. See the README for details.")
+
+    # Create merge command
+    sap_merge = sap.add_parser("merge",
+                               help = "Merge the shards of a simulation computed with 'polaram convert --shard'.",
+                               description = "This program merges the partial results written by 'polaram convert --shard K/N' into one result, validates it and writes it in the same format as 'polaram convert'. See the readMe for details.")
+    # Adding arguments to merge command
+    # Add verbose
+    sap_merge.add_argument("-v", "--verbose",
+                           required = False,
+                           help = "runs programm and shows status and error messages",
+                           action = "store_true")
+    # Add logfile (default defined)
+    sap_merge.add_argument("-l", "--log",
+                           required = False,
+                           default = str(pathlib.Path(__file__).parent) + "/log/mergeShards.log",
+                           help = "defines path and name of a custom .log file. Default=PROGRAMPATH/log/mergeShards.log",
+                           dest = "logfile",
+                           type = util.filepath)
+    # Add log level (copied from sap_simulate)
+    sap_merge.add_argument("-ll", "--log-level",
+                           required = False,
+                           default = "INFO",
+                           choices = LOG_LEVELS,
+                           help = "lowest level of the messages written into the .log file. DEBUG slows down large computations. Default=INFO",
+                           dest = "logLevel")
+    # Add input files
+    sap_merge.add_argument("shardfiles",
+                           help = "the shard files written by 'polaram convert --shard'",
+                           nargs = "+",
+                           type = util.filepath)
+    # Add path to output file
+    sap_merge.add_argument("-o", "--output",
+                           help = "path to output file. Default=PROGRAMMPATH/res/labratoryMuellerMatrix.txt",
+                           required = False,
+                           default = str(pathlib.Path(__file__).parent) + "/res/labratoryMuellerMatrix.txt",
+                           dest = "outputfile",
+                           type = util.filepath)
+    # Add argument that will be written as comment in the output file
+    sap_merge.add_argument("-c", "--comment",
+                           dest = "comment",
+                           help = "comment that will be added to the output file",
+                           required = False,
+                           action = util.joinString,
+                           nargs = "*",
+                           default = "")
+    sap_merge.add_argument("-t", "--threshold",
+                           dest = "threshold",
+                           required = False,
+                           default = 2,
+                           type = util.positiveInt,
+                           help = "number of digits the depolarisation ratio before and after the monte-carlo-simulation must match for the result to pass validation. Default=2")
+    sap_merge.add_argument("-f", "--format",
+                           dest = "outputFormat",
+                           required = False,
+                           default = "text",
+                           choices = ResultWriter.FORMATS,
+                           help = "format of the output file. Same formats as 'polaram convert --format'. Default=text")
 
     # Create extract command
     sap_extract = sap.add_parser("extract",
@@ -217,17 +415,51 @@ if __name__ == "__main__":
                              help = "defines path and name of a custom .log file. Default=PROGRAMPATH/log/extractGaussianTensor.log",
                              dest = "logfile",
                              type = util.filepath)
-    # Add input file for gaussian log file
-    sap_extract.add_argument("gaussianfile",
-                             help = "the log file of a gaussian frequency calculation",
-                             type=util.filepath)
+    # Add log level (copied from sap_simulate)
+    sap_extract.add_argument("-ll", "--log-level",
+                             required = False,
+                             default = "INFO",
+                             choices = LOG_LEVELS,
+                             help = "lowest level of the messages written into the .log file. DEBUG slows down large computations. Default=INFO",
+                             dest = "logLevel")
+    # Add input files for gaussian log files
+    sap_extract.add_argument("gaussianfiles",
+                             metavar = "gaussianfile",
+                             help = "the log files of gaussian frequency calculations. Several files are extracted into one tensor file per log file and a manifest.",
+                             nargs = "+",
+                             type = util.filepath)
     # Add path to output file
     sap_extract.add_argument("-o", "--output",
-                             help = "path to output file. Default=PROGRAMPATH/res/molecularTensor.txt",
+                             help = "path to output file. Path to the output directory, if several files are extracted. Default=PROGRAMPATH/res/molecularTensor.txt or PROGRAMPATH/res/",
                              required = False,
-                             default = str(pathlib.Path(__file__).parent) + "/res/molecularTensor.txt",
+                             default = None,
                              dest = "outputfile",
                              type = util.filepath)
+    # Add number of processes parsing the log files
+    sap_extract.add_argument("-j", "--jobs",
+                             dest = "jobs",
+                             help = "number of processes that extract several files in parallel. Default=1",
+                             required = False,
+                             default = 1,
+                             type = util.positiveInt)
+    # Add policies replacing the questions to the user
+    sap_extract.add_argument("--on-imaginary",
+                             dest = "onImaginary",
+                             help = "what to do with files containing imaginary frequencies: ask the user, fail, warn or skip the imaginary modes. Default=ask for a single file, fail for several files",
+                             required = False,
+                             default = None,
+                             choices = ["ask", "fail", "warn", "skip"])
+    sap_extract.add_argument("--on-missing-keyword",
+                             dest = "onMissingKeyword",
+                             help = "what to do with files that are probably no gaussian log files of raman calculations: ask the user, fail or warn. Default=ask for a single file, fail for several files",
+                             required = False,
+                             default = None,
+                             choices = ["ask", "fail", "warn"])
+    # Add sidecar index of the sections of the log files
+    sap_extract.add_argument("--index",
+                             dest = "index",
+                             help = "read only the sections with frequencies, raman tensors and meta data listed in a sidecar index file (LOGFILE.index.json). The index is created on the first read and rebuilt if the log file changes.",
+                             action = "store_true")
     # Add argument that will be written as comment in the output file
     sap_extract.add_argument("-c", "--comment",
                              dest = "comment",
@@ -238,6 +470,56 @@ if __name__ == "__main__":
                              default = "")
 
 
+    # Create pack and unpack command
+    sap_pack = sap.add_parser("pack",
+                              help = "Pack a text file with matrices into a binary matrix store, that is read without parsing.",
+                              description = "This program converts a text file with raman mueller matrices or raman tensors into a binary matrix store. 'polaram simulate --matrix' and 'polaram convert' memory map the store instead of parsing the text on every run. See the readMe for details.")
+    sap_unpack = sap.add_parser("unpack",
+                                help = "Unpack a binary matrix store written by 'polaram pack' into a text file.",
+                                description = "This program writes the matrices of a binary matrix store written by 'polaram pack' into a text file with all digits. See the readMe for details.")
+    # Adding arguments to both commands
+    for subparser, name in [(sap_pack, "pack"), (sap_unpack, "unpack")]:
+        # Add verbose
+        subparser.add_argument("-v", "--verbose",
+                               required = False,
+                               help = "runs programm and shows status and error messages",
+                               action = "store_true")
+        # Add logfile (default defined)
+        subparser.add_argument("-l", "--log",
+                               required = False,
+                               default = str(pathlib.Path(__file__).parent) + "/log/" + name + "Matrices.log",
+                               help = "defines path and name of a custom .log file. Default=PROGRAMPATH/log/" + name + "Matrices.log",
+                               dest = "logfile",
+                               type = util.filepath)
+        # Add log level (copied from sap_simulate)
+        subparser.add_argument("-ll", "--log-level",
+                               required = False,
+                               default = "INFO",
+                               choices = LOG_LEVELS,
+                               help = "lowest level of the messages written into the .log file. DEBUG slows down large computations. Default=INFO",
+                               dest = "logLevel")
+    # Add input files
+    sap_pack.add_argument("matrixfile",
+                          help = "text file containing matrices of the same shape, e.g. the raman mueller matrices of 'polaram simulate --matrix' or the raman tensors of 'polaram convert'",
+                          type = util.filepath)
+    sap_unpack.add_argument("storefile",
+                            help = "matrix store written by 'polaram pack'",
+                            type = util.filepath)
+    # Add path to output file
+    sap_pack.add_argument("-o", "--output",
+                          help = "path to the matrix store. Default=MATRIXFILE with the suffix " + util.MATRIX_STORE_SUFFIX,
+                          required = False,
+                          default = None,
+                          dest = "outputfile",
+                          type = util.filepath)
+    sap_unpack.add_argument("-o", "--output",
+                            help = "path to the text file. Default=STOREFILE with the suffix .txt",
+                            required = False,
+                            default = None,
+                            dest = "outputfile",
+                            type = util.filepath)
+
+
     # Store command line arguments
     cliArgs = ap.parse_args()
 
@@ -246,13 +528,10 @@ if __name__ == "__main__":
     #
     # Logs to file and to console (to console only if verbose activated)
     # Set config for logfile
-    logging.basicConfig(level=logging.DEBUG,
-                        format='%(asctime)s : %(name)s : %(levelname)s : %(message)s',
-                        datefmt='%Y-%m-%d %H:%M:%S',
-                        filename= cliArgs.logfile.resolve(),
-                        filemode='a')
+    logfile = logging.FileHandler(cliArgs.logfile.resolve(), mode = "a")
+    logfile.setFormatter(logging.Formatter('%(asctime)s : %(name)s : %(levelname)s : %(message)s', datefmt = '%Y-%m-%d %H:%M:%S'))
 
-    # Define a Handler which writes DEBUG messages or higher to the sys.stderr, if the commandline flag -v is given
+    # Define a Handler which writes INFO messages or higher to the sys.stderr, if the commandline flag -v is given
     # If the verbose flag is not given only CRITICAL messages will go to sys.stderr
     console = logging.StreamHandler()
     if cliArgs.verbose:
@@ -264,8 +543,15 @@ if __name__ == "__main__":
     formatter = logging.Formatter('%(message)s')
     # Tell the handler to use this format
     console.setFormatter(formatter)
-    # Add the handler to the root logger
-    logging.getLogger('').addHandler(console)
+
+    # The loggers only put the messages into a queue. A background thread formats them and writes them to the log file and the
+    # console, so writing the log file doesn't slow down the computation. Messages below the log level are not created at all.
+    # The subprocesses of polaram convert don't log, so the queue doesn't need to be shared between processes.
+    logQueue = queue.SimpleQueue()
+    logging.getLogger('').setLevel(cliArgs.logLevel)
+    logging.getLogger('').addHandler(logging.handlers.QueueHandler(logQueue))
+    logListener = logging.handlers.QueueListener(logQueue, logfile, console, respect_handler_level = True)
+    logListener.start()
 
     # Create a logger
     log = logging.getLogger(__name__)
@@ -273,18 +559,42 @@ if __name__ == "__main__":
     #
     # RUN SELECTED COMMAND
     #
-    if cliArgs.command == "simulate":
-        # Run simulate.py
-        simulate.main(cliArgs)
+    # The messages in the queue are written, when the program stops (also on exceptions and sys.exit)
+    try:
+        if cliArgs.command == "simulate":
+            # Run simulate.py
+            import simulate
+            simulate.main(cliArgs)
+
+        elif cliArgs.command == "list":
+            # Run list.py
+            import list
+            list.main()
+
+        elif cliArgs.command == "convert":
+            # Run convert.py
+            import convert
+            convert.main(cliArgs)
+
+        elif cliArgs.command == "extract":
+            # Run extract.py
+            import extract
+            extract.main(cliArgs)
+
+        elif cliArgs.command == "merge":
+            # Run merge.py
+            import merge
+            merge.main(cliArgs)
 
-    elif cliArgs.command == "list":
-        # Run list.py
-        list.main()
+        elif cliArgs.command == "pack":
+            # Run pack.py
+            import pack
+            pack.main(cliArgs)
 
-    elif cliArgs.command == "convert":
-        # Run convert.py
-        convert.main(cliArgs)
+        elif cliArgs.command == "unpack":
+            # Run the unpack function of pack.py
+            import pack
+            pack.unpack(cliArgs)
 
-    elif cliArgs.command == "extract":
-        # Run extract.py
-        extract.main(cliArgs)
+    finally:
+        logListener.stop()
@@ -0,0 +1,148 @@
+#
+#   EXTERNAL LIBARIES
+#
+# Purpose loggging
+import logging
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this file does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+# Terminate program on exception
+import sys
+
+# Math stuff and arrays
+import numpy as np
+
+# Get time and date for output file
+from datetime import datetime
+
+#
+#   INTERNAL MODULES
+#
+import convert
+from Accumulator import Accumulator
+from ResultWriter import ResultWriter
+
+#
+#   MAIN PROGRAM
+#
+def main(cliArgs):
+    """
+    Merges the shard files written by 'polaram convert --shard K/N' into one result. The means and variances of the shards are
+    combined weighted by their iteration counts. The result is validated and written in the same format as the output of 'polaram convert'.
+    See the readMe for details.
+    Attributes:
+    cliArgs - object containing the command line arguments parsed in main.py
+    """
+
+    log.info("START MERGING SHARDS")
+
+# READ AND CHECK DATA
+
+    shards = []
+    for path in cliArgs.shardfiles:
+        log.info("Read shard " + str(path.resolve()))
+        try:
+            accumulator, metadata = Accumulator.load(path)
+            shards.append({ "path"       : path,
+                            "accumulator": accumulator,
+                            "seed"       : int(metadata["seed"]),
+                            "sampler"    : str(metadata["sampler"]),
+                            "heads"      : list(metadata["heads"]),
+                            "tensors"    : metadata["tensors"],
+                            "shard"      : int(metadata["shard"]),
+                            "shardCount" : int(metadata["shardCount"]),
+                            "offset"     : int(metadata["offset"]),
+                            # Number of control variates. See polaram convert --control-variates
+                            "controlVariates": accumulator.controlMean.shape[-1] })
+        except (OSError, KeyError, ValueError) as e:
+            log.critical("FATAL ERROR: '" + str(path.resolve()) + "' is no shard file written by 'polaram convert --shard'. Exiting execution.")
+            log.exception(e, exc_info = True)
+            sys.exit(-1)
+
+    # All shards must be parts of the same simulation
+    reference = shards[0]
+    for shard in shards[1:]:
+        for key in ["seed", "sampler", "heads", "shardCount", "controlVariates"]:
+            if shard[key] != reference[key]:
+                log.critical("FATAL ERROR: The shards '" + str(reference["path"]) + "' and '" + str(shard["path"]) + "' belong to different simulations (different " + key + "). Exiting execution.")
+                sys.exit(-1)
+        if not np.array_equal(shard["tensors"], reference["tensors"]):
+            log.critical("FATAL ERROR: The shards '" + str(reference["path"]) + "' and '" + str(shard["path"]) + "' belong to different simulations (different raman tensors). Exiting execution.")
+            sys.exit(-1)
+
+    # The shards must compute disjoint iterations, otherwise some rotations would be counted twice
+    shards.sort(key = lambda shard : shard["offset"])
+    for previous, shard in zip(shards[:-1], shards[1:]):
+        if previous["offset"] + previous["accumulator"].count > shard["offset"]:
+            log.critical("FATAL ERROR: The shards '" + str(previous["path"]) + "' and '" + str(shard["path"]) + "' contain the same iterations. Exiting execution.")
+            sys.exit(-1)
+
+    # Missing shards don't falsify the result, but the result contains less iterations than planned
+    missingShards = sorted( set(range(1, reference["shardCount"] + 1)) - set( shard["shard"] for shard in shards ) )
+    if len(missingShards) > 0:
+        log.warning("The shards " + ", ".join( str(index) + "/" + str(reference["shardCount"]) for index in missingShards ) + " are missing.")
+
+# MERGE SHARDS
+
+    log.info("Merge " + str(len(shards)) + " shards.")
+    accumulator = Accumulator(*reference["accumulator"].controlMean.shape)
+    for shard in shards:
+        accumulator.merge(shard["accumulator"])
+    log.info("Total number of iterations: " + str(accumulator.count))
+
+    tensorlist = [ { "head": head, "matrix": matrix } for head, matrix in zip(reference["heads"], reference["tensors"]) ]
+
+    # Correct the means with the control variates, if the shards were computed with --control-variates
+    controlVariates = accumulator.controlMean.shape[-1] > 0
+    if controlVariates:
+        result = accumulator.applyControlVariates(convert.controlExpectation(reference["tensors"]))
+        log.info("Variance reduction factor of the control variates: " + str(convert.varianceReduction(accumulator)))
+    else:
+        result = accumulator
+    convertedTensorlist = convert.summarise(tensorlist, result)
+
+# VALIDATE RESULT
+
+    success, head, initialDepolarisationRatio, finalDepolarisationRatio = convert.validate(tensorlist, convertedTensorlist, cliArgs.threshold)
+    if success == False:
+        # Write the result anyway. The standard errors in the output file show the accuracy of the result.
+        log.critical("Validation failed for matrix '" + head + "'!")
+        log.critical("Input: " + str(round(initialDepolarisationRatio, cliArgs.threshold)) + "      Simulation: " + str(round(finalDepolarisationRatio, cliArgs.threshold)))
+        log.critical("The result will be written anyway. Compute more shards and merge them again to improve the result.")
+
+# WRITE RESULTS TO FILE
+
+    log.info("Write results to file.")
+    # Write the commandline parameters and the execution time in a string
+    output_text  = "# polaram merge " + " ".join( str(shard["path"].resolve()) for shard in shards )
+    output_text += " --output " + str(cliArgs.outputfile.resolve())
+    output_text += " --log " + str(cliArgs.logfile.resolve())
+    output_text += " --threshold " + str(cliArgs.threshold)
+    if cliArgs.outputFormat != "text":
+        output_text += " --format " + cliArgs.outputFormat
+    output_text += "\n# Execution time: " + str(datetime.now())
+    output_text += "\n# Shards: " + str(len(shards)) + "/" + str(reference["shardCount"]) + "    Iterations: " + str(accumulator.count) + "    Sampler: " + reference["sampler"] + "    Seed: " + str(reference["seed"])
+
+    # Report the gain of the control variates
+    if controlVariates:
+        output_text += "\n# Variance reduction factor of the control variates (depolarisation ratio): {:.3g}".format(convert.varianceReduction(accumulator))
+
+    # Warn about missing shards and failed validations
+    if len(missingShards) > 0:
+        output_text += "\n# WARNING: THE SHARDS " + ", ".join( str(index) for index in missingShards ) + " ARE MISSING."
+    if success == False:
+        output_text += "\n# WARNING: The result did not pass the validation for matrix '" + head + "'."
+
+    # Add user comment to string
+    if cliArgs.comment != "":
+        output_text += "\n\n# " + str(cliArgs.comment)
+
+    # Write the header and the results to file
+    # The matrices are formated like the tensor input file, one matrix at a time
+    log.info("Write results to '" + str(cliArgs.outputfile.resolve()) + "'.")
+    with ResultWriter(cliArgs.outputfile, cliArgs.outputFormat, echo = True) as writer:
+        convert.writeResult(writer, output_text, convertedTensorlist)
+
+    log.info("STOPPED MERGING SHARDS SUCCESSFULLY")
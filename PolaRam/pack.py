@@ -0,0 +1,108 @@
+#
+#   EXTERNAL LIBARIES
+#
+# Purpose loggging
+import logging
+# Enables logging with the logging module
+log = logging.getLogger(__name__)
+# Tells the logging module to ignore all logging message, if a program using this file does not use the logging module.
+log.addHandler(logging.NullHandler())
+
+# Terminate program on exception
+import sys
+
+# Get time and date for output file
+from datetime import datetime
+
+#
+#   INTERNAL MODULES
+#
+import utilities as util
+
+#
+#   MAKROS
+#
+
+# Number of matrices formatted at once by 'polaram unpack'
+UNPACK_CHUNK = 10000
+
+#
+#   HELPER FUNCTIONS
+#
+def formatMatrices(heads, matrices):
+    """
+    Formats matrices in the syntax of the matrix files: a header line starting with '!' followed by one line per row. The numbers are
+    written with all digits, so reading the text gives the same matrices.
+    Attributes:
+    heads    - list of descriptive headers
+    matrices - numpy.ndarray of shape (matrices, rows, columns)
+    Returns string
+    """
+    rows, columns = matrices.shape[1:]
+    # One format string for all matrices. str(float) is the shortest string that is read as the same number.
+    template = "\n! %s\n" + ( " ".join(["%r"] * columns) + "\n" ) * rows
+    return "".join( template % ((head,) + tuple(matrix)) for head, matrix in zip(heads, matrices.reshape(len(matrices), -1).tolist()) )
+
+#
+#   MAIN PROGRAM
+#
+def main(cliArgs):
+    """
+    Packs a text file with matrices into a binary matrix store, that is memory mapped by 'polaram simulate --matrix' and 'polaram convert'.
+    The text is parsed once and not on every run. See the readMe for details.
+    Attributes:
+    cliArgs - object containing the command line arguments parsed in main.py
+    """
+
+    log.info("START PACKING MATRICES")
+
+    outputfile = cliArgs.outputfile if cliArgs.outputfile != None else cliArgs.matrixfile.with_suffix(util.MATRIX_STORE_SUFFIX)
+
+    log.info("Read " + str(cliArgs.matrixfile.resolve()))
+    try:
+        heads, matrices = util.readFileAsArray(cliArgs.matrixfile)
+    except IndexError as e:
+        log.critical("FATAL ERROR: All matrices of a matrix store must have the same shape. " + str(e) + " Exiting execution.")
+        sys.exit(-1)
+
+    log.info("Write " + str(len(heads)) + " matrices of shape " + str(matrices.shape[1:]) + " to " + str(outputfile.resolve()))
+    try:
+        util.writeMatrixStore(outputfile, heads, matrices)
+    except ValueError as e:
+        log.critical("FATAL ERROR: " + str(e) + " Exiting execution.")
+        sys.exit(-1)
+
+    log.info("STOPPED PACKING MATRICES SUCCESSFULLY")
+
+def unpack(cliArgs):
+    """
+    Writes the matrices of a matrix store written by 'polaram pack' back into a text file. See the readMe for details.
+    Attributes:
+    cliArgs - object containing the command line arguments parsed in main.py
+    """
+
+    log.info("START UNPACKING MATRICES")
+
+    outputfile = cliArgs.outputfile if cliArgs.outputfile != None else cliArgs.storefile.with_suffix(".txt")
+
+    log.info("Read " + str(cliArgs.storefile.resolve()))
+    try:
+        heads, matrices = util.readMatrixStore(cliArgs.storefile)
+    except (OSError, ValueError) as e:
+        log.critical("FATAL ERROR: '" + str(cliArgs.storefile.resolve()) + "' can't be unpacked: " + str(e) + " Exiting execution.")
+        sys.exit(-1)
+
+    output_text  = "# polaram unpack " + str(cliArgs.storefile.resolve())
+    output_text += " --output " + str(outputfile.resolve())
+    output_text += " --log " + str(cliArgs.logfile.resolve())
+    output_text += "\n# Execution time: " + str(datetime.now())
+    output_text += "\n# Matrices: " + str(len(heads)) + "    Shape: " + str(matrices.shape[1:]) + "\n"
+
+    log.info("Write " + str(len(heads)) + " matrices to " + str(outputfile.resolve()))
+    # The matrices are formatted in chunks, so the text of large stores is never held in memory at once
+    with open(outputfile, "w") as file:
+        file.write(output_text)
+        for start in range(0, len(heads), UNPACK_CHUNK):
+            file.write(formatMatrices(heads[start:start+UNPACK_CHUNK], matrices[start:start+UNPACK_CHUNK]))
+
+    log.info("STOPPED UNPACKING MATRICES SUCCESSFULLY")
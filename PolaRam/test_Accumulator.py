@@ -0,0 +1,141 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import class that shall be tested
+from Accumulator import Accumulator
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary files for the checkpoints
+import tempfile
+import pathlib
+
+
+class TestAccumulator_Merge(unittest.TestCase):
+    """
+    Test the add and merge methods of Accumulator
+    """
+
+    def test_output(self):
+        """
+        Make sure batches merged in any order give the mean and standard error of all samples
+        """
+        rng = np.random.default_rng(0)
+        mueller = rng.normal(size = (1000, 3, 4, 4))
+        raman   = rng.normal(size = (1000, 3, 3, 3))
+
+        # Fill one accumulator per batch of unequal size and merge them in reversed order
+        batches = []
+        for start, stop in [(0, 1), (1, 250), (250, 1000)]:
+            batch = Accumulator(3)
+            batch.add(mueller[start:stop], raman[start:stop])
+            batches.append(batch)
+        result = Accumulator(3)
+        for batch in reversed(batches):
+            result.merge(batch)
+
+        self.assertEqual(result.count, 1000)
+        np.testing.assert_allclose(result.muellerMean, mueller.mean(axis = 0))
+        np.testing.assert_allclose(result.ramanMean, raman.mean(axis = 0))
+        np.testing.assert_allclose(result.muellerStandardError(), mueller.std(axis = 0, ddof = 1) / np.sqrt(1000))
+        np.testing.assert_allclose(result.ramanStandardError(), raman.std(axis = 0, ddof = 1) / np.sqrt(1000))
+
+    def test_empty(self):
+        """
+        Make sure empty accumulators don't change the result and have an infinite standard error
+        """
+        result = Accumulator(2)
+        self.assertTrue( np.all(np.isinf(result.muellerStandardError())) )
+
+        result.add(np.ones((5, 2, 4, 4)), np.ones((5, 2, 3, 3)))
+        result.merge(Accumulator(2))
+        self.assertEqual(result.count, 5)
+        np.testing.assert_array_equal(result.muellerMean, np.ones((2, 4, 4)))
+        self.assertEqual(result.maxStandardError(), 0)
+
+    def test_types(self):
+        """
+        Make sure type and value errors are raised if necessary
+        """
+        self.assertRaises(TypeError, Accumulator, 1.0)
+        self.assertRaises(TypeError, Accumulator, "string")
+        self.assertRaises(TypeError, Accumulator(2).merge, "string")
+        self.assertRaises(ValueError, Accumulator(2).merge, Accumulator(3))
+        self.assertRaises(ValueError, Accumulator(2).add, np.ones((5, 3, 4, 4)), np.ones((5, 3, 3, 3)))
+
+class TestAccumulator_Save(unittest.TestCase):
+    """
+    Test the save and load methods of Accumulator
+    """
+
+    def test_output(self):
+        """
+        Make sure a saved accumulator and its metadata are loaded without changes
+        """
+        rng = np.random.default_rng(1)
+        result = Accumulator(2)
+        result.add(rng.normal(size = (10, 2, 4, 4)), rng.normal(size = (10, 2, 3, 3)))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "checkpoint.npz"
+            result.save(path, seed = str(2**100), heads = ["v_1", "v_2"])
+            loaded, metadata = Accumulator.load(path)
+
+        self.assertEqual(loaded.count, 10)
+        np.testing.assert_array_equal(loaded.muellerM2, result.muellerM2)
+        np.testing.assert_array_equal(loaded.ramanMean, result.ramanMean)
+        self.assertEqual(int(metadata["seed"]), 2**100)
+        self.assertEqual(list(metadata["heads"]), ["v_1", "v_2"])
+
+class TestAccumulator_ControlVariates(unittest.TestCase):
+    """
+    Test the control variates of Accumulator
+    """
+
+    def test_merge(self):
+        """
+        Make sure merged co-moments of the control variates match the co-moments of all samples
+        """
+        rng = np.random.default_rng(2)
+        mueller  = rng.normal(size = (500, 2, 4, 4))
+        raman    = rng.normal(size = (500, 2, 3, 3))
+        controls = rng.normal(size = (500, 2, 2))
+
+        result = Accumulator(2, 2)
+        for start, stop in [(0, 100), (100, 101), (101, 500)]:
+            result.add(mueller[start:stop], raman[start:stop], controls[start:stop])
+
+        controlDeviation = controls - controls.mean(axis = 0)
+        np.testing.assert_allclose(result.controlMean, controls.mean(axis = 0))
+        np.testing.assert_allclose(result.controlM2, np.einsum("nmc,nmd->mcd", controlDeviation, controlDeviation))
+        np.testing.assert_allclose(result.muellerControlM2, np.einsum("nmij,nmc->mijc", mueller - mueller.mean(axis = 0), controlDeviation))
+
+        self.assertRaises(ValueError, result.merge, Accumulator(2))
+        self.assertRaises(ValueError, result.add, mueller, raman)
+
+    def test_output(self):
+        """
+        Make sure the control variates remove the part of the samples that is linear in the controls
+        """
+        rng = np.random.default_rng(3)
+        controls = rng.normal(size = (2000, 1, 2)) + 5
+        noise    = 0.01 * rng.normal(size = (2000, 1, 4, 4))
+        # Every element is 1 + 2*(c_0 - 5) - (c_1 - 5) + noise with exact mean 1
+        mueller  = 1 + 2*(controls[...,0] - 5)[...,np.newaxis,np.newaxis] - (controls[...,1] - 5)[...,np.newaxis,np.newaxis] + noise
+        raman    = np.ones((2000, 1, 3, 3))
+
+        result = Accumulator(1, 2)
+        result.add(mueller, raman, controls)
+        corrected = result.applyControlVariates(np.full((1, 2), 5.))
+
+        np.testing.assert_allclose(corrected.muellerMean, 1 + noise.mean(axis = 0), atol = 1e-3)
+        np.testing.assert_allclose(corrected.muellerStandardError(), 0.01 / np.sqrt(2000), rtol = 0.2)
+        self.assertEqual(corrected.controlMean.shape, (1, 0))
+        # Only the first control variate is used, the second one is only collected
+        np.testing.assert_allclose(result.applyControlVariates(np.full((1, 1), 5.)).muellerM2, result.muellerM2 - result.muellerControlM2[...,0]**2 / result.controlM2[:,0,0])
+        self.assertRaises(ValueError, result.applyControlVariates, np.zeros((2, 2)))
@@ -0,0 +1,112 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import LaserSource as LS
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary laser files
+import tempfile
+import pathlib
+
+
+class TestLaserSource(unittest.TestCase):
+    """
+    Test the class LaserSource
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        self.lasers = np.array([[1., 1., 0., 0.], [1., 0., 1., 0.], [2., 0., 0., 1.], [1., -1., 0., 0.], [1., 0.5, 0., 0.]])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def collect(self, source, size):
+        # Join all chunks and make sure the start index of every chunk is correct
+        chunks = list(source.chunks(size))
+        self.assertTrue(all( len(vectors) <= size for _, vectors in chunks ))
+        self.assertEqual([ start for start, _ in chunks ], list(np.cumsum([0] + [ len(vectors) for _, vectors in chunks ])[:-1]))
+        return np.concatenate([ vectors for _, vectors in chunks ])
+
+    def test_files(self):
+        """
+        Make sure text and numpy laser files are read in chunks
+        """
+        (self.path / "lasers.txt").write_text("# Comment\n1 1 0 0\n1, 0, 1, 0\n\n2 0 0 1 # circular\n1 -1 0 0\n1 0.5 0 0\n")
+        np.save(self.path / "lasers.npy", self.lasers)
+
+        for name in ["lasers.txt", "lasers.npy"]:
+            source = LS.LaserSource()
+            source.addFile(self.path / name)
+            self.assertEqual(len(source), 5)
+            for size in [1, 2, 5, 100]:
+                np.testing.assert_array_equal(self.collect(source, size), self.lasers)
+
+        # Wrong number of stokes parameters
+        (self.path / "wrong.txt").write_text("1 1 0 0\n1 1 0\n")
+        source = LS.LaserSource()
+        source.addFile(self.path / "wrong.txt")
+        self.assertRaises(ValueError, self.collect, source, 10)
+        np.save(self.path / "wrong.npy", np.ones((2, 3)))
+        self.assertRaises(ValueError, LS.LaserSource().addFile, self.path / "wrong.npy")
+
+    def test_grids(self):
+        """
+        Make sure the grids generate fully polarised stokes vectors
+        """
+        source = LS.LaserSource()
+        source.addGrid("linear:0:180:22.5")
+        linear = self.collect(source, 4)
+        self.assertEqual(linear.shape, (9, 4))
+        np.testing.assert_allclose(linear[[0, 2, 4]], [[1, 1, 0, 0], [1, 0, 1, 0], [1, -1, 0, 0]], atol = 1e-12)
+        np.testing.assert_allclose(linear[:,3], 0)
+
+        source = LS.LaserSource()
+        source.addGrid("poincare:1000")
+        sphere = self.collect(source, 300)
+        self.assertEqual(sphere.shape, (1000, 4))
+        np.testing.assert_allclose(np.sum(sphere[:,1:]**2, axis = 1), 1)
+        # The points are evenly distributed: the mean of the sphere is its centre
+        np.testing.assert_allclose(sphere[:,1:].mean(axis = 0), 0, atol = 1e-2)
+
+        self.assertRaises(ValueError, LS.LaserSource().addGrid, "linear:0")
+        self.assertRaises(ValueError, LS.LaserSource().addGrid, "poincare:a")
+        self.assertRaises(ValueError, LS.LaserSource().addGrid, "poincare:0")
+        self.assertRaises(ValueError, LS.LaserSource().addGrid, "circular:0:90:1")
+        self.assertRaises(TypeError, LS.LaserSource().addGrid, 42)
+
+    def test_sources(self):
+        """
+        Make sure the sources are handed out in order and invalid stokes vectors raise exceptions
+        """
+        source = LS.LaserSource()
+        source.addVectors(self.lasers[:2])
+        source.addGrid("linear:0:90:45")
+        source.addVectors([1, 0, 0, 1])
+        self.assertEqual(len(source), 6)
+        chunks = list(source.chunks(2))
+        # Chunks don't span two sources
+        self.assertEqual([ start for start, _ in chunks ], [0, 2, 4, 5])
+        np.testing.assert_allclose(chunks[3][1], [[1, 0, 0, 1]])
+
+        self.assertRaises(ValueError, LS.LaserSource().addVectors, [-1, 0, 0, 0])
+        self.assertRaises(ValueError, LS.LaserSource().addVectors, [1, 1, 1, 0])
+        self.assertRaises(ValueError, lambda : list(source.chunks(0)))
+
+        # The error message names the invalid stokes vector of the file
+        (self.path / "lasers.txt").write_text("1 1 0 0\n1 1 0 0\n1 1 1 0\n")
+        source = LS.LaserSource()
+        source.addFile(self.path / "lasers.txt")
+        with self.assertRaisesRegex(ValueError, "number 3 of the laser file"):
+            list(source.chunks(2))
+
+if __name__ == '__main__':
+    unittest.main()
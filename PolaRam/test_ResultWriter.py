@@ -0,0 +1,143 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import ResultWriter as RW
+import convert
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary output files
+import tempfile
+import pathlib
+
+
+class TestResultWriter(unittest.TestCase):
+    """
+    Test the class ResultWriter
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_types(self):
+        """
+        Make sure unknown formats and appending binary files raise exceptions
+        """
+        self.assertRaises(ValueError, RW.ResultWriter, self.path / "out", "xlsx")
+        self.assertRaises(ValueError, RW.ResultWriter, self.path / "out", "text", "r")
+        self.assertRaises(ValueError, RW.ResultWriter, self.path / "out", "npz", "a")
+        with self.assertRaises(ValueError):
+            with RW.ResultWriter(self.path / "out.csv", "csv") as writer:
+                writer.rows(["a"], [[1]])
+                writer.rows(["b"], [[1]])
+
+    def test_text(self):
+        """
+        Make sure the text pieces are written in order and can be appended
+        """
+        for writeMode in ["w", "a"]:
+            with RW.ResultWriter(self.path / "out.txt", "text", writeMode) as writer:
+                writer.comment("# header\n")
+                writer.text("body")
+                writer.rows(["a"], [[1]])
+                writer.array("a", [1], main = True)
+        self.assertEqual((self.path / "out.txt").read_text(), "# header\nbody# header\nbody")
+
+    def test_csv(self):
+        """
+        Make sure the csv format contains the header as comment, one header row and numbers with all digits
+        """
+        with RW.ResultWriter(self.path / "out.csv", "csv") as writer:
+            writer.comment("# header")
+            writer.text("ignored")
+            writer.rows(["Name", "Value"], [["a", 1/3]])
+            writer.rows(["Name", "Value"], [["b", np.float64(2)]])
+        self.assertEqual((self.path / "out.csv").read_text(), "# header\nName,Value\na,0.3333333333333333\nb,2.0\n")
+
+    def test_binary(self):
+        """
+        Make sure the npy format contains the main array and the npz format all arrays. Nothing is written, if an exception occurs.
+        """
+        for format in ["npy", "npz"]:
+            with RW.ResultWriter(self.path / ("out." + format), format) as writer:
+                writer.comment("# header")
+                writer.array("states", np.eye(4), main = True)
+                writer.array("heads", ["a", "b"])
+        np.testing.assert_array_equal(np.load(self.path / "out.npy"), np.eye(4))
+        with np.load(self.path / "out.npz") as npz:
+            np.testing.assert_array_equal(npz["states"], np.eye(4))
+            self.assertEqual(list(npz["heads"]), ["a", "b"])
+            self.assertEqual(str(npz["comment"]), "# header")
+
+        with self.assertRaises(KeyError):
+            with RW.ResultWriter(self.path / "broken.npz", "npz") as writer:
+                writer.array("states", np.eye(4))
+                raise KeyError
+        self.assertFalse((self.path / "broken.npz").exists())
+
+    def test_allocate(self):
+        """
+        Make sure arrays can be written piece by piece without holding them in memory. The files are removed, if an exception occurs.
+        """
+        for format in RW.FORMATS:
+            with RW.ResultWriter(self.path / ("out." + format), format) as writer:
+                stored = writer.allocate("states", (2, 5, 4), main = True)
+                self.assertEqual(stored, format in ["npy", "npz"])
+                self.assertEqual(writer.allocate("lasers", (5, 4)), format == "npz")
+                for start in range(0, 5, 2):
+                    writer.fill("states", np.s_[:, start:start+2], np.full((2, min(2, 5 - start), 4), start))
+                    writer.fill("lasers", np.s_[start:start+2], np.eye(4)[:min(2, 5 - start)])
+                writer.array("heads", ["a", "b"])
+        expected = np.repeat([0., 0., 2., 2., 4.], 4).reshape(1, 5, 4).repeat(2, axis = 0)
+        np.testing.assert_array_equal(np.load(self.path / "out.npy"), expected)
+        with np.load(self.path / "out.npz") as npz:
+            np.testing.assert_array_equal(npz["states"], expected)
+            np.testing.assert_array_equal(npz["lasers"][4], [1, 0, 0, 0])
+            self.assertEqual(list(npz["heads"]), ["a", "b"])
+        # Only the output files are left
+        self.assertEqual(sorted( path.name for path in self.path.iterdir() ), ["out.csv", "out.npy", "out.npz", "out.text"])
+
+        for format in ["npy", "npz"]:
+            with self.assertRaises(KeyError):
+                with RW.ResultWriter(self.path / ("broken." + format), format) as writer:
+                    writer.allocate("states", (2, 4), main = True)
+                    raise KeyError
+        self.assertFalse(any( path.name.startswith(("broken", ".broken")) for path in self.path.iterdir() ))
+
+    def test_convert(self):
+        """
+        Make sure the results of polaram convert are written in every format
+        """
+        tensors = np.array([ np.diag([1., 2., 3.]), np.diag([1., -1., 0.]) ])
+        mueller, raman = convert.exactAverage(tensors)
+        convertedTensorlist = [ { "head": head, "muellerMatrix": m, "ramanTensor": r } for head, m, r in zip(["v_1", "v_2"], mueller, raman) ]
+
+        for format in RW.FORMATS:
+            with RW.ResultWriter(self.path / ("out." + format), format) as writer:
+                convert.writeResult(writer, "# header", convertedTensorlist)
+
+        self.assertEqual((self.path / "out.text").read_text(), "# header" + convert.formatResult(convertedTensorlist))
+        np.testing.assert_array_equal(np.load(self.path / "out.npy"), mueller)
+        with np.load(self.path / "out.npz") as npz:
+            np.testing.assert_array_equal(npz["ramanTensors"], raman)
+            self.assertEqual(list(npz["heads"]), ["v_1", "v_2"])
+            self.assertNotIn("muellerMatrixErrors", npz.files)
+        # One row per element of every mueller matrix and raman tensor
+        rows = [ line.split(",") for line in (self.path / "out.csv").read_text().splitlines()[1:] ]
+        self.assertEqual(rows[0], ["Head", "Quantity", "Row", "Column", "Value"])
+        self.assertEqual(len(rows), 1 + 2 * (16 + 9))
+        self.assertEqual(rows[1][:4], ["v_1", "MuellerMatrix", "1", "1"])
+        self.assertAlmostEqual(float(rows[1][4]), mueller[0,0,0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -527,3 +527,123 @@ class TestSetupDecoder_Decode(unittest.TestCase):
         for line in self.typeErrorInput:
             with self.assertRaises(TypeError, msg = "No error while testing SetupDecoder.decode('" + line + "')"):
                 SetupDecoder.decode(line)
+
+class TestSetupDecoder_Arrays(unittest.TestCase):
+    """
+    Test the optical elements with numpy arrays as arguments
+    """
+
+    def test_output(self):
+        """
+        Make sure the stacks of matrices match the matrices of the single arguments
+        """
+        angles = np.array([0, 22.5, 45, 90, 135, -30])
+        elements = [ (SetupDecoder.generalLinearRetarder, (angles, 30)),
+                     (SetupDecoder.generalLinearRetarder, (10, angles)),
+                     (SetupDecoder.halfWavePlate        , (angles,)),
+                     (SetupDecoder.quarterWavePlate     , (angles,)),
+                     (SetupDecoder.linearHorizontalPolariser, (angles,)),
+                     (SetupDecoder.linearVerticalPolariser  , (angles,)),
+                     (SetupDecoder.attenuatingFilter    , (np.array([0, 0.5, 1]),)),
+                     (SetupDecoder.depolariser          , (np.array([0, 0.5, 1]),)) ]
+        for function, args in elements:
+            result = function(*args)
+            self.assertEqual( result.shape, (len(args[0]) if isinstance(args[0], np.ndarray) else len(args[1]), 4, 4) )
+            for index, matrix in enumerate(result):
+                single = function(*[ arg[index] if isinstance(arg, np.ndarray) else arg for arg in args ])
+                np.testing.assert_allclose( matrix, single, atol = 1e-15 )
+
+        # Arrays are broadcast against each other
+        self.assertEqual( SetupDecoder.generalLinearRetarder(angles[:,np.newaxis], angles).shape, (6,6,4,4) )
+        # Stacks of matrices can be rotated
+        stack = SetupDecoder.rotateMatrix(angles, SetupDecoder.generalLinearRetarder(angles, 90))
+        np.testing.assert_allclose( stack[3], SetupDecoder.rotateMatrix(90, SetupDecoder.generalLinearRetarder(90, 90)), atol = 1e-15 )
+
+    def test_errors(self):
+        """
+        Make sure invalid arrays raise errors
+        """
+        self.assertRaises(TypeError, SetupDecoder.halfWavePlate, np.array([True, False]))
+        self.assertRaises(TypeError, SetupDecoder.halfWavePlate, np.array([1+1j]))
+        self.assertRaises(TypeError, SetupDecoder.rotateMatrix, np.array(["1"]), SetupDecoder.unitMatrix())
+        self.assertRaises(ValueError, SetupDecoder.attenuatingFilter, np.array([0.5, 1.5]))
+        self.assertRaises(ValueError, SetupDecoder.depolariser, np.array([-0.5, 0.5]))
+
+class TestSetupDecoder_Sweep(unittest.TestCase):
+    """
+    Test the parameter sweeps of the decode method in SetupDecoder
+    """
+
+    def test_values(self):
+        """
+        Make sure the range syntax is decoded correctly
+        """
+        self.assertIsNone( SetupDecoder.sweepValues("22.5") )
+        np.testing.assert_allclose( SetupDecoder.sweepValues("0:180:0.5"), np.arange(361) * 0.5 )
+        np.testing.assert_allclose( SetupDecoder.sweepValues("0:1:0.1"), np.linspace(0, 1, 11) )
+        np.testing.assert_allclose( SetupDecoder.sweepValues("0:10:3"), [0, 3, 6, 9] )
+        np.testing.assert_allclose( SetupDecoder.sweepValues("1:3"), [1, 2, 3] )
+        np.testing.assert_allclose( SetupDecoder.sweepValues("90:0:-45"), [90, 45, 0] )
+        self.assertEqual( SetupDecoder.sweepRange("0:1:0.1"), (0, 0.1, 11) )
+
+        self.assertRaises(ValueError, SetupDecoder.sweepValues, "0:90:0")
+        self.assertRaises(ValueError, SetupDecoder.sweepValues, "0:90:-1")
+        self.assertRaises(ValueError, SetupDecoder.sweepValues, "0:90:1:1")
+        self.assertRaises(ValueError, SetupDecoder.sweepValues, "a:90:1")
+        self.assertRaises(TypeError, SetupDecoder.sweepValues, 1)
+
+    def test_output(self):
+        """
+        Make sure the decoded sweeps are stacks of matrices with one axis per swept argument
+        """
+        result = SetupDecoder.decode("GLR 0:90:45 0:90:90")
+        self.assertEqual( result.shape, (3,2,4,4) )
+        np.testing.assert_allclose( result[1,1], SetupDecoder.decode("GLR 45 90") )
+        np.testing.assert_allclose( SetupDecoder.decode("HWP 0:180:0.5")[45], SetupDecoder.decode("HWP 22.5") )
+
+        self.assertRaises(ValueError, SetupDecoder.decode, "FLR 0:2:1")
+        self.assertRaises(ValueError, SetupDecoder.decode, "HWP 0:90:0")
+
+class TestSetupDecoder_Compile(unittest.TestCase):
+    """
+    Test the compile method in SetupDecoder
+    """
+
+    def test_output(self):
+        """
+        Make sure runs of optical elements are folded into one matrix and SMP instructions are kept
+        """
+        program, parameters = SetupDecoder.compile(["HWP 22.5", "LHP 10", "SMP", "LVP", "FLR 0.5", "QWP 30"])
+
+        self.assertEqual( [ step["instructions"] for step in program ], [["HWP 22.5", "LHP 10"], ["SMP"], ["LVP", "FLR 0.5", "QWP 30"]] )
+        self.assertEqual( program[1]["matrix"], "SMP" )
+        np.testing.assert_allclose( program[0]["matrix"], SetupDecoder.decode("LHP 10") @ SetupDecoder.decode("HWP 22.5") )
+        np.testing.assert_allclose( program[2]["matrix"], SetupDecoder.decode("QWP 30") @ SetupDecoder.decode("FLR 0.5") @ SetupDecoder.decode("LVP") )
+
+        self.assertEqual( parameters, [] )
+        self.assertEqual( [ step["matrix"] for step in SetupDecoder.compile(["SMP", "SMP"])[0] ], ["SMP", "SMP"] )
+        self.assertEqual( SetupDecoder.compile([]), ([], []) )
+
+    def test_sweep(self):
+        """
+        Make sure the program is evaluated for every point of the Cartesian product of all sweeps
+        """
+        program, parameters = SetupDecoder.compile(["HWP 0:90:45", "SMP", "LVP", "GLR 10 0:90:90", "FLR 0.5"])
+
+        self.assertEqual( [ parameter["name"] for parameter in parameters ], ["Sweep.1.HWP.1", "Sweep.4.GLR.2"] )
+        np.testing.assert_array_equal( parameters[0]["values"], [0, 0, 45, 45, 90, 90] )
+        np.testing.assert_array_equal( parameters[1]["values"], [0, 90, 0, 90, 0, 90] )
+        self.assertEqual( program[0]["matrix"].shape, (6,4,4) )
+        self.assertEqual( program[2]["matrix"].shape, (6,4,4) )
+        for point in range(6):
+            np.testing.assert_allclose( program[0]["matrix"][point], SetupDecoder.decode("HWP " + str(parameters[0]["values"][point])) )
+            np.testing.assert_allclose( program[2]["matrix"][point], SetupDecoder.decode("FLR 0.5") @ SetupDecoder.decode("GLR 10 " + str(parameters[1]["values"][point])) @ SetupDecoder.decode("LVP") )
+
+    def test_errors(self):
+        """
+        Make sure invalid programs are detected before the simulation starts
+        """
+        self.assertRaises(TypeError, SetupDecoder.compile, "HWP 0")
+        self.assertRaises(TypeError, SetupDecoder.compile, ["HWP 0", 1])
+        self.assertRaises(KeyError, SetupDecoder.compile, ["HWP 0", "SMP", "FakeCommand"])
+        self.assertRaises(ValueError, SetupDecoder.compile, ["HWP 0", "FLR 2"])
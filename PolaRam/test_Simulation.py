@@ -0,0 +1,114 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import Simulation as Sim
+import SetupDecoder as SetDec
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary instruction files
+import tempfile
+import pathlib
+
+
+class TestSimulation(unittest.TestCase):
+    """
+    Test the class Simulation
+    """
+
+    def setUp(self):
+        # Two physical raman mueller matrices
+        self.matrices = np.array([ np.array([[ 3, 1, 0, 0], [ 1, 3, 0, 0], [0, 0, 2, 0], [0, 0, 0, 1]]) / 4,
+                                   np.array([[ 2, 0, 0, 0], [ 0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0]]) / 2 ])
+        self.lasers = np.array([[1., 1., 0., 0.], [1., 0., 1., 0.]])
+
+    def test_setup(self):
+        """
+        Make sure the setup can be given as string, file and list of instructions
+        """
+        decoder = SetDec.SetupDecoder()
+        expected = np.array([[ decoder.decode("LVP 10") @ matrix @ decoder.decode("HWP 22.5") @ laser for matrix in self.matrices ] for laser in self.lasers ])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "setup.txt"
+            path.write_text("# Comment\nHWP 22.5\n\nSMP # Sample\nLVP 10\n")
+            for setup in [ path.read_text(), path, ["HWP 22.5", "SMP", "LVP 10"] ]:
+                simulation = Sim.Simulation(setup, self.matrices)
+                self.assertEqual(simulation.instructions, ["HWP 22.5", "SMP", "LVP 10"])
+                self.assertEqual(simulation.heads, ["mode 1", "mode 2"])
+                np.testing.assert_allclose(simulation.run(self.lasers), expected, atol = 1e-12)
+
+        # A single stokes vector is a stack of one laser
+        self.assertEqual(simulation.run([1, 1, 0, 0]).shape, (1, 2, 4))
+        # Parameter sweeps add an axis for the points of the sweep
+        sweep = Sim.Simulation("HWP 0:45:22.5\nSMP\nLVP 10", self.matrices)
+        self.assertEqual(sweep.pointCount(), 3)
+        np.testing.assert_allclose(sweep.run(self.lasers)[1], expected, atol = 1e-12)
+
+        self.assertRaises(TypeError, Sim.Simulation, 42, self.matrices)
+        self.assertRaises(ValueError, Sim.Simulation, "SMP", self.matrices[:,:3])
+        self.assertRaises(ValueError, Sim.Simulation, "SMP", self.matrices, ["a"])
+
+    def test_checks(self):
+        """
+        Make sure the checks find the first invalid state of all sweep points, lasers and modes
+        """
+        # Negative intensity of mode b of the second laser at the second point of the sweep
+        # The intensity of mode b is S2 of the incoming light
+        matrices = np.array([ np.eye(4), np.zeros((4,4)) ])
+        matrices[1,0,2] = 1
+        simulation = Sim.Simulation("HWP 0:22.5:22.5\nSMP", matrices, heads = ["a", "b"])
+        with self.assertLogs(Sim.log, level = "ERROR") as logs:
+            self.assertRaises(ValueError, simulation.run, [[1, 1, 0, 0], [1, -1, 0, 0]])
+        self.assertIn("Error for initial state [ 1. -1.  0.  0.] and Sweep.1.HWP.1 = 22.5. Error in state vector 'b'. The total light intensity can't be negative!", logs.output[0])
+
+        # Circular polarisation is forbidden before the SMP instruction even if unpolarised light is allowed
+        simulation = Sim.Simulation("QWP 0\nSMP", self.matrices, allowUnpolarised = True)
+        with self.assertLogs(Sim.log, level = "ERROR") as logs:
+            self.assertRaises(ValueError, simulation.run, self.lasers)
+        self.assertIn("[1. 0. 1. 0.]", logs.output[0])
+        self.assertIn("circular polarisation", logs.output[0])
+
+        # Unpolarised light before the SMP instruction
+        simulation = Sim.Simulation("SMP", self.matrices)
+        self.assertRaises(ValueError, simulation.run, [1, 0.5, 0, 0])
+        Sim.Simulation("SMP", self.matrices, allowUnpolarised = True).run([1, 0.5, 0, 0])
+
+        # Polarisation grade greater than one
+        simulation = Sim.Simulation("SMP", np.array([ np.diag([1., 2., 1., 1.]) ]), heads = ["a"])
+        with self.assertLogs(Sim.log, level = "ERROR") as logs:
+            self.assertRaises(ValueError, simulation.run, self.lasers)
+        self.assertIn("'a'. Polarisation grade is 2.0", logs.output[0])
+
+    def test_policy(self):
+        """
+        Make sure the check policy and the tolerance decide which states raise exceptions
+        """
+        # The state after the raman scattering is over polarised, but the final state behind the polariser is valid
+        overpolarised = np.array([ np.diag([1., 2., 1., 1.]) ])
+        self.assertRaises(ValueError, Sim.Simulation("SMP\nLHP", overpolarised).run, self.lasers[0])
+        for check in ["final", "smp-only", "off"]:
+            np.testing.assert_allclose(Sim.Simulation("SMP\nLHP", overpolarised, check = check).run(self.lasers[0]), [[[1.5, 1.5, 0, 0]]])
+        self.assertRaises(ValueError, Sim.Simulation("SMP", overpolarised, check = "final").run, self.lasers[0])
+
+        # Unpolarised light in front of the SMP instruction is only accepted without checks
+        for check in ["every-step", "final", "smp-only"]:
+            self.assertRaises(ValueError, Sim.Simulation("SMP", self.matrices, check = check).run, [1, 0.5, 0, 0])
+        Sim.Simulation("SMP", self.matrices, check = "off").run([1, 0.5, 0, 0])
+
+        # Floating point errors smaller than the tolerance are accepted
+        laser = [1, np.sqrt(1 - 1e-12), 0, 1e-6]
+        self.assertRaises(ValueError, Sim.Simulation("SMP", self.matrices).run, laser)
+        Sim.Simulation("SMP", self.matrices, tolerance = 1e-5).run(laser)
+
+        self.assertRaises(ValueError, Sim.Simulation, "SMP", self.matrices, check = "always")
+        self.assertRaises(ValueError, Sim.Simulation, "SMP", self.matrices, tolerance = -1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import api
+import convert
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Gaussian log files in the repository
+import pathlib
+
+
+class TestApi(unittest.TestCase):
+    """
+    Test the python interface of polaram
+    """
+
+    def setUp(self):
+        self.tensors = np.array([ [[1, 0, 0], [0, 2, 0], [0, 0, 3]],
+                                  [[0, 1, 0], [1, 0, 0], [0, 0, 0]] ], dtype = float)
+
+    def test_extractTensors(self):
+        """
+        Make sure the raman tensors and frequencies are read from gaussian log files
+        """
+        tensors, frequencies = api.extractTensors(pathlib.Path(__file__).parent / "gaussian" / "WATER.LOG")
+        self.assertEqual(tensors.shape, (3, 3, 3))
+        self.assertEqual(frequencies.shape, (3,))
+        self.assertTrue(np.all(frequencies > 0))
+        self.assertAlmostEqual(tensors[0,2,2], -0.449127)
+
+    def test_convertTensors(self):
+        """
+        Make sure the exact average and the monte-carlo-simulation are available without command line
+        """
+        mueller, raman, muellerError, ramanError = api.convertTensors(self.tensors, exact = True)
+        np.testing.assert_allclose(mueller, convert.exactAverage(self.tensors)[0])
+        self.assertTrue(np.all(muellerError == 0))
+        # A single tensor is a stack of one tensor
+        self.assertEqual(api.convertTensors(self.tensors[0], exact = True)[0].shape, (1, 4, 4))
+
+        mueller, raman, muellerError, ramanError = api.convertTensors(self.tensors, iterations = 2000, seed = 1, processCount = 1, chunksize = 1000)
+        np.testing.assert_allclose(mueller, convert.exactAverage(self.tensors)[0], atol = 6 * muellerError.max())
+        self.assertEqual(raman.shape, (2, 3, 3))
+        self.assertTrue(np.all(ramanError > 0))
+
+        self.assertRaises(ValueError, api.convertTensors, np.zeros((2, 4, 4)))
+        self.assertRaises(ValueError, api.convertTensors, self.tensors, sampler = "unknown")
+
+    def test_pipeline(self):
+        """
+        Make sure the results of convertTensors can be simulated directly
+        """
+        mueller = api.convertTensors(self.tensors, exact = True)[0]
+        states = api.Simulation("HWP 0:90:45\nSMP\nLHP", mueller).run([1, 1, 0, 0])
+        self.assertEqual(states.shape, (3, 1, 2, 4))
+
+if __name__ == '__main__':
+    unittest.main()
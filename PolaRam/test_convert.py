@@ -0,0 +1,256 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import convert
+from Accumulator import Accumulator
+
+#
+#   EXTERNAL LIBARIES
+#
+
+# math stuff
+import numpy as np
+# Build command line arguments for the simulation
+import argparse
+# Temporary tensor and output files
+import tempfile
+import pathlib
+import contextlib
+import io
+
+# Import functions for building test data
+import utilities as util
+
+# Check if the optional dependency scipy is installed
+import importlib.util
+SCIPY_INSTALLED = importlib.util.find_spec("scipy") is not None
+
+
+class TestConvert_ExactAverage(unittest.TestCase):
+    """
+    Test convert.exactAverage()
+    """
+
+    def test_types(self):
+        """
+        Make sure type errors are raised if necessary
+        """
+        self.assertRaises(TypeError, convert.exactAverage, [ [ [1,0,0], [0,1,0], [0,0,1] ] ])
+        self.assertRaises(TypeError, convert.exactAverage, "string")
+        self.assertRaises(TypeError, convert.exactAverage, 1)
+        self.assertRaises(TypeError, convert.exactAverage, np.diag([1,1,1]) )
+        self.assertRaises(TypeError, convert.exactAverage, np.zeros((2,4,4)) )
+
+    def test_output(self):
+        """
+        Make sure the exact average matches the mean over many random rotations
+        """
+        rng = np.random.default_rng(1)
+        tensors = rng.normal(size = (3,3,3))
+
+        # Mean over random rotations generated like in the monte-carlo-simulation
+        rotation = getattr(convert, "__arvoRotations")( rng.random((200000, 3)) )
+        rotated  = np.einsum("nji,mjk,nkl->nmil", rotation, tensors, rotation, optimize = True)
+
+        muellerMatrices, ramanTensors = convert.exactAverage(tensors)
+
+        self.assertEqual(muellerMatrices.shape, (3,4,4))
+        self.assertEqual(ramanTensors.shape, (3,3,3))
+        np.testing.assert_allclose(muellerMatrices, util.buildRamanMuellerMatrix(rotated).mean(axis = 0), atol = 0.02)
+        np.testing.assert_allclose(ramanTensors, rotated.mean(axis = 0), atol = 0.02)
+
+    def test_depolarisationRatio(self):
+        """
+        Make sure the exact average reproduces the depolarisation ratio computed from the eigenvalues of the tensor
+        """
+        # Symmetric raman tensor with the eigenvalues 1, 2 and 4
+        eigenvalues = np.array([1., 2., 4.])
+        tensors = np.diag(eigenvalues)[np.newaxis]
+
+        muellerMatrices, _ = convert.exactAverage(tensors)
+
+        # Depolarisation ratio. See Richard N. Zare: "Angluar Momentum", p.129.
+        isotropic   = eigenvalues.sum()/3
+        anisotropic = ( (eigenvalues[0]-eigenvalues[1])**2 + (eigenvalues[1]-eigenvalues[2])**2 + (eigenvalues[2]-eigenvalues[0])**2 )/2
+        expected    = 3*anisotropic / ( 45*isotropic**2 + 4*anisotropic )
+
+        scatteredLight = muellerMatrices[0] @ np.array([1,1,0,0])
+        self.assertAlmostEqual( (scatteredLight[0]-scatteredLight[1])/(scatteredLight[0]+scatteredLight[1]), expected )
+
+class TestConvert_Samplers(unittest.TestCase):
+    """
+    Test the samplers of the monte-carlo-simulation
+    """
+
+    def test_points(self):
+        """
+        Make sure the low-discrepancy sequences lie in the unit cube and don't depend on how the iterations are split into batches
+        """
+        samplePoints = getattr(convert, "__samplePoints")
+        for sampler in ["halton", "sobol"] if SCIPY_INSTALLED else ["halton"]:
+            points = samplePoints(sampler, 0, 256, 7)
+            self.assertEqual(points.shape, (256, 3))
+            self.assertTrue( np.all(points >= 0) and np.all(points < 1) )
+            np.testing.assert_array_equal(points, np.vstack([ samplePoints(sampler, 0, 100, 7), samplePoints(sampler, 100, 156, 7) ]))
+
+    def test_convergence(self):
+        """
+        Make sure the low-discrepancy sequences are closer to the exact average than pseudo-random numbers
+        """
+        tensors = np.random.default_rng(2).normal(size = (2,3,3))
+        exactMueller, _ = convert.exactAverage(tensors)
+        monteCarlo = getattr(convert, "__monteCarlo")
+        # Run the subprocess function in this process
+        getattr(convert, "__initWorker")(tensors, 3, 1000)
+
+        error = lambda sampler : np.abs( monteCarlo( (sampler, 0, 2**14) ).muellerMean - exactMueller ).max()
+        self.assertLess(error("halton"), 0.01)
+        if SCIPY_INSTALLED:
+            self.assertLess(error("sobol"), 0.01)
+
+    def test_batchsize(self):
+        """
+        Make sure the result of a chunk does not depend on the size of the vectorised batches
+        """
+        tensors = np.random.default_rng(4).normal(size = (3,3,3))
+        monteCarlo = getattr(convert, "__monteCarlo")
+        initWorker = getattr(convert, "__initWorker")
+
+        initWorker(tensors, 5, 1000)
+        reference = monteCarlo( ("halton", 10, 1000) )
+        for batchsize in [1, 7, 333, 5000]:
+            initWorker(tensors, 5, batchsize)
+            result = monteCarlo( ("halton", 10, 1000) )
+            self.assertEqual(result.count, 1000)
+            np.testing.assert_allclose(result.muellerMean, reference.muellerMean)
+            np.testing.assert_allclose(result.ramanM2, reference.ramanM2)
+
+class TestConvert_Seed(unittest.TestCase):
+    """
+    Test the reproducibility of the monte-carlo-simulation
+    """
+
+    def test_processes(self):
+        """
+        Make sure the same seed gives bit-identical results for any number of processes and different seeds give different results
+        """
+        tensors = np.random.default_rng(6).normal(size = (2,3,3))
+        startPool     = getattr(convert, "__startPool")
+        runMonteCarlo = getattr(convert, "__runMonteCarlo")
+
+        def run(seed, processCount):
+            cliArgs = argparse.Namespace(processCount = processCount, chunksize = 300, batchsize = 100, controlVariates = False)
+            result = Accumulator(len(tensors))
+            with startPool(tensors, seed, cliArgs) as pool:
+                runMonteCarlo(pool, result, "random", 0, 2000, cliArgs)
+            return result
+
+        reference = run(11, 1)
+        for processCount in [2, 3]:
+            result = run(11, processCount)
+            np.testing.assert_array_equal(result.muellerMean, reference.muellerMean)
+            np.testing.assert_array_equal(result.ramanM2, reference.ramanM2)
+        self.assertFalse( np.array_equal(run(12, 2).muellerMean, reference.muellerMean) )
+
+class TestConvert_Tolerance(unittest.TestCase):
+    """
+    Test the tolerance of the monte-carlo-simulation
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        self.tensors = np.random.default_rng(10).normal(size = (2,3,3))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_monteCarloAverage(self):
+        """
+        Make sure a tolerance that can't be reached stops at the largest number of iterations
+        """
+        with self.assertLogs(convert.log, level = "WARNING"):
+            result = convert.monteCarloAverage(self.tensors, 1000, seed = 1, processCount = 1, chunksize = 500, tolerance = 1e-12, maxIterations = 2500)
+        self.assertEqual(result.count, 2500)
+        # Without cap the simulation stops after MAX_TOLERANCE_BLOCKS blocks
+        with self.assertLogs(convert.log, level = "WARNING"):
+            result = convert.monteCarloAverage(self.tensors, 50, seed = 1, processCount = 1, chunksize = 50, tolerance = 1e-12)
+        self.assertEqual(result.count, 50 * convert.MAX_TOLERANCE_BLOCKS)
+        # A tolerance that is reached stops the simulation
+        self.assertEqual(convert.monteCarloAverage(self.tensors, 1000, seed = 1, processCount = 1, chunksize = 500, tolerance = 1e3).count, 1000)
+        self.assertRaises(ValueError, convert.monteCarloAverage, self.tensors, 1000, tolerance = 1e-3, maxIterations = 0)
+
+    def test_main(self):
+        """
+        Make sure polaram convert writes the partial result with a warning, if the tolerance can't be reached
+        """
+        (self.path / "tensors.txt").write_text("".join( "! v_" + str(index) + "\n" + "\n".join( " ".join(map(str, row)) for row in tensor ) + "\n"
+                                                        for index, tensor in enumerate(self.tensors) ))
+        cliArgs = argparse.Namespace(tensorfile = self.path / "tensors.txt", outputfile = self.path / "result.txt", logfile = self.path / "convert.log",
+                                     iterationLimit = 1000, processCount = 1, chunksize = 500, batchsize = 100, threshold = 2, comment = "",
+                                     outputFormat = "text", exact = False, compareSamplers = False, sampler = "random", seed = 1, shard = None,
+                                     checkpoint = None, resume = False, controlVariates = False, tolerance = 1e-12, maxIterations = 3000)
+        with self.assertLogs(convert.log, level = "CRITICAL"), contextlib.redirect_stdout(io.StringIO()):
+            convert.main(cliArgs)
+        result = (self.path / "result.txt").read_text()
+        self.assertIn("--iterations 3000 ", result)
+        self.assertIn("--tolerance 1e-12 --max-iterations 3000", result)
+        self.assertIn("# WARNING: PARTIAL RESULT AFTER 3000 ITERATIONS. The tolerance 1e-12 was not reached. Largest standard error: ", result)
+
+class TestConvert_ControlVariates(unittest.TestCase):
+    """
+    Test the control variates of the monte-carlo-simulation
+    """
+
+    def test_expectation(self):
+        """
+        Make sure the exact expectation of the control variates matches the exact average of the mueller matrices
+        """
+        tensors = np.random.default_rng(7).normal(size = (4,3,3))
+        expectation = convert.controlExpectation(tensors)
+        mueller, _ = convert.exactAverage(tensors)
+        # M_00 + M_11 = B_xx^2 + B_yy^2   and   M_00 - M_11 = B_xy^2 + B_yx^2
+        np.testing.assert_allclose(2*expectation[:,0], mueller[:,0,0] + mueller[:,1,1])
+        np.testing.assert_allclose(2*expectation[:,1], mueller[:,0,0] - mueller[:,1,1])
+
+        self.assertRaises(TypeError, convert.controlExpectation, [[1,0,0],[0,1,0],[0,0,1]])
+        self.assertRaises(TypeError, convert.controlExpectation, np.eye(3))
+
+    def test_output(self):
+        """
+        Make sure the control variates reduce the error of the depolarisation ratio
+        """
+        tensors = np.random.default_rng(8).normal(size = (3,3,3))
+        exactMueller, _ = convert.exactAverage(tensors)
+        getattr(convert, "__initWorker")(tensors, 9, 1000, True)
+        plain = getattr(convert, "__monteCarlo")( ("random", 0, 4000) )
+        corrected = plain.applyControlVariates(convert.controlExpectation(tensors))
+
+        # The control variates are linear combinations of M_00 and M_11, so these elements are exact
+        np.testing.assert_allclose(corrected.muellerMean[:,[0,1],[0,1]], exactMueller[:,[0,1],[0,1]])
+        self.assertGreater(convert.varianceReduction(plain), 1.5)
+        # The errors of the corrected means must stay consistent with their standard errors
+        self.assertTrue( np.all( np.abs(corrected.muellerMean - exactMueller) <= 5*corrected.muellerStandardError() + 1e-10 ) )
+
+    def test_varianceReduction(self):
+        """
+        Make sure intensities that are linear in the control variates give a finite variance reduction factor
+        """
+        controls = np.random.default_rng(11).uniform(1, 2, size = (1000, 2, 2))
+        # Mode 1: the intensities are the control variates. Mode 2: the intensities are not linear in the control variates.
+        intensities = controls.copy()
+        intensities[:,1] = controls[:,1]**2
+        accumulator = Accumulator(2, convert.CONTROL_COUNT)
+        accumulator.add(np.zeros((1000, 2, 4, 4)), np.zeros((1000, 2, 3, 3)), np.concatenate([controls, intensities], axis = -1))
+
+        reduction = convert.varianceReduction(accumulator)
+        self.assertTrue(np.isfinite(reduction))
+        self.assertLess(reduction, 1e3)
+
+        # Only exact modes: the factor is limited
+        exact = Accumulator(1, convert.CONTROL_COUNT)
+        exact.add(np.zeros((1000, 1, 4, 4)), np.zeros((1000, 1, 3, 3)), np.concatenate([controls[:,:1], controls[:,:1]], axis = -1))
+        self.assertEqual(convert.varianceReduction(exact), 1e12)
@@ -0,0 +1,219 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import extract
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Gaussian log files in the repository
+import pathlib
+
+# Temporary log files and command line arguments of polaram extract
+import tempfile
+import argparse
+import csv
+
+
+class TestExtract_Parser(unittest.TestCase):
+    """
+    Test the single pass parser of gaussian log files
+    """
+
+    def setUp(self):
+        # Shortened log file with two raman tensors, three frequencies and meta data
+        self.logfile = "\n".join([ " Entering Gaussian System",
+                                   " ******************************************",
+                                   " Gaussian 16:  EM64W-G16RevB.01 16-Dec-2017",
+                                   "                10-Sep-2020 ",
+                                   " ******************************************",
+                                   " # freq(raman, printderivatives) b3lyp/6-31+G*",
+                                   " Frequencies --   1650.1234              3800.0000              3900.5000",
+                                   " Polarizability derivatives wrt mode          1",
+                                   "                1             2             3",
+                                   "      1  0.100000D+01  0.000000D+00  0.000000D+00",
+                                   "      2  0.000000D+00  0.200000D+01  0.000000D+00",
+                                   "      3  0.000000D+00  0.000000D+00 -0.300000D-01",
+                                   " Polarizability derivatives wrt mode          2",
+                                   "                1             2             3",
+                                   "      1  0.000000D+00  0.100000D+01  0.000000D+00",
+                                   "      2  0.100000D+01  0.000000D+00  0.000000D+00",
+                                   "      3  0.000000D+00  0.000000D+00  0.000000D+00",
+                                   " Normal termination of Gaussian 16" ]) + "\n"
+
+    def test_parser(self):
+        """
+        Make sure the frequencies, tensors and meta data are found
+        """
+        logfile = extract.parseLogfile(self.logfile)
+        self.assertEqual(logfile["frequencies"], ["1650.1234", "3800.0000", "3900.5000"])
+        self.assertEqual([ tensor["mode"] for tensor in logfile["tensors"] ], [1, 2])
+        np.testing.assert_array_equal(logfile["tensors"][0]["matrix"], np.diag([1., 2., -0.03]))
+        self.assertEqual(logfile["metadata"][:3], ["******************************************", "Gaussian 16:  EM64W-G16RevB.01 16-Dec-2017", "10-Sep-2020"])
+        self.assertEqual(len(logfile["metadata"]), extract.METADATA_LINES)
+        self.assertTrue(logfile["gaussianKeyword"])
+
+    def test_errors(self):
+        """
+        Make sure missing and incomplete raman tensors raise exceptions and missing meta data is allowed
+        """
+        self.assertRaises(ValueError, extract.parseLogfile, self.logfile.split(" Polarizability")[0])
+        with self.assertLogs(extract.log, level = "CRITICAL"):
+            self.assertRaises(ValueError, extract.parseLogfile, self.logfile[:self.logfile.index("      3  0.000000D+00  0.000000D+00  0.000000D+00")])
+        logfile = extract.parseLogfile(self.logfile.replace(" Gaussian 16:", " Gaussian 09:").replace("******", "------"))
+        self.assertIsNone(logfile["metadata"])
+        self.assertEqual(len(logfile["tensors"]), 2)
+
+    def test_files(self):
+        """
+        Make sure reading the log files line by line gives the result of parsing the whole text
+        """
+        for path in (pathlib.Path(__file__).parent / "gaussian").glob("[TW]*.LOG"):
+            logfile = extract.readLogfile(path)
+            expected = extract.parseLogfile(path.read_text())
+            self.assertEqual(logfile["frequencies"], expected["frequencies"])
+            self.assertEqual(logfile["metadata"], expected["metadata"])
+            self.assertEqual(len(logfile["tensors"]), len(logfile["frequencies"]))
+            for tensor, expectedTensor in zip(logfile["tensors"], expected["tensors"]):
+                np.testing.assert_array_equal(tensor["matrix"], expectedTensor["matrix"])
+
+class TestExtract_Batch(unittest.TestCase):
+    """
+    Test the extraction of several log files and the policies replacing the questions to the user
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        water = (pathlib.Path(__file__).parent / "gaussian" / "WATER.LOG").read_text()
+        frequency = water.split(extract.FREQUENCY_KEYWORD)[1].split()[0]
+        # Valid file, file with an imaginary frequency of mode 1, file without keyword and file without raman tensors
+        (self.path / "WATER.LOG").write_text(water)
+        (self.path / "IMAGINARY.LOG").write_text(water.replace(extract.FREQUENCY_KEYWORD + "  " + frequency, extract.FREQUENCY_KEYWORD + " -" + frequency, 1))
+        (self.path / "NOKEYWORD.LOG").write_text(water.replace(extract.LOGFILE_KEYWORD, "freq"))
+        (self.path / "EMPTY.LOG").write_text(water.replace(extract.TENSOR_KEYWORD, "Nothing"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_extract(self, files, output, onImaginary = None, onMissingKeyword = None, jobs = 1, index = False):
+        cliArgs = argparse.Namespace(gaussianfiles = [ self.path / name for name in files ], outputfile = output, comment = "",
+                                     jobs = jobs, onImaginary = onImaginary, onMissingKeyword = onMissingKeyword, index = index)
+        extract.main(cliArgs)
+
+    def manifest(self, output):
+        with (output / extract.MANIFEST_NAME).open() as file:
+            return { pathlib.Path(row["File"]).name: row for row in csv.DictReader(line for line in file if not line.startswith("#")) }
+
+    def test_policies(self):
+        """
+        Make sure the policies decide about imaginary frequencies and missing keywords
+        """
+        files = ["WATER.LOG", "IMAGINARY.LOG", "NOKEYWORD.LOG"]
+        # Default: fail
+        with self.assertRaises(SystemExit):
+            self.run_extract(files + ["EMPTY.LOG"], self.path / "fail")
+        manifest = self.manifest(self.path / "fail")
+        self.assertEqual({ name: row["Status"] for name, row in manifest.items() },
+                         { "WATER.LOG": "ok", "IMAGINARY.LOG": "failed", "NOKEYWORD.LOG": "failed", "EMPTY.LOG": "failed" })
+        self.assertEqual(sorted( path.name for path in (self.path / "fail").iterdir() ), sorted(["WATER.txt", extract.MANIFEST_NAME]))
+
+        # Warn: all modes are written, skip: the imaginary mode is left out
+        for policy, modes in [("warn", "3"), ("skip", "2")]:
+            output = self.path / policy
+            self.run_extract(files, output, onImaginary = policy, onMissingKeyword = "warn", jobs = 2, index = policy == "skip")
+            manifest = self.manifest(output)
+            self.assertEqual([ manifest[name]["Status"] for name in files ], ["ok", "warning", "warning"])
+            self.assertEqual([ manifest[name]["Modes"] for name in files ], ["3", modes, "3"])
+            self.assertEqual(manifest["IMAGINARY.LOG"]["ImaginaryModes"], "1")
+            self.assertEqual((output / "IMAGINARY.txt").read_text().count("! v_1 "), 1 if policy == "warn" else 0)
+            self.assertEqual((output / "WATER.txt").read_text().replace("/" + policy + "/", "/").replace(str(self.path), ""),
+                             (self.path / "fail" / "WATER.txt").read_text().replace(str(self.path), ""))
+
+    def test_single(self):
+        """
+        Make sure a single file is written to the output file without manifest and a policy replaces the question to the user
+        """
+        self.run_extract(["IMAGINARY.LOG"], self.path / "single.txt", onImaginary = "skip")
+        self.assertTrue((self.path / "single.txt").read_text().startswith("# Raman tensors calculated by Gaussian"))
+        self.assertFalse((self.path / extract.MANIFEST_NAME).exists())
+        with self.assertRaises(SystemExit), self.assertLogs(extract.log, level = "CRITICAL"):
+            self.run_extract(["EMPTY.LOG"], self.path / "empty.txt")
+
+        # Tensor files of log files with the same name would overwrite each other
+        (self.path / "copy").mkdir()
+        (self.path / "copy" / "WATER.LOG").write_text((self.path / "WATER.LOG").read_text())
+        with self.assertRaises(SystemExit), self.assertLogs(extract.log, level = "CRITICAL"):
+            self.run_extract(["WATER.LOG", "copy/WATER.LOG"], self.path / "duplicates")
+
+class TestExtract_Index(unittest.TestCase):
+    """
+    Test the sidecar index of the sections of log files
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertSameLogfile(self, logfile, expected):
+        self.assertEqual(logfile["frequencies"], expected["frequencies"])
+        self.assertEqual(logfile["metadata"], expected["metadata"])
+        self.assertEqual(logfile["gaussianKeyword"], expected["gaussianKeyword"])
+        self.assertEqual([ tensor["mode"] for tensor in logfile["tensors"] ], [ tensor["mode"] for tensor in expected["tensors"] ])
+        for tensor, expectedTensor in zip(logfile["tensors"], expected["tensors"]):
+            np.testing.assert_array_equal(tensor["matrix"], expectedTensor["matrix"])
+
+    def test_index(self):
+        """
+        Make sure the sections of the index give the result of reading the whole file and the index is created once
+        """
+        for source in (pathlib.Path(__file__).parent / "gaussian").glob("*.LOG"):
+            path = self.path / source.name
+            path.write_bytes(source.read_bytes())
+            expected = extract.readLogfile(path)
+            self.assertSameLogfile(extract.readLogfile(path, index = True), expected)
+            indexfile = self.path / (source.name + extract.INDEX_SUFFIX)
+            self.assertTrue(indexfile.exists())
+            # The second read uses the index file
+            with self.assertLogs(extract.log, level = "INFO") as logs:
+                self.assertSameLogfile(extract.readLogfile(path, index = True), expected)
+            self.assertTrue(any( "Read section index" in message for message in logs.output ))
+
+            # The sections start at the keywords
+            sections = extract.loadIndex(path)
+            data = path.read_bytes()
+            self.assertEqual(len(sections["tensors"]), len(expected["tensors"]))
+            self.assertTrue(all( extract.TENSOR_KEYWORD.encode() in data[start:end].splitlines()[0] for start, end in sections["tensors"] ))
+            self.assertTrue(all( len(data[start:end].splitlines()) == extract.TENSOR_LINES for start, end in sections["tensors"] ))
+
+    def test_changes(self):
+        """
+        Make sure the index is rebuilt, if the log file changes
+        """
+        path = self.path / "WATER.LOG"
+        water = (pathlib.Path(__file__).parent / "gaussian" / "WATER.LOG").read_text()
+        path.write_text(water)
+        extract.readLogfile(path, index = True)
+
+        # The same number of bytes, but an imaginary frequency
+        frequency = water.split(extract.FREQUENCY_KEYWORD)[1].split()[0]
+        path.write_text(water.replace(extract.FREQUENCY_KEYWORD + "  " + frequency, extract.FREQUENCY_KEYWORD + " -" + frequency, 1))
+        self.assertEqual(extract.readLogfile(path, index = True)["frequencies"][0], "-" + frequency)
+
+        # Truncated file
+        path.write_text(water[:water.index(extract.TENSOR_KEYWORD + "          3") + 100])
+        with self.assertLogs(extract.log, level = "CRITICAL"):
+            self.assertRaises(ValueError, extract.readLogfile, path, True)
+        path.write_text("")
+        self.assertRaises(ValueError, extract.readLogfile, path, True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import merge
+from Accumulator import Accumulator
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary shard files and command line arguments
+import tempfile
+import pathlib
+import argparse
+import contextlib
+import io
+
+
+class TestMerge_Main(unittest.TestCase):
+    """
+    Test the merging of shard files
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+        # Two shards of a simulation with the identity as raman tensor and random samples as results
+        rng = np.random.default_rng(3)
+        self.mueller = rng.normal(size = (30, 1, 4, 4))
+        self.raman   = rng.normal(size = (30, 1, 3, 3))
+        for index, (start, stop) in enumerate([(0, 10), (10, 30)], 1):
+            shard = Accumulator(1)
+            shard.add(self.mueller[start:stop], self.raman[start:stop])
+            shard.save(self.path / ("shard" + str(index) + ".npz"), seed = "1", sampler = "random", heads = ["v_1"],
+                       tensors = np.eye(3)[np.newaxis], shard = index, shardCount = 2, offset = start)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_merge(self, *shards):
+        cliArgs = argparse.Namespace(shardfiles = [ self.path / shard for shard in shards ], outputfile = self.path / "result.txt",
+                                     logfile = self.path / "merge.log", comment = "", threshold = 1, outputFormat = "text")
+        with contextlib.redirect_stdout(io.StringIO()):
+            merge.main(cliArgs)
+        return (self.path / "result.txt").read_text()
+
+    def test_output(self):
+        """
+        Make sure the merged result contains the mean of all iterations of all shards
+        """
+        result = self.run_merge("shard2.npz", "shard1.npz")
+        self.assertIn("Shards: 2/2    Iterations: 30", result)
+        expected = np.array2string(self.mueller.mean(axis = 0)[0], sign = None).replace("[[", "").replace(" [", "").replace("]", "")
+        self.assertIn(expected, result)
+
+    def test_overlap(self):
+        """
+        Make sure shards with the same iterations are not merged
+        """
+        with self.assertLogs(merge.log, level = "CRITICAL"):
+            self.assertRaises(SystemExit, self.run_merge, "shard1.npz", "shard1.npz")
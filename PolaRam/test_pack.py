@@ -0,0 +1,70 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import pack
+import utilities as util
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary matrix files and command line arguments
+import tempfile
+import pathlib
+import argparse
+
+
+class TestPack_Main(unittest.TestCase):
+    """
+    Test the packing and unpacking of matrix files
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+        # Matrices with more digits than the matrix files written by polaram
+        self.matrices = np.random.default_rng(4).normal(size = (25, 4, 4))
+        self.matrices[0,0,0] = 1e-300
+        self.heads = [ "v_" + str(index) + " = " + str(1000 + index) + "/cm" for index in range(25) ]
+        (self.path / "matrices.txt").write_text("# Comment\n" + pack.formatMatrices(self.heads, self.matrices))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_roundtrip(self):
+        """
+        Make sure packing and unpacking gives the same matrices and headers
+        """
+        pack.main(argparse.Namespace(matrixfile = self.path / "matrices.txt", outputfile = None, logfile = self.path / "pack.log"))
+        heads, matrices = util.readMatrixStore(self.path / ("matrices" + util.MATRIX_STORE_SUFFIX))
+        self.assertEqual(heads, self.heads)
+        np.testing.assert_array_equal(matrices, self.matrices)
+
+        pack.UNPACK_CHUNK = 7
+        try:
+            pack.unpack(argparse.Namespace(storefile = self.path / "matrices.pmat", outputfile = self.path / "unpacked.txt", logfile = self.path / "pack.log"))
+        finally:
+            pack.UNPACK_CHUNK = 10000
+        self.assertTrue((self.path / "unpacked.txt").read_text().startswith("# polaram unpack "))
+        heads, matrices = util.readFileAsArray(self.path / "unpacked.txt", (4,4))
+        self.assertEqual(heads, self.heads)
+        np.testing.assert_array_equal(matrices, self.matrices)
+
+    def test_errors(self):
+        """
+        Make sure matrices of different shapes and files that are no matrix stores terminate the program
+        """
+        (self.path / "mixed.txt").write_text("! a\n1 0\n0 1\n! b\n1\n")
+        with self.assertLogs(pack.log, level = "CRITICAL"):
+            self.assertRaises(SystemExit, pack.main, argparse.Namespace(matrixfile = self.path / "mixed.txt", outputfile = None, logfile = self.path / "pack.log"))
+        self.assertFalse((self.path / "mixed.pmat").exists())
+        with self.assertLogs(pack.log, level = "CRITICAL"):
+            self.assertRaises(SystemExit, pack.unpack, argparse.Namespace(storefile = self.path / "matrices.txt", outputfile = None, logfile = self.path / "pack.log"))
+
+if __name__ == '__main__':
+    unittest.main()
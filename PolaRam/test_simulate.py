@@ -0,0 +1,171 @@
+#
+#   UNITTESTS
+#
+import unittest
+
+# Import module that shall be tested
+import simulate
+import SetupDecoder as SetDec
+import Simulation
+
+#
+#   EXTERNAL LIBARIES
+#
+import numpy as np
+
+# Temporary input files and command line arguments
+import tempfile
+import pathlib
+import argparse
+
+
+class TestSimulate_Main(unittest.TestCase):
+    """
+    Test the mueller simulation
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+
+        (self.path / "setup.txt").write_text("# Comment\nHWP 22.5\nSMP\nLVP 10\nFLR 0.5\n")
+        # Two physical raman mueller matrices
+        self.matrices = [ np.array([[ 3, 1, 0, 0], [ 1, 3, 0, 0], [0, 0, 2, 0], [0, 0, 0, 1]]) / 4,
+                          np.array([[ 2, 0, 0, 0], [ 0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0]]) / 2 ]
+        (self.path / "matrices.txt").write_text("".join( "! mode " + str(index) + "\n" + "\n".join( " ".join(str(value) for value in row) for row in matrix ) + "\n\n"
+                                                         for index, matrix in enumerate(self.matrices) ))
+        self.lasers = [ np.array([1., 1., 0., 0.]), np.array([1., 0., 1., 0.]), np.array([1., -1., 0., 0.]) ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_simulate(self, lasers, rawOutput = False, outputFormat = "text", laserFiles = [], laserGrids = [], chunksize = None, tracefile = None):
+        cliArgs = argparse.Namespace(inputfile = self.path / "setup.txt", matrixfile = self.path / "matrices.txt", outputfile = self.path / "result.txt",
+                                     logfile = self.path / "simulate.log", comment = "", writeMode = "w", rawOutput = rawOutput, showPrint = False,
+                                     laser = lasers, laserFiles = laserFiles, laserGrids = laserGrids, chunksize = chunksize, verbose = True,
+                                     allowUnpolarisedRamanScattering = False, checkPolicy = "every-step", checkTolerance = 5e-8, outputFormat = outputFormat,
+                                     tracefile = tracefile)
+        simulate.main(cliArgs)
+        if outputFormat in ["npy", "npz"]:
+            return np.load(self.path / "result.txt")
+        return (self.path / "result.txt").read_text()
+
+    def test_output(self):
+        """
+        Make sure the simulation of all lasers and modes at once gives the result of the simulation of every single stokes vector
+        """
+        decoder = SetDec.SetupDecoder()
+        result = self.run_simulate(self.lasers)
+        for laser in self.lasers:
+            self.assertIn("# Simulation Results For Initial State " + str(laser) + ":", result)
+            for index, matrix in enumerate(self.matrices):
+                state = decoder.decode("FLR 0.5") @ decoder.decode("LVP 10") @ matrix @ decoder.decode("HWP 22.5") @ laser
+                self.assertIn("] mode " + str(index), result)
+                np.testing.assert_allclose(self.final_state(result, laser, index), state, atol = 1e-8)
+
+        raw = self.run_simulate(self.lasers, rawOutput = True)
+        self.assertEqual(raw.count("# State.Header"), len(self.lasers))
+        self.assertEqual(raw.count("mode_1"), len(self.lasers))
+
+    def final_state(self, result, laser, index):
+        # Find the final state of the mode in the block of the initial stokes vector
+        block = result.split("# Simulation Results For Initial State " + str(laser) + ":")[1]
+        line = [ line for line in block.splitlines() if line.endswith("] mode " + str(index)) ][0]
+        return np.array( line.split("]")[0].replace("[", "").split(), dtype = float )
+
+    def test_sweep(self):
+        """
+        Make sure the parameter sweep gives the results of the single simulations as tidy table
+        """
+        (self.path / "setup.txt").write_text("HWP 0:45:22.5\nSMP\nLVP 10\nFLR 0.5\n")
+        sweep = self.run_simulate(self.lasers[:2])
+        table = [ line.split() for line in sweep.splitlines() if line[:1].isdigit() ]
+        self.assertIn("# Sweep.1.HWP.1  State.Header", sweep)
+        # One row per point of the sweep, laser and mode
+        self.assertEqual(len(table), 3 * 2 * 2)
+
+        (self.path / "setup.txt").write_text("HWP 22.5\nSMP\nLVP 10\nFLR 0.5\n")
+        single = self.run_simulate(self.lasers[:2])
+        for row in table:
+            if row[0] == "22.5":
+                laser = np.array(row[2:6], dtype = float)
+                np.testing.assert_allclose(np.array(row[6:], dtype = float), self.final_state(single, laser, int(row[1].split("_")[1])), atol = 1e-8)
+
+    def test_formats(self):
+        """
+        Make sure the csv and binary formats contain the same final states as the text format
+        """
+        result = self.run_simulate(self.lasers)
+        final = np.array([[ self.final_state(result, laser, index) for index in range(len(self.matrices)) ] for laser in self.lasers ])
+
+        np.testing.assert_allclose(self.run_simulate(self.lasers, outputFormat = "npy"), final, atol = 1e-8)
+        with self.run_simulate(self.lasers, outputFormat = "npz") as npz:
+            np.testing.assert_allclose(npz["finalStates"], final, atol = 1e-8)
+            np.testing.assert_array_equal(npz["initialStates"], self.lasers)
+            self.assertEqual(list(npz["heads"]), ["mode 0", "mode 1"])
+            self.assertIn("# polaram simulate", str(npz["comment"]))
+
+        # One row per laser and mode after the header comment and the header row
+        lines = self.run_simulate(self.lasers, outputFormat = "csv").splitlines()
+        rows = [ line.split(",") for line in lines if not line.startswith("#") ]
+        self.assertEqual(rows[0][:2], ["State.Header", "Initial.State.S0"])
+        self.assertEqual(len(rows), 1 + len(self.lasers) * len(self.matrices))
+        np.testing.assert_allclose(np.array([ row[5:] for row in rows[1:] ], dtype = float), final.reshape(-1, 4), atol = 1e-8)
+
+        # Parameter sweeps add one column per swept argument
+        (self.path / "setup.txt").write_text("HWP 0:45:22.5\nSMP\nLVP 10\nFLR 0.5\n")
+        rows = [ line.split(",") for line in self.run_simulate(self.lasers, outputFormat = "csv").splitlines() if not line.startswith("#") ]
+        self.assertEqual(rows[0][:2], ["Sweep.1.HWP.1", "State.Header"])
+        self.assertEqual(len(rows), 1 + 3 * len(self.lasers) * len(self.matrices))
+        self.assertEqual(self.run_simulate(self.lasers, outputFormat = "npy").shape, (3, len(self.lasers), len(self.matrices), 4))
+
+    def test_chunks(self):
+        """
+        Make sure laser files and grids give the results of the command line stokes vectors for every chunk size
+        """
+        (self.path / "lasers.txt").write_text("\n".join( " ".join(str(value) for value in laser) for laser in self.lasers ))
+        text  = self.run_simulate(self.lasers)
+        final = self.run_simulate(self.lasers, outputFormat = "npy")
+        for chunksize in [1, 2, None]:
+            files = self.run_simulate(None, laserFiles = [self.path / "lasers.txt"], chunksize = chunksize)
+            self.assertEqual(files.split("\n", 2)[2], text.split("\n", 2)[2])
+            np.testing.assert_array_equal(self.run_simulate(None, outputFormat = "npy", laserFiles = [self.path / "lasers.txt"], chunksize = chunksize), final)
+
+        # Lasers of all sources in the order of the flags: command line, files, grids
+        (self.path / "setup.txt").write_text("HWP 0:45:22.5\nSMP\nLVP 10\n")
+        sweep = self.run_simulate(self.lasers[:1], outputFormat = "npy")
+        with self.run_simulate(self.lasers[:1], outputFormat = "npz", laserFiles = [self.path / "lasers.txt"], laserGrids = ["linear:0:90:45"], chunksize = 2) as npz:
+            self.assertEqual(npz["finalStates"].shape, (3, 1 + 3 + 3, len(self.matrices), 4))
+            np.testing.assert_array_equal(npz["finalStates"][:,:1], sweep)
+            np.testing.assert_allclose(npz["initialStates"][4:], [[1, 1, 0, 0], [1, 0, 1, 0], [1, -1, 0, 0]], atol = 1e-12)
+            np.testing.assert_allclose(npz["finalStates"][:,4:], npz["finalStates"][:,1:4], atol = 1e-12)
+
+        # Invalid laser sources stop the program
+        with self.assertRaises(SystemExit):
+            self.run_simulate(None, laserGrids = ["linear:0"])
+
+    def test_trace(self):
+        """
+        Make sure the trace contains the states after every step of every chunk
+        """
+        final = self.run_simulate(self.lasers, outputFormat = "npy")
+        self.run_simulate(self.lasers, chunksize = 2, tracefile = self.path / "trace.npz")
+        with np.load(self.path / "trace.npz") as trace:
+            # Initial states, HWP, SMP and the folded LVP and FLR
+            self.assertEqual(list(trace["steps"]), ["initial states", "HWP 22.5", "SMP", "LVP 10, FLR 0.5"])
+            self.assertEqual(sorted(trace.files), sorted( "step" + str(step) + ".lasers" + str(start) for step in range(4) for start in [0, 2] ) + ["steps"])
+            np.testing.assert_array_equal(trace["step0.lasers2"][0,:,0], [self.lasers[2]])
+            np.testing.assert_allclose(np.concatenate([ trace["step3.lasers0"][0], trace["step3.lasers2"][0] ]), final)
+
+    def test_exception(self):
+        """
+        Make sure unpolarised light before the SMP instruction raises an exception
+        """
+        with self.assertLogs(Simulation.log, level = "ERROR") as logs:
+            self.assertRaises(ValueError, self.run_simulate, [ np.array([1., 1., 0., 0.]), np.array([1., 0.5, 0., 0.]) ])
+        # The first invalid state is reported
+        self.assertIn("[1.  0.5 0.  0. ]", logs.output[0])
+        self.assertIn("'mode 0'", logs.output[0])
+
+if __name__ == '__main__':
+    unittest.main()
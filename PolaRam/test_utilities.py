@@ -15,6 +15,12 @@ import utilities as util
 
 # Handling files
 import pathlib
+import tempfile
+
+# Command line interface and output of the version action
+import argparse
+import io
+import contextlib
 
 # math stuff
 import numpy as np
@@ -108,6 +114,125 @@ class TestUtilities_ConvertTextToMatrices(unittest.TestCase):
             self.assertEqual(matrix["head"], correctoutput[index]["head"])
             self.assertEqual(matrix["matrix"].any(), correctoutput[index]["matrix"].any())
 
+class TestUtilities_ConvertTextToArray(unittest.TestCase):
+    """
+    Test utilities.convertTextToArray() and the fast parser of convertTextToMatrices()
+    """
+
+    def setUp(self):
+        self.matrices = np.random.default_rng(1).normal(size = (50, 4, 4))
+        self.text = "# Comment\n   # indented comment\n" + "".join( "\n! v_" + str(index) + " = 100/cm\n" + "\n".join( " ".join(map(str, row)) for row in matrix ) + "\n"
+                                                                   for index, matrix in enumerate(self.matrices) )
+
+    def test_output(self):
+        """
+        Make sure all matrices are read into one array and match the list of convertTextToMatrices()
+        """
+        heads, matrices = util.convertTextToArray(self.text, (4,4))
+        self.assertEqual(heads, [ "v_" + str(index) + " = 100/cm" for index in range(50) ])
+        np.testing.assert_array_equal(matrices, self.matrices)
+        matrixlist = util.convertTextToMatrices(self.text, (4,4))
+        self.assertEqual([ matrix["head"] for matrix in matrixlist ], heads)
+        np.testing.assert_array_equal([ matrix["matrix"] for matrix in matrixlist ], self.matrices)
+
+        # Without shape all matrices need the shape of the first matrix
+        self.assertEqual(util.convertTextToArray(self.text)[1].shape, (50, 4, 4))
+        self.assertEqual(util.convertTextToArray("# nothing")[1].shape, (0, 0, 0))
+        self.assertEqual(util.convertTextToArray("", (4,4))[1].shape, (0, 4, 4))
+
+    def test_errors(self):
+        """
+        Make sure wrong shapes, rows of different length and entries that are no numbers raise the exceptions of convertTextToMatrices()
+        """
+        mixed = self.text + "\n! v_50\n1 2 3\n4 5 6\n"
+        with self.assertRaisesRegex(IndexError, "The shape \\(2, 3\\) does not"):
+            util.convertTextToArray(mixed, (4,4))
+        self.assertRaises(IndexError, util.convertTextToArray, mixed)
+        self.assertEqual(util.convertTextToMatrices(mixed)[50]["matrix"].shape, (2, 3))
+        with self.assertRaisesRegex(IndexError, "The shape \\(0,\\) does not"):
+            util.convertTextToArray("!empty\n", (4,4))
+
+        for text in [ self.text + "! v_50\n1 2\n3\n", self.text + "! v_50\n1 2\n\n3 4", self.text.replace("v_3 = 100/cm\n", "v_3 = 100/cm\nx ") ]:
+            with self.assertLogs(util.log, level = "CRITICAL"):
+                self.assertRaises(ValueError, util.convertTextToArray, text)
+            with self.assertLogs(util.log, level = "CRITICAL"):
+                self.assertRaises(ValueError, util.convertTextToMatrices, text)
+
+        # Malformed entries are rejected everywhere in the file. numpy < 2 stops reading at them and only warns.
+        for entry in ["4x", "4.5.5", "1e5e", "0x10", "1,5"]:
+            for text in [ "! a\n1 2\n3 " + entry, "! a\n" + entry + " 2\n3 4\n", self.text + "! v_50\n1 2\n3 " + entry + "\n" ]:
+                with self.assertLogs(util.log, level = "CRITICAL"):
+                    self.assertRaises(ValueError, util.convertTextToArray, text)
+        np.testing.assert_array_equal(util.convertTextToArray("! a\ninf -Infinity\nnan 1e-3")[1][0,:,:1], [[np.inf], [np.nan]])
+
+        self.assertRaises(TypeError, util.convertTextToArray, 1)
+        self.assertRaises(TypeError, util.convertTextToArray, self.text, (4, 4, 4))
+
+class TestUtilities_MatrixStore(unittest.TestCase):
+    """
+    Test utilities.writeMatrixStore(), utilities.readMatrixStore() and the matrix stores read by readFileAsArray() and readFileAsMatrices()
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.directory.name)
+        self.heads = [ "v_" + str(index) for index in range(20) ]
+        self.matrices = np.random.default_rng(2).normal(size = (20, 3, 3))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_output(self):
+        """
+        Make sure the stored matrices are memory mapped, read-only and equal to the written ones
+        """
+        util.writeMatrixStore(self.path / "tensors.pmat", self.heads, self.matrices)
+        self.assertTrue(util.isMatrixStore(self.path / "tensors.pmat"))
+        self.assertFalse(util.isMatrixStore(self.path / "missing.pmat"))
+
+        heads, matrices = util.readMatrixStore(self.path / "tensors.pmat")
+        self.assertEqual(heads, self.heads)
+        self.assertIsInstance(matrices, np.memmap)
+        self.assertFalse(matrices.flags.writeable)
+        self.assertEqual(matrices.offset % util.MATRIX_STORE_ALIGNMENT, 0)
+        np.testing.assert_array_equal(matrices, self.matrices)
+
+        # The file readers recognise the store
+        heads, matrices = util.readFileAsArray(self.path / "tensors.pmat", (3,3))
+        np.testing.assert_array_equal(matrices, self.matrices)
+        matrixlist = util.readFileAsMatrices(self.path / "tensors.pmat", (3,3))
+        self.assertEqual([ matrix["head"] for matrix in matrixlist ], self.heads)
+        np.testing.assert_array_equal(matrixlist[5]["matrix"], self.matrices[5])
+        with self.assertRaisesRegex(IndexError, "The shape \\(3, 3\\) does not"):
+            util.readFileAsArray(self.path / "tensors.pmat", (4,4))
+
+        # Empty stores can't be memory mapped
+        util.writeMatrixStore(self.path / "empty.pmat", [], np.zeros((0, 4, 4)))
+        self.assertEqual(util.readMatrixStore(self.path / "empty.pmat")[1].shape, (0, 4, 4))
+
+    def test_errors(self):
+        """
+        Make sure wrong arrays can't be stored and broken stores are rejected
+        """
+        self.assertRaises(ValueError, util.writeMatrixStore, self.path / "wrong.pmat", self.heads, self.matrices[0])
+        self.assertRaises(ValueError, util.writeMatrixStore, self.path / "wrong.pmat", self.heads[1:], self.matrices)
+        self.assertEqual(list(self.path.iterdir()), [])
+
+        (self.path / "text.txt").write_text("! v_1\n1 0\n0 1\n")
+        self.assertRaisesRegex(ValueError, "no matrix store", util.readMatrixStore, self.path / "text.txt")
+
+        util.writeMatrixStore(self.path / "tensors.pmat", self.heads, self.matrices)
+        data = (self.path / "tensors.pmat").read_bytes()
+        (self.path / "truncated.pmat").write_bytes(data[:-8])
+        self.assertRaisesRegex(ValueError, "truncated", util.readMatrixStore, self.path / "truncated.pmat")
+        (self.path / "version.pmat").write_bytes(data.replace(b'"version": 1', b'"version": 9'))
+        self.assertRaisesRegex(ValueError, "version 9", util.readMatrixStore, self.path / "version.pmat")
+        (self.path / "broken.pmat").write_bytes(data.replace(b'"heads"', b'"h\x00ads"'))
+        self.assertRaisesRegex(ValueError, "broken", util.readMatrixStore, self.path / "broken.pmat")
+        # The readers of the scripts terminate the program
+        with self.assertLogs(util.log, level = "CRITICAL"):
+            self.assertRaises(SystemExit, util.readFileAsArray, self.path / "truncated.pmat")
+
 class TestUtilities_FindEntries(unittest.TestCase):
     """
     Test utilities.findEntries()
@@ -225,3 +350,36 @@ class TestUtilities_BuildRamanMuellerMatrix(unittest.TestCase):
                         correct_output = correct_matrix(xx, xy, yx, yy)
 
                         np.testing.assert_array_almost_equal(test_output, correct_output)
+
+    def test_stack(self):
+        """
+        Make sure stacks of raman tensors are converted like single raman tensors
+        """
+        # Stack of random raman tensors with two leading axes
+        tensors = np.random.default_rng(0).normal(size = (5, 2, 3, 3))
+
+        test_output = util.buildRamanMuellerMatrix(tensors)
+
+        # Check shape and compare every element of the stack with the conversion of a single tensor
+        self.assertEqual(test_output.shape, (5, 2, 4, 4))
+        for index in np.ndindex(5, 2):
+            np.testing.assert_array_almost_equal(test_output[index], util.buildRamanMuellerMatrix(tensors[index]))
+
+class TestUtilities_GitVersion(unittest.TestCase):
+    """
+    Test the argparse action printing the version
+    """
+
+    def test_output(self):
+        """
+        Make sure the version is only read, if the flag is given, and the program exits afterwards
+        """
+        parser = argparse.ArgumentParser(prog = "polaram")
+        parser.add_argument("--version", "-v", action = util.gitVersion)
+        self.assertFalse(hasattr(parser.parse_args([]), "version"))
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertRaises(SystemExit, parser.parse_args, ["-v"])
+        self.assertEqual(output.getvalue(), "polaram " + util.version() + "\n")
+        self.assertTrue(type(util.version()) is str and util.version() != "")
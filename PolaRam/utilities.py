@@ -20,11 +20,31 @@ import logging
 # Used for raising argparse.ArgumentTypeError
 import argparse
 
+# Turn the warnings of numpy.fromstring about unread text into exceptions
+import warnings
+
+# Header and atomic replacement of matrix stores
+import json
+import os
+
 # Enables logging with the logging module
 log = logging.getLogger(__name__)
 # Tells the logging module to ignore all logging message, if a program using this library does not use the logging module.
 log.addHandler(logging.NullHandler())
 
+#
+#   MAKROS
+#
+
+# First bytes of a matrix store written by writeMatrixStore()
+MATRIX_STORE_MAGIC = b"POLARAM MATRIX STORE\n"
+# Format of the matrix stores. Stores of other versions are rejected.
+MATRIX_STORE_VERSION = 1
+# Default suffix of the matrix stores written by 'polaram pack'
+MATRIX_STORE_SUFFIX = ".pmat"
+# The matrices start at a multiple of this number of bytes
+MATRIX_STORE_ALIGNMENT = 64
+
 #
 #   UTILITIES: Defines functions used by the other python scripts
 #
@@ -60,6 +80,184 @@ def readFileAsText(path):
         log.exception(sys.exc_info()[0])
         raise
 
+def __checkMatrixArguments(function, string, shape):
+    """
+    Makes sure the arguments of convertTextToMatrices() and convertTextToArray() have the right types.
+    Should not be called outside of utilities.py!
+    Raises TypeError
+    """
+    # Make sure string is a string
+    if not isinstance(string, str):
+        log.critical("FATAL ERROR: " + function + " expects a string as argument! Type '" + str(type(string)) + "' was passed.")
+        raise TypeError("Function " + function + " expects a string as argument!")
+
+    # Make sure shape is a tuple of two integers or the default value None.
+    if shape != None:
+        if ( not isinstance(shape, tuple) or len(shape) != 2 or not all(type(elem) is int for elem in shape) ):
+            log.critical("FATAL ERROR: " + function + " expects a tuple of two positive integers as argument! " + str(shape) + " was passed.")
+            raise TypeError("FATAL ERROR: " + function + " expects a tuple of two positive integers as argument! " + str(shape) + " was passed.")
+
+def __parseMatricesByRow(matrixlist):
+    """
+    Converts the matrices matrix by matrix and row by row. Slow, but numpy raises the exceptions for rows of different length and
+    entries that are no numbers. Used by __parseMatrices() for files the fast path can't read.
+    Should not be called outside of utilities.py!
+    Attributes:
+    matrixlist - list of tuples (head, text of the rows)
+    Returns list of dictionaries with matrices and descriptive headers
+    """
+    try:
+        return [ { "head": head,
+                   "matrix": np.array([ row.split() for row in body.split("\n") ] if body != "" else []).astype(float)
+                 } for head, body in matrixlist ]
+    except:
+        # Log unexpected exceptions
+        log.critical("FATAL ERROR: Raman matrices can't be read from file. Is the file format correct?")
+        log.exception(sys.exc_info()[0])
+        raise
+
+def __removeComments(string):
+    """
+    Removes the lines starting with '#' (after white space) from the text of a matrix file. Only the lines containing '#' are looked
+    at, so the rows of the matrices are never split into lines.
+    Should not be called outside of utilities.py!
+    Attributes:
+    string - text of the matrix file
+    Returns the text without comment lines
+    """
+    pieces = []
+    copied = search = 0
+    while True:
+        index = string.find("#", search)
+        if index == -1:
+            break
+        lineStart = string.rfind("\n", 0, index) + 1
+        lineEnd   = string.find("\n", index)
+        lineEnd   = len(string) if lineEnd == -1 else lineEnd + 1
+        if string[lineStart:index].strip() == "":
+            pieces.append(string[copied:lineStart])
+            copied = lineEnd
+        search = lineEnd
+    pieces.append(string[copied:])
+    return "".join(pieces)
+
+# Characters of the entries of matrix files read by __parseMatrices(): white space, digits, signs, points, exponents, inf and nan
+__NUMBER_CHARACTERS = np.zeros(256, dtype = bool)
+__NUMBER_CHARACTERS[np.frombuffer(b" \t\n\r\v\f0123456789+-.eEinfatyINFATY", dtype = np.uint8)] = True
+
+def __parseMatrices(string):
+    """
+    Converts the text of a matrix file into the headers and the entries of all matrices. The entries of all matrices are converted in
+    one call of numpy instead of matrix by matrix and row by row. The rows and columns of every matrix are counted in the bytes of the
+    text without splitting the rows.
+    Files with rows of different length or entries that are no numbers are converted by __parseMatricesByRow(), which raises the
+    exceptions.
+    Should not be called outside of utilities.py!
+    Attributes:
+    string - text of the matrix file. See convertTextToMatrices().
+    Returns tuple (heads, values, rows, columns) with
+        heads   - list of the headers
+        values  - numpy.ndarray with the entries of all matrices in the order of the file, row by row
+        rows    - numpy.ndarray with the number of rows of every matrix
+        columns - numpy.ndarray with the number of columns of every matrix (0 for matrices without rows)
+    or the list of dictionaries of __parseMatricesByRow(), if the fast path failed
+    """
+    # Remove comments from string
+    # Comments are lines starting with '#'
+    if "#" in string:
+        string = __removeComments(string)
+
+    # Split file in seperate matrices and remove empty lines
+    # Matrices start with '!'. The first line is the header, the other lines are the rows.
+    matrixlist = [ matrix.strip().partition("\n")[::2] for matrix in string.split("!") ]
+    matrixlist = [ (head, body) for head, body in matrixlist if head != "" ]
+    heads  = [ head for head, _ in matrixlist ]
+    if len(matrixlist) == 0:
+        return heads, np.zeros(0), np.zeros(0, dtype = int), np.zeros(0, dtype = int)
+    text   = "\n".join( body for _, body in matrixlist )
+    # Every matrix takes at least one line of the text. Matrices without rows take an empty line.
+    lines  = np.fromiter(( body.count("\n") + 1 for _, body in matrixlist ), dtype = int, count = len(matrixlist))
+    rows   = lines * np.fromiter(( body != "" for _, body in matrixlist ), dtype = bool, count = len(matrixlist))
+
+    # Count the numbers in every line: a number starts at a character that is no white space following a white space
+    # Every line ends with a line break, so every line contains at least one character
+    data    = np.frombuffer((text + "\n").encode(), dtype = np.uint8)
+    space   = (data == 32) | ((data >= 9) & (data <= 13))
+    starts  = ~space
+    starts[1:] &= space[:-1]
+    lineStarts = np.concatenate([ [0], np.flatnonzero(data == 10)[:-1] + 1 ])
+    columns = np.add.reduceat(starts, lineStarts, dtype = int)
+    # All rows of a matrix need the same number of columns
+    matrixStarts = np.concatenate([ [0], np.cumsum(lines)[:-1] ])
+    if np.any(np.minimum.reduceat(columns, matrixStarts) != np.maximum.reduceat(columns, matrixStarts)):
+        return __parseMatricesByRow(matrixlist)
+    columns = columns[matrixStarts]
+
+    # Entries with other characters than those of decimal numbers, inf and nan (e.g. hexadecimal numbers) are read by the slow path
+    if not np.all(__NUMBER_CHARACTERS[data]):
+        return __parseMatricesByRow(matrixlist)
+
+    # Convert all numbers at once
+    # numpy < 2 stops at the first entry that is no number and only warns, so the warning is raised as exception
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            values = np.fromstring(text, dtype = float, sep = " ")
+    except (ValueError, DeprecationWarning):
+        values = None
+    if values is None or len(values) != np.sum(rows * columns):
+        return __parseMatricesByRow(matrixlist)
+
+    return heads, values, rows, columns
+
+def __matrixShape(rows, columns):
+    """
+    Returns the numpy shape of a matrix read by __parseMatrices(): (rows, columns) or (0,) for matrices without rows.
+    Should not be called outside of utilities.py!
+    """
+    return (int(rows), int(columns)) if rows > 0 else (0,)
+
+def convertTextToArray(string, shape = None):
+    """
+    Converts a matrix file into a list of headers and one numpy array containing all matrices. The entries of all matrices are
+    converted at once, so files with millions of matrices are read in seconds. The syntax of the text is described in
+    convertTextToMatrices(). All matrices must have the same shape.
+
+    Arguments:
+    string - string that will be converted into matrices. The expected format is described in README.md.
+    shape  - a integer tuple specifing the expected np.ndarray.shape of the matrices. If none is given, all matrices must have the
+             shape of the first matrix.
+
+    Returns: tuple (heads, matrices) with the list of descriptive headers and the numpy.ndarray of shape (matrices, rows, columns)
+    """
+    __checkMatrixArguments("convertTextToArray", string, shape)
+
+    result = __parseMatrices(string)
+    if isinstance(result, list):
+        # Matrices read by the slow path
+        heads   = [ matrix["head"] for matrix in result ]
+        values  = np.concatenate([ matrix["matrix"].ravel() for matrix in result ]) if len(result) > 0 else np.zeros(0)
+        rows    = np.array([ len(matrix["matrix"]) for matrix in result ], dtype = int)
+        columns = np.array([ matrix["matrix"].shape[1] if matrix["matrix"].ndim == 2 else 0 for matrix in result ], dtype = int)
+    else:
+        heads, values, rows, columns = result
+
+    # Check the shape of every matrix
+    if len(heads) == 0:
+        return heads, values.reshape((0,) + (shape if shape != None else (0, 0)))
+    if shape == None:
+        shape = __matrixShape(rows[0], columns[0])
+    # Matrices without rows have the shape (0,)
+    if len(shape) == 2:
+        wrong = (rows != shape[0]) | (columns != shape[1]) | (rows == 0)
+    else:
+        wrong = rows != 0
+    if np.any(wrong):
+        index = np.argmax(wrong)
+        raise IndexError("Polaram expected matrices of shape " + str(shape) + "! The shape " + str(__matrixShape(rows[index], columns[index])) + " does not meet the expectations.")
+
+    return heads, values.reshape((len(heads),) + shape)
+
 def convertTextToMatrices(string, shape = None):
     """
     Converting a string into a list of dictionaries. Each dictionary contains a matrix and a head.
@@ -69,9 +267,9 @@ def convertTextToMatrices(string, shape = None):
     2. Lines starting with ! mark the beginning of a header, every header marks the beginning of a matrix
     3. The lines following the header define the headers matrix
     4. Matrix rows are seperated by a linebreak and columns by a white space
-    If the matrix has more than 3 rows, will the function ignore all rows except the first three. If the matrix has to few, an exception will be raised.
     An exception will be raised for a wrong number of columns and rows. The number of expected columns and rows can be defined with the shape argument.
     If no shape is sepcified, there will be no check.
+    Use convertTextToArray() to get all matrices as one numpy array.
 
     Arguments:
     string - string that will be converted into matrices. The expected format is described in README.md.
@@ -79,36 +277,22 @@ def convertTextToMatrices(string, shape = None):
 
     Returns: list of dictionary with matrices and descriptive headers
     """
-    # Make sure string is a string
-    if not isinstance(string, str):
-        log.critical("FATAL ERROR: convertTextToMatrices expects a string as argument! Type'" + type(string) + "' was passed.")
-        raise TypeError("Function convertTextToMatrices expects a string as argument!")
-
-    # Make sure shape is a tuple of two integers or the default value None.
-    if shape != None:
-        if ( not isinstance(shape, tuple) or len(shape) != 2 or not all(type(elem) is int for elem in shape) ):
-            log.critical("FATAL ERROR: convertTextToMatrices expects a tuple of two positive integers as argument! " + str(shape) + " was passed.")
-            raise TypeError("FATAL ERROR: convertTextToMatrices expects a tuple of two positive integers as argument! " + str(shape) + " was passed.")
-
-    # Convert matrix file to list of matrices with descritive messages
-    try:
-        # Remove comments from string
-        # Comments start with '#'
-        string = "\n".join( [ line for line in string.splitlines() if line.strip().find("#") != 0 ] )
-        # Split file in seperate matrices and remove empty lines
-        # Matrices start with '!'
-        matrixlist = [matrix.strip().split("\n") for matrix in string.split("!") if matrix.strip() != ""]
-        # Build a list of dictionaries
-        # Each dictionary contains a head with a descriptive message extracted from the file and a matrix extracted from the file
-        matrixlist = [ { "head": matrix.pop(0),
-                         "matrix": np.array([ row.split() for row in matrix ]).astype(np.float)
-                       } for matrix in matrixlist ]
-
-    except:
-        # Log unexpected exceptions
-        log.critical("FATAL ERROR: Raman matrices can't be read from file. Is the file format correct?")
-        log.exception(sys.exc_info()[0])
-        raise
+    __checkMatrixArguments("convertTextToMatrices", string, shape)
+
+    result = __parseMatrices(string)
+    if isinstance(result, list):
+        matrixlist = result
+    elif len(result[0]) > 0 and np.all(result[2] == result[2][0]) and np.all(result[3] == result[3][0]):
+        # All matrices have the same shape: every matrix is a view of one array
+        heads, values, rows, columns = result
+        matrices = values.reshape((len(heads),) + __matrixShape(rows[0], columns[0]))
+        matrixlist = [ { "head": head, "matrix": matrix } for head, matrix in zip(heads, matrices) ]
+    else:
+        # Cut the entries into the matrices
+        heads, values, rows, columns = result
+        ends = np.cumsum(rows * columns).tolist()
+        matrixlist = [ { "head": head, "matrix": values[end-row*column:end].reshape(__matrixShape(row, column)) }
+                       for head, row, column, end in zip(heads, rows.tolist(), columns.tolist(), ends) ]
 
     # Check shape of result, if a control variable was passed to the function
     if shape != None:
@@ -122,43 +306,170 @@ def convertTextToMatrices(string, shape = None):
 
 def readFileAsMatrices(path, *args):
     """
-    Shorthand for convertTextToMatrices(readFileAsText)
+    Shorthand for convertTextToMatrices(readFileAsText). Matrix stores written by 'polaram pack' are memory mapped instead.
     Attributes:
     path - pathlib.Path object pointing to the file that will be read
     args - a list of arguments, that will be passed on to convertTextToMatrices
     """
+    if isMatrixStore(path):
+        heads, matrices = __readStore(path, *args)
+        return [ { "head": head, "matrix": matrix } for head, matrix in zip(heads, matrices) ]
     text = readFileAsText(path)
     return convertTextToMatrices(text, *args)
 
+def readFileAsArray(path, *args):
+    """
+    Shorthand for convertTextToArray(readFileAsText). Matrix stores written by 'polaram pack' are memory mapped instead.
+    Attributes:
+    path - pathlib.Path object pointing to the file that will be read
+    args - a list of arguments, that will be passed on to convertTextToArray
+    Returns tuple (heads, matrices)
+    """
+    if isMatrixStore(path):
+        return __readStore(path, *args)
+    text = readFileAsText(path)
+    return convertTextToArray(text, *args)
+
+def __readStore(path, shape = None):
+    """
+    Reads a matrix store like readFileAsArray() reads a text file: the shape of the matrices is checked and the program is terminated,
+    if the store is broken.
+    Should not be called outside of utilities.py!
+    """
+    try:
+        heads, matrices = readMatrixStore(path)
+    except ValueError as e:
+        log.critical("FATAL ERROR: The matrix store '" + str(path.resolve()) + "' can't be read: " + str(e))
+        sys.exit(-1)
+    if shape != None and matrices.shape[1:] != shape:
+        raise IndexError("Polaram expected matrices of shape " + str(shape) + "! The shape " + str(matrices.shape[1:]) + " does not meet the expectations.")
+    return heads, matrices
+
+def isMatrixStore(path):
+    """
+    Checks if a file is a matrix store written by writeMatrixStore().
+    Arguments:
+    path - pathlib.Path object pointing to the file
+    Returns: True, if the file starts with MATRIX_STORE_MAGIC. False, if not or if the file can't be read.
+    """
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(MATRIX_STORE_MAGIC)) == MATRIX_STORE_MAGIC
+    except OSError:
+        return False
+
+def writeMatrixStore(path, heads, matrices):
+    """
+    Writes matrices into a binary matrix store, that can be memory mapped by readMatrixStore(). The store contains:
+    1. MATRIX_STORE_MAGIC
+    2. the offset of the matrices in bytes: 8 byte unsigned integer (little endian)
+    3. a json object with the version of the format, the data type, the shape of the matrix array and the list of headers. It is
+       padded with spaces, so the matrices start at a multiple of MATRIX_STORE_ALIGNMENT bytes.
+    4. all matrices as one contiguous C-ordered array of little endian 64 bit floats
+    The store is written into a temporary file and moved to path, so programs reading the old store are not disturbed.
+
+    Arguments:
+    path     - pathlib.Path object pointing to the store
+    heads    - list of descriptive headers, one per matrix
+    matrices - array-like of shape (matrices, rows, columns)
+    """
+    path = pathlib.Path(path)
+    matrices = np.ascontiguousarray(matrices, dtype = "<f8")
+    heads = [ str(head) for head in heads ]
+    if matrices.ndim != 3:
+        raise ValueError("A matrix store contains an array of shape (matrices, rows, columns)! The shape " + str(matrices.shape) + " can't be stored.")
+    if len(heads) != len(matrices):
+        raise ValueError("The number of headers does not match the number of matrices!")
+
+    header = json.dumps({ "version": MATRIX_STORE_VERSION, "dtype": "<f8", "shape": list(matrices.shape), "heads": heads }).encode()
+    offset = len(MATRIX_STORE_MAGIC) + 8 + len(header)
+    offset += -offset % MATRIX_STORE_ALIGNMENT
+
+    temporary = path.with_name("." + path.name + ".tmp")
+    try:
+        with open(temporary, "wb") as file:
+            file.write(MATRIX_STORE_MAGIC)
+            file.write(offset.to_bytes(8, "little"))
+            file.write(header.ljust(offset - len(MATRIX_STORE_MAGIC) - 8))
+            matrices.tofile(file)
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok = True)
+        raise
+
+def readMatrixStore(path):
+    """
+    Opens a matrix store written by writeMatrixStore(). The matrices are memory mapped and not read into memory: opening the store
+    takes the same time for every number of matrices and parallel programs share the matrices in the page cache of the operating system.
+    Only the list of headers is read.
+
+    Arguments:
+    path - pathlib.Path object pointing to the store
+
+    Returns: tuple (heads, matrices) with the list of descriptive headers and a read-only numpy.memmap of shape (matrices, rows, columns)
+    Raises ValueError, if the file is no matrix store, has an unknown version or is truncated
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MATRIX_STORE_MAGIC)) != MATRIX_STORE_MAGIC:
+            raise ValueError("The file is no matrix store written by 'polaram pack'!")
+        offset = int.from_bytes(file.read(8), "little")
+        try:
+            header = json.loads(file.read(offset - len(MATRIX_STORE_MAGIC) - 8))
+            version, dtype, shape, heads = header["version"], np.dtype(header["dtype"]), tuple(header["shape"]), header["heads"]
+        except (ValueError, TypeError, KeyError):
+            raise ValueError("The header of the matrix store is broken!")
+        size = os.fstat(file.fileno()).st_size
+
+    if version != MATRIX_STORE_VERSION:
+        raise ValueError("The matrix store has the version " + str(version) + ", but polaram reads version " + str(MATRIX_STORE_VERSION) + "!")
+    if len(shape) != 3 or len(heads) != shape[0]:
+        raise ValueError("The header of the matrix store is broken!")
+    if size < offset + int(np.prod(shape)) * dtype.itemsize:
+        raise ValueError("The matrix store is truncated!")
+
+    # Empty files and arrays can't be memory mapped
+    if np.prod(shape) == 0:
+        return heads, np.zeros(shape, dtype = dtype)
+    return heads, np.memmap(path, dtype = dtype, mode = "r", offset = offset, shape = shape)
+
 def buildRamanMuellerMatrix(ramanTensor: np.ndarray):
     """
     This function builds the mueller matrix for a given raman tensor. Details for the conversion are given in the README
     and the seperate pdf-file ramanMuellerMatrix.pdf. This conversion does only work for fully polarised light with no
     circular polarised component.
+    The function also accepts stacks of raman tensors (numpy.ndarray of shape (...,3,3)) and converts all of them at once.
     Attribures:
-    ramanTensor - raman tensor (3x3 numpy.ndarray) that will be translated into a mueller matrix
-    Returns: Mueller matrix as 4x4 numpy.ndarray
+    ramanTensor - raman tensor (3x3 numpy.ndarray) or stack of raman tensors (...x3x3 numpy.ndarray) that will be translated into mueller matrices
+    Returns: Mueller matrix as 4x4 numpy.ndarray or stack of mueller matrices as ...x4x4 numpy.ndarray
     """
 
     # Check type of input
     if not isinstance(ramanTensor, np.ndarray):
         raise TypeError("utilities.buildRamanMuellerMatrix expects a numpy.ndarray as input!")
-    if ramanTensor.shape != (3,3):
+    if ramanTensor.shape[-2:] != (3,3):
         raise TypeError("utilities.buildRamanMuellerMatrix expects a 3x3 numpy.ndarray as input!")
 
     # Extract elements from raman tensor
-    xx = ramanTensor[0,0]
-    xy = ramanTensor[0,1]
-    yx = ramanTensor[1,0]
-    yy = ramanTensor[1,1]
+    # The ellipsis keeps all leading axes, so stacks of tensors are converted element-wise
+    xx = ramanTensor[...,0,0]
+    xy = ramanTensor[...,0,1]
+    yx = ramanTensor[...,1,0]
+    yy = ramanTensor[...,1,1]
 
     # Build new matrix
     # The conversion is described in ramanMuellerMatrix.pdf
     # This conversion does only work for fully polarised light with no circular polarised component
-    muellerMatrix = np.array([  [ (xx**2 + yx**2 + xy**2 + yy**2)/2 , (xx**2 + yx**2 - xy**2 - yy**2)/2 , xy*xx + yx*yy , 0 ],
-                                [ (xx**2 - yx**2 + xy**2 - yy**2)/2 , (xx**2 - yx**2 - xy**2 + yy**2)/2 , xy*xx - yx*yy , 0 ],
-                                [  xx*yx + xy*yy                    ,  xx*yx - xy*yy                    , xx*yy + xy*yx , 0 ],
-                                [  0                                ,  0                                , 0             , 0 ]    ])
+    # The last row and column stay zero
+    muellerMatrix = np.zeros(ramanTensor.shape[:-2] + (4,4))
+    muellerMatrix[...,0,0] = (xx**2 + yx**2 + xy**2 + yy**2)/2
+    muellerMatrix[...,0,1] = (xx**2 + yx**2 - xy**2 - yy**2)/2
+    muellerMatrix[...,0,2] =  xy*xx + yx*yy
+    muellerMatrix[...,1,0] = (xx**2 - yx**2 + xy**2 - yy**2)/2
+    muellerMatrix[...,1,1] = (xx**2 - yx**2 - xy**2 + yy**2)/2
+    muellerMatrix[...,1,2] =  xy*xx - yx*yy
+    muellerMatrix[...,2,0] =  xx*yx + xy*yy
+    muellerMatrix[...,2,1] =  xx*yx - xy*yy
+    muellerMatrix[...,2,2] =  xx*yy + xy*yx
 
     return muellerMatrix
 
@@ -198,7 +509,14 @@ def findEntries(string: str, keyword: str, lines: int = 1, returnKeyword: bool =
 
         try:
             # Slice found entry and yield it
-            yield [line.strip() for line in string[entryStart:].splitlines()[:lines] ]
+            # Only the requested lines are cut out, splitting the whole rest of the string for every entry would be very slow for large strings
+            entryEnd = entryStart
+            for _ in range(lines):
+                entryEnd = string.find("\n", entryEnd) + 1
+                if entryEnd == 0:
+                    entryEnd = len(string)
+                    break
+            yield [line.strip() for line in string[entryStart:entryEnd].splitlines()[:lines] ]
 
         except IndexError as e:
             # The string does not contain as much lines as it was requested at function call.
@@ -223,6 +541,39 @@ def positiveInt(string):
 
     return value
 
+def positiveFloat(string):
+    """
+    ARGPARSE TYPE: Used by argparse. DO NOT USE try-except-statements, because argparse can't detect errors if exceptions will be handled by the function itself.
+    Type checking function for cli. Converts string given by cli to float and raises Exception if it is not greater than zero.
+    Attribute:
+    string - string to convert to positive float
+    Returns positive float
+    """
+    value = float(string)
+
+    if not value > 0:
+        raise argparse.ArgumentTypeError("%s is no positive number" % value)
+
+    return value
+
+def shard(string):
+    """
+    ARGPARSE TYPE: Used by argparse. DO NOT USE try-except-statements, because argparse can't detect errors if exceptions will be handled by the function itself.
+    Type checking function for cli. Converts string 'K/N' given by cli to the tuple (K, N) and raises Exception if not 1 <= K <= N.
+    Attribute:
+    string - string to convert to a shard index and shard count
+    Returns tuple of two positive integers
+    """
+    if string.count("/") != 1:
+        raise argparse.ArgumentTypeError("%s is no shard. Expected K/N" % string)
+
+    index, count = [ int(value) for value in string.split("/") ]
+
+    if index < 1 or index > count:
+        raise argparse.ArgumentTypeError("%s is no shard. Expected K/N with 1 <= K <= N" % string)
+
+    return index, count
+
 def filepath(string):
     """
     ARGPARSE TYPE: Used by argparse. DO NOT USE try-except-statements, because argparse can't detect errors if exceptions will be handled by the function itself.
@@ -242,6 +593,33 @@ class joinString(argparse.Action):
     def __call__(self, parser, args, values, option_string=None):
         setattr(args, self.dest, ' '.join(values))
 
+def version():
+    """
+    Reads the version of PolaRam with 'git describe --tags' from the git repository containing this file. GitPython is imported by this
+    function and not at the start of the program, because importing it and calling git slows down every call of polaram.
+    Returns string with the version or 'unknown version', if PolaRam is not in a git repository or GitPython is not installed
+    """
+    try:
+        from git import Repo
+        # Execute "git describe --tags" in the folder of the currently running file
+        return Repo( str(pathlib.Path(__file__).parent), search_parent_directories = True ).git.execute(["git", "describe", "--tags"])
+    except Exception as e:
+        log.warning("Can't read the version from git: " + repr(e))
+        return "unknown version"
+
+class gitVersion(argparse.Action):
+    """
+    ARGPARSE ACTION: Used by argparse.
+    Prints the version of the program (see version()) and exits like the argparse action 'version'. The version is only read from git,
+    if the flag is given.
+    """
+    def __init__(self, option_strings, dest = argparse.SUPPRESS, default = argparse.SUPPRESS, help = "show program's version number and exit"):
+        argparse.Action.__init__(self, option_strings = option_strings, dest = dest, default = default, nargs = 0, help = help)
+
+    def __call__(self, parser, args, values, option_string = None):
+        print(parser.prog + " " + version())
+        parser.exit()
+
 class stokesvectorlist(argparse.Action):
     """
     ARGPARSE ACTION: Used by argparse. DO NOT USE try-except-statements, because argparse can't detect errors if exceptions will be handled by the function itself.